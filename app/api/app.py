@@ -1,19 +1,90 @@
 import json
 import logging
+from contextlib import asynccontextmanager
 from typing import Dict, List, Any, Optional, Union
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 from sse_starlette.sse import EventSourceResponse
 import asyncio
 from typing import AsyncGenerator, Dict, List, Any
 
+from app.config import (
+    RAG_ATTACH_INDEX,
+    RAG_LOCAL_PATHS,
+    RAG_URLS,
+    RAG_WARMUP,
+    RAG_WARMUP_LLM,
+)
+from app.telemetry import registry
+from app.workflow import RAGWorkflow
+
+logger = logging.getLogger(__name__)
+
+_workflow: Optional[RAGWorkflow] = None
+_workflow_lock = asyncio.Lock()
+# Readiness: "starting" until the workflow is built (and warmed up), then
+# "ready"; "failed" when building or warming up raised
+_readiness: Dict[str, Any] = {"status": "starting"}
+
+
+async def get_workflow() -> RAGWorkflow:
+    """
+    Return the shared RAGWorkflow, building it (and its index) on first use.
+    With RAG_ATTACH_INDEX the worker opens the prebuilt index instead.
+    """
+    global _workflow
+    if _workflow is None:
+        async with _workflow_lock:
+            if _workflow is None:
+                _workflow = await asyncio.to_thread(
+                    RAGWorkflow,
+                    urls=RAG_URLS,
+                    local_paths=RAG_LOCAL_PATHS,
+                    attach_index=RAG_ATTACH_INDEX,
+                )
+                if not RAG_WARMUP:
+                    _readiness["status"] = "ready"
+    return _workflow
+
+
+async def warm_up() -> None:
+    """
+    Build the workflow and, with RAG_WARMUP, open the embedding (and
+    optionally chat model) connections, then report ready.
+    """
+    try:
+        workflow = await get_workflow()
+        if RAG_WARMUP:
+            await asyncio.to_thread(workflow.warm_up, RAG_WARMUP_LLM)
+    except Exception as e:
+        logger.exception(f"Warm-up failed: {e}")
+        _readiness.update(status="failed", error=str(e))
+        return
+    _readiness["status"] = "ready"
+    logger.info("Worker warmed up and ready")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the workflow on startup rather than on the first chat request,
+    # so /ready does not wait for traffic
+    task = asyncio.create_task(warm_up())
+    yield
+    if not task.done():
+        task.cancel()
+    if _workflow is not None:
+        _workflow.close()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="LangManus API",
     description="API for LangManus LangGraph-based agent workflow",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -25,6 +96,7 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+
 class ContentItem(BaseModel):
     type: str = Field(..., description="The type of content (text, image, etc.)")
     text: Optional[str] = Field(None, description="The text content if type is 'text'")
@@ -41,8 +113,8 @@ class ChatMessage(BaseModel):
         ...,
         description="The content of the message, either a string or a list of content items",
     )
-    
-    
+
+
 class ChatRequest(BaseModel):
     messages: List[ChatMessage] = Field(..., description="The conversation history")
     debug: Optional[bool] = Field(False, description="Whether to enable debug logging")
@@ -52,5 +124,68 @@ class ChatRequest(BaseModel):
     search_before_planning: Optional[bool] = Field(
         False, description="Whether to search before planning"
     )
-    
-    
+
+
+def _latest_question(messages: List[ChatMessage]) -> str:
+    for message in reversed(messages):
+        if message.role != "user":
+            continue
+        if isinstance(message.content, str):
+            return message.content
+        return "\n".join(
+            item.text for item in message.content if item.type == "text" and item.text
+        )
+    return ""
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Answer the latest user message, streaming graph progress and the
+    generated tokens as server-sent events.
+    """
+    question = _latest_question(request.messages)
+    if not question:
+        raise HTTPException(status_code=400, detail="No user question found")
+    workflow = await get_workflow()
+
+    async def event_generator() -> AsyncGenerator[Dict[str, str], None]:
+        try:
+            async for event, data in workflow.astream(question):
+                if request.debug:
+                    logger.debug(f"{event}: {data}")
+                yield {"event": event, "data": json.dumps(data, ensure_ascii=False)}
+        except asyncio.CancelledError:
+            logger.info("Client disconnected from chat stream")
+            raise
+        except Exception as e:
+            logger.exception(f"Error in chat stream: {e}")
+            yield {"event": "error", "data": json.dumps({"message": str(e)})}
+
+    return EventSourceResponse(event_generator(), media_type="text/event-stream")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus scrape endpoint for workflow latency, LLM call and token metrics.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+async def health():
+    """
+    Liveness probe: the worker process is up.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the workflow is built and warmed up, 503 before
+    that or if warm-up failed.
+    """
+    status_code = 200 if _readiness["status"] == "ready" else 503
+    return JSONResponse(dict(_readiness), status_code=status_code)
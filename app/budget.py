@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.telemetry import registry, token_usage
+
+BUDGET_EXHAUSTED = registry.counter(
+    "rag_budget_exhausted_total",
+    "Requests answered in degraded mode because their budget ran out, by reason.",
+)
+
+
+def _env_number(name: str, cast=float):
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+
+@dataclass(frozen=True)
+class RequestBudget:
+    """
+    Limits on one request's trip through the graph.
+
+    max_rewrites: query rewrites (transform_query) before giving up on
+        finding relevant documents or a useful answer.
+    max_regenerations: extra `generate` runs after an answer was graded as
+        not supported by its documents.
+    deadline: wall-clock seconds from the start of the request.
+    max_llm_calls, max_tokens: chat model calls and tokens (prompt plus
+        completion) across every chain of the request.
+
+    None means unlimited. Limits are checked between nodes, so a node that
+    has started always finishes.
+    """
+
+    max_rewrites: Optional[int] = 2
+    max_regenerations: Optional[int] = 2
+    deadline: Optional[float] = None
+    max_llm_calls: Optional[int] = None
+    max_tokens: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "RequestBudget":
+        """
+        Limits from RAG_MAX_REWRITES, RAG_MAX_REGENERATIONS,
+        RAG_DEADLINE_SECONDS, RAG_MAX_LLM_CALLS and RAG_MAX_TOKENS; unset
+        ones keep the defaults, and a negative value means unlimited.
+        """
+        defaults = cls()
+        values = {}
+        for field, name, cast in (
+            ("max_rewrites", "RAG_MAX_REWRITES", int),
+            ("max_regenerations", "RAG_MAX_REGENERATIONS", int),
+            ("deadline", "RAG_DEADLINE_SECONDS", float),
+            ("max_llm_calls", "RAG_MAX_LLM_CALLS", int),
+            ("max_tokens", "RAG_MAX_TOKENS", int),
+        ):
+            value = _env_number(name, cast)
+            if value is None:
+                value = getattr(defaults, field)
+            values[field] = None if value is not None and value < 0 else value
+        return cls(**values)
+
+
+class BudgetTracker(BaseCallbackHandler):
+    """
+    Spending of one request against its `RequestBudget`.
+
+    Registered as a callback of the graph run, so every chat model call and
+    its token usage is counted whichever node makes it. The loop counters
+    are advanced by the nodes themselves, and `exhausted` is set to the
+    limit that ended the request early.
+    """
+
+    run_inline = True
+
+    def __init__(self, budget: RequestBudget):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.llm_calls = 0
+        self.tokens = 0
+        self.rewrites = 0
+        self.generations = 0
+        self.exhausted: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        with self._lock:
+            self.tokens += sum(token_usage(response))
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def spent(self) -> Optional[str]:
+        """
+        Which request-wide limit (deadline, LLM calls, tokens) is used up,
+        or None.
+        """
+        budget = self.budget
+        if budget.deadline is not None and self.elapsed() >= budget.deadline:
+            return "deadline"
+        if budget.max_llm_calls is not None and self.llm_calls >= budget.max_llm_calls:
+            return "llm_calls"
+        if budget.max_tokens is not None and self.tokens >= budget.max_tokens:
+            return "tokens"
+        return None
+
+    def has_room(self, llm_calls: int) -> bool:
+        """
+        Whether `llm_calls` more LLM calls fit in the call limit.
+        """
+        limit = self.budget.max_llm_calls
+        return limit is None or self.llm_calls + llm_calls <= limit
+
+    def can_rewrite(self) -> bool:
+        limit = self.budget.max_rewrites
+        return limit is None or self.rewrites < limit
+
+    def can_regenerate(self) -> bool:
+        # The first generation is not a regeneration
+        limit = self.budget.max_regenerations
+        return limit is None or self.generations <= limit
+
+    def as_dict(self) -> dict:
+        return {
+            "elapsed": round(self.elapsed(), 3),
+            "llm_calls": self.llm_calls,
+            "tokens": self.tokens,
+            "rewrites": self.rewrites,
+            "generations": self.generations,
+        }
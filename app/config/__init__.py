@@ -11,6 +11,17 @@ from .env import (
     VL_MODEL,
     VL_BASE_URL,
     VL_API_KEY,
+    # Knowledge base
+    RAG_URLS,
+    RAG_LOCAL_PATHS,
+    # Serve mode
+    RAG_ATTACH_INDEX,
+    RAG_WARMUP,
+    RAG_WARMUP_LLM,
+    # Routing
+    RAG_LOCAL_ROUTER,
+    # Web search
+    TAVILY_MAX_RESULTS,
     # Other configurations
     CHROME_INSTANCE_PATH,
 )
@@ -28,6 +39,17 @@ __all__ = [
     "VL_MODEL",
     "VL_BASE_URL",
     "VL_API_KEY",
+    # Knowledge base
+    "RAG_URLS",
+    "RAG_LOCAL_PATHS",
+    # Serve mode
+    "RAG_ATTACH_INDEX",
+    "RAG_WARMUP",
+    "RAG_WARMUP_LLM",
+    # Routing
+    "RAG_LOCAL_ROUTER",
+    # Web search
+    "TAVILY_MAX_RESULTS",
     # Other configurations
     "CHROME_INSTANCE_PATH",
-]
\ No newline at end of file
+]
@@ -19,5 +19,27 @@ VL_MODEL = os.getenv("VL_MODEL", "gpt-4o")
 VL_BASE_URL = os.getenv("VL_BASE_URL")
 VL_API_KEY = os.getenv("VL_API_KEY")
 
+# Knowledge base sources served by the API, comma separated
+RAG_URLS = [u.strip() for u in os.getenv("RAG_URLS", "").split(",") if u.strip()]
+RAG_LOCAL_PATHS = [
+    p.strip() for p in os.getenv("RAG_LOCAL_PATHS", "").split(",") if p.strip()
+]
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Serve mode: attach to a prebuilt index and warm clients up before ready
+RAG_ATTACH_INDEX = _env_flag("RAG_ATTACH_INDEX")
+RAG_WARMUP = _env_flag("RAG_WARMUP")
+RAG_WARMUP_LLM = _env_flag("RAG_WARMUP_LLM")
+
+# Route questions by embedding, asking the LLM only when unsure
+RAG_LOCAL_ROUTER = _env_flag("RAG_LOCAL_ROUTER", False)
+
+# Web search
+TAVILY_MAX_RESULTS = int(os.getenv("TAVILY_MAX_RESULTS", "3"))
+
 # Chrome Instance configuration
 CHROME_INSTANCE_PATH = os.getenv("CHROME_INSTANCE_PATH")
@@ -0,0 +1,137 @@
+import functools
+import os
+import re
+from typing import FrozenSet, List, Optional
+
+from langchain_core.documents import Document
+
+from app.modals.embedding_model import num_tokens, truncate_tokens
+from app.telemetry import registry
+
+CONTEXT_TOKENS = registry.histogram(
+    "rag_context_tokens",
+    "Tokens of context packed into the generation prompt.",
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+CONTEXT_DOCUMENTS = registry.counter(
+    "rag_context_documents_total",
+    "Candidate context documents, by outcome (packed, duplicate, over_budget).",
+)
+
+_WORD = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=8192)
+def _count_tokens(text: str) -> int:
+    # Chunks come back request after request, count each once
+    return num_tokens(text)
+
+
+@functools.lru_cache(maxsize=8192)
+def _shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return frozenset([" ".join(words)]) if words else frozenset()
+    return frozenset(
+        " ".join(words[i : i + size]) for i in range(len(words) - size + 1)
+    )
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return float(a == b)
+    return len(a & b) / len(a | b)
+
+
+class ContextAssembler:
+    """
+    Packs documents into the generation prompt within a token budget.
+
+    Documents are taken to be in relevance order. Near-duplicates (word
+    3-gram Jaccard similarity of at least `dedup_threshold`) are dropped,
+    then documents are picked by maximal marginal relevance: relevance
+    falls off with the retrieval rank and the penalty is the similarity to
+    the documents already picked, weighed by `diversity`. Picks are added
+    while they fit in `max_tokens`; when even the first does not fit it is
+    truncated, so the context is never empty. The packed documents keep
+    their retrieval order.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        dedup_threshold: float = 0.8,
+        diversity: float = 0.3,
+        separator: str = "\n\n",
+    ):
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.diversity = diversity
+        self.separator = separator
+
+    @classmethod
+    def from_env(cls) -> "ContextAssembler":
+        """Budget from RAG_MAX_CONTEXT_TOKENS (default 3000)."""
+        return cls(max_tokens=int(os.getenv("RAG_MAX_CONTEXT_TOKENS", "3000")))
+
+    def _unique(self, docs: List[Document]) -> List[Document]:
+        kept, kept_shingles = [], []
+        for doc in docs:
+            shingles = _shingles(doc.page_content)
+            if any(
+                _jaccard(shingles, other) >= self.dedup_threshold
+                for other in kept_shingles
+            ):
+                CONTEXT_DOCUMENTS.inc(outcome="duplicate")
+                continue
+            kept.append(doc)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _mmr_order(self, docs: List[Document]) -> List[int]:
+        shingles = [_shingles(doc.page_content) for doc in docs]
+        relevance = [1.0 - i / len(docs) for i in range(len(docs))]
+        order, left = [], list(range(len(docs)))
+        while left:
+
+            def score(i):
+                redundancy = max(
+                    (_jaccard(shingles[i], shingles[j]) for j in order), default=0.0
+                )
+                return (1 - self.diversity) * relevance[i] - self.diversity * redundancy
+
+            best = max(left, key=score)
+            order.append(best)
+            left.remove(best)
+        return order
+
+    def select(self, docs: List[Document]) -> List[Document]:
+        """
+        The documents to put in the prompt, in retrieval order.
+        """
+        docs = self._unique([d for d in docs if d.page_content.strip()])
+        if not docs:
+            return []
+        budget = self.max_tokens
+        separator = _count_tokens(self.separator)
+        picked = {}
+        for i in self._mmr_order(docs):
+            tokens = _count_tokens(docs[i].page_content) + (separator if picked else 0)
+            if tokens <= budget:
+                picked[i] = docs[i]
+                budget -= tokens
+            elif not picked:
+                picked[i] = Document(
+                    id=docs[i].id,
+                    metadata={**docs[i].metadata, "truncated": True},
+                    page_content=truncate_tokens(docs[i].page_content, budget),
+                )
+                budget = 0
+            else:
+                CONTEXT_DOCUMENTS.inc(outcome="over_budget")
+        CONTEXT_DOCUMENTS.inc(len(picked), outcome="packed")
+        CONTEXT_TOKENS.observe(self.max_tokens - budget)
+        return [picked[i] for i in sorted(picked)]
+
+    def format(self, docs: List[Document]) -> str:
+        return self.separator.join(doc.page_content for doc in docs)
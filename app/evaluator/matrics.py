@@ -2,6 +2,9 @@ import re
 import numpy as np
 import warnings
 from collections import Counter
+from functools import lru_cache
+
+from .utils import MultiPatternMatcher, normalize_answer
 
 
 class BaseMetric:
@@ -44,6 +47,53 @@ class BaseMetric:
         return golden_answers_list
 
 
+class RetrievalEvaluator:
+    """Batch engine for answer-containment retrieval metrics.
+
+    Every golden answer and every distinct document is normalized once, all
+    answers of a query are matched against a document in a single scan, and
+    recall and precision are computed for several top-k cut-offs in one pass.
+    """
+
+    def __init__(self, topk_list, cache_size=1 << 18):
+        self.topk_list = sorted(set(topk_list))
+        self._normalize = lru_cache(maxsize=cache_size)(normalize_answer)
+
+    def hit_matrix(self, retrieve_docs, golden_answers_list):
+        """Return (hits, lengths): hits[i, j] tells whether the j-th retrieved doc
+        of query i contains a golden answer, for j < max top-k; lengths[i] is the
+        number of docs actually retrieved for query i (capped at max top-k).
+        """
+        max_k = self.topk_list[-1]
+        hits = np.zeros((len(retrieve_docs), max_k), dtype=bool)
+        lengths = np.zeros(len(retrieve_docs), dtype=np.int64)
+        for i, (doc_list, golden_answers) in enumerate(
+            zip(retrieve_docs, golden_answers_list)
+        ):
+            matcher = MultiPatternMatcher(normalize_answer(a) for a in golden_answers)
+            doc_list = doc_list[:max_k]
+            lengths[i] = len(doc_list)
+            for j, doc in enumerate(doc_list):
+                hits[i, j] = matcher.search(self._normalize(doc["contents"]))
+        return hits, lengths
+
+    def evaluate(self, retrieve_docs, golden_answers_list):
+        """Return ``{k: (recall_list, precision_list)}`` for every configured top-k."""
+        hits, lengths = self.hit_matrix(retrieve_docs, golden_answers_list)
+        cumulative = np.cumsum(hits, axis=1)
+        rows = np.arange(len(lengths))
+        results = {}
+        for k in self.topk_list:
+            if np.any(lengths < k):
+                warnings.warn(f"Length of retrieved docs is smaller than topk ({k})")
+            n = np.minimum(lengths, k)
+            found = np.where(n > 0, cumulative[rows, np.maximum(n - 1, 0)], 0)
+            recall = (found > 0).astype(int)
+            precision = np.divide(found, n, out=np.zeros(len(n)), where=n > 0)
+            results[k] = (recall.tolist(), precision.tolist())
+        return results
+
+
 class Retrieval_Recall(BaseMetric):
     r"""The recall of the top-k retreived passages, we measure if any of the passage contain the answer string."""
 
@@ -52,26 +102,14 @@ class Retrieval_Recall(BaseMetric):
     def __init__(self, config):
         super().__init__(config)
         self.topk = config["metric_setting"]["retrieval_recall_topk"]
+        self.evaluator = RetrievalEvaluator([self.topk])
 
     def calculate_metric(self, data):
         golden_answers_list = self.get_dataset_answer(data)
         retrieve_docs = data.retrieval_result
-        recall_score_list = []
-        for doc_list, golden_answers in zip(retrieve_docs, golden_answers_list):
-            if len(doc_list) < self.topk:
-                warnings.warn(
-                    f"Length of retrieved docs is smaller than topk ({self.topk})")
-            doc_list = [doc["contents"] for doc in doc_list[: self.topk]]
-            hit_list = []
-            for doc in doc_list:
-                for golden_answer in golden_answers:
-                    if normalize_answer(golden_answer) in normalize_answer(doc):
-                        hit_list.append(True)
-                        break
-                else:
-                    hit_list.append(False)
-            score = 1 if any(hit_list) else 0
-            recall_score_list.append(score)
+        recall_score_list, _ = self.evaluator.evaluate(
+            retrieve_docs, golden_answers_list
+        )[self.topk]
         recall_score = sum(recall_score_list) / len(recall_score_list)
 
         return {f"retrieval_recall_top{self.topk}": recall_score}, recall_score_list
@@ -85,29 +123,48 @@ class Retrieval_Precision(BaseMetric):
     def __init__(self, config):
         super().__init__(config)
         self.topk = config["metric_setting"]["retrieval_recall_topk"]
+        self.evaluator = RetrievalEvaluator([self.topk])
 
     def calculate_metric(self, data):
         golden_answers_list = self.get_dataset_answer(data)
         retrieve_docs = data.retrieval_result
-        precision_score_list = []
-        for doc_list, golden_answers in zip(retrieve_docs, golden_answers_list):
-            if len(doc_list) < self.topk:
-                warnings.warn(
-                    f"Length of retrieved docs is smaller than topk ({self.topk})")
-            doc_list = [doc["contents"] for doc in doc_list[: self.topk]]
-            hit_list = []
-            for doc in doc_list:
-                for golden_answer in golden_answers:
-                    if normalize_answer(golden_answer) in normalize_answer(doc):
-                        hit_list.append(True)
-                        break
-                else:
-                    hit_list.append(False)
-            score = sum(hit_list) / len(hit_list)
-            precision_score_list.append(score)
+        _, precision_score_list = self.evaluator.evaluate(
+            retrieve_docs, golden_answers_list
+        )[self.topk]
         precision_score = sum(precision_score_list) / len(precision_score_list)
 
-        return {f"retrieval_precision_top{self.topk}": precision_score}, precision_score_list
+        return {
+            f"retrieval_precision_top{self.topk}": precision_score
+        }, precision_score_list
+
+
+class Retrieval_TopK(BaseMetric):
+    r"""Retrieval recall and precision at every top-k of ``retrieval_topk_list``, computed in one pass."""
+
+    metric_name = "retrieval_topk"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.evaluator = RetrievalEvaluator(
+            config["metric_setting"]["retrieval_topk_list"]
+        )
+
+    def calculate_metric(self, data):
+        golden_answers_list = self.get_dataset_answer(data)
+        results = self.evaluator.evaluate(data.retrieval_result, golden_answers_list)
+        metric_score = {}
+        metric_score_list = {}
+        for k, (recall_list, precision_list) in results.items():
+            metric_score[f"retrieval_recall_top{k}"] = sum(recall_list) / len(
+                recall_list
+            )
+            metric_score[f"retrieval_precision_top{k}"] = sum(precision_list) / len(
+                precision_list
+            )
+            metric_score_list[f"retrieval_recall_top{k}"] = recall_list
+            metric_score_list[f"retrieval_precision_top{k}"] = precision_list
+
+        return metric_score, metric_score_list
 
 
 class Rouge_Score(BaseMetric):
@@ -16,4 +16,47 @@ def normalize_answer(s):
     def lower(text):
         return text.lower()
 
-    return white_space_fix(remove_articles(remove_punc(lower(s))))
\ No newline at end of file
+    return white_space_fix(remove_articles(remove_punc(lower(s))))
+
+
+class MultiPatternMatcher:
+    """
+    Tests a text against many substrings in a single scan.
+
+    Uses an Aho-Corasick automaton from `pyahocorasick` when it is
+    installed, otherwise one compiled regex alternation of the patterns.
+    An empty pattern matches every text, like ``"" in text`` does.
+    """
+
+    def __init__(self, patterns):
+        patterns = list(dict.fromkeys(patterns))
+        self.match_all = "" in patterns
+        patterns = [p for p in patterns if p]
+        self._automaton = None
+        self._regex = None
+        if self.match_all or not patterns:
+            return
+        try:
+            import ahocorasick
+
+            automaton = ahocorasick.Automaton()
+            for idx, pattern in enumerate(patterns):
+                automaton.add_word(pattern, idx)
+            automaton.make_automaton()
+            self._automaton = automaton
+        except ImportError:
+            # Longest first so the alternation never stops at a shorter prefix
+            patterns.sort(key=len, reverse=True)
+            self._regex = re.compile("|".join(map(re.escape, patterns)))
+
+    def search(self, text):
+        """Return True if any pattern occurs in `text`."""
+        if self.match_all:
+            return True
+        if self._automaton is not None:
+            for _ in self._automaton.iter(text):
+                return True
+            return False
+        if self._regex is not None:
+            return self._regex.search(text) is not None
+        return False
@@ -0,0 +1,12 @@
+from .bm25 import BM25Index
+from .flat_store import FlatRetriever, FlatVectorStore
+from .manifest import IndexManifest, chunk_ids, content_hash
+
+__all__ = [
+    "BM25Index",
+    "FlatRetriever",
+    "FlatVectorStore",
+    "IndexManifest",
+    "chunk_ids",
+    "content_hash",
+]
@@ -0,0 +1,103 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Single CJK characters, or alphanumeric words optionally joined by - _ .
+# so that gene and drug identifiers such as "IL-23" or "NOD2" stay intact
+_TOKEN_RE = re.compile(r"[一-鿿]|[^\W_]+(?:[-_.][^\W_]+)*")
+_JOINERS_RE = re.compile(r"[-_.]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased tokens of `text`. Compound identifiers are kept whole and
+    also split into their parts, so "IL-23" matches both "il-23" and "il 23".
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if _JOINERS_RE.search(token):
+            tokens.extend(part for part in _JOINERS_RE.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-process Okapi BM25 index over chunk texts.
+
+    Postings are kept per term as NumPy arrays of document positions and
+    term frequencies, so a query costs one vectorized update per query term.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.documents: List[Document] = []
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._avgdl = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_documents(
+        cls, ids: Iterable[str], documents: Iterable[Document], **kwargs
+    ) -> "BM25Index":
+        index = cls(**kwargs)
+        index.build(ids, documents)
+        return index
+
+    def build(self, ids: Iterable[str], documents: Iterable[Document]) -> None:
+        self.ids = list(ids)
+        self.documents = list(documents)
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        doc_len = np.zeros(len(self.documents), dtype=np.float32)
+        for pos, doc in enumerate(self.documents):
+            counts = Counter(tokenize(doc.page_content))
+            doc_len[pos] = sum(counts.values())
+            for term, tf in counts.items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(pos)
+                tfs.append(tf)
+        self._postings = {
+            term: (np.asarray(docs, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+            for term, (docs, tfs) in postings.items()
+        }
+        self._doc_len = doc_len
+        self._avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        if not self.ids:
+            return scores
+        n = len(self.ids)
+        norm = self.k1 * (1 - self.b + self.b * self._doc_len / (self._avgdl or 1.0))
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+        return scores
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, Document, float]]:
+        """
+        Top `k` (id, document, score) by BM25 score, best first. Documents
+        sharing no term with the query are never returned.
+        """
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.ids[i], self.documents[i], float(scores[i])) for i in order]
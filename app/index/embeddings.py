@@ -0,0 +1,23 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingAdapter(Embeddings):
+    """
+    Exposes an `app.modals` embedding backend through LangChain's
+    `Embeddings` interface, so it can be handed to LangChain vector stores.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors, _ = self.model.encode(texts)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        vector, _ = self.model.encode_queries(text)
+        return vector.tolist()
@@ -0,0 +1,481 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import shutil
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from .quantization import QUANTIZERS, make_quantizer
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILENAME = "CURRENT"
+HEADER_FILENAME = "header.json"
+VECTORS_FILENAME = "vectors.bin"
+IDS_FILENAME = "ids.json"
+CHUNKS_FILENAME = "chunks.jsonl"
+OFFSETS_FILENAME = "offsets.npy"
+CODES_FILENAME = "codes.bin"
+QUANTIZER_FILENAME = "quantizer.npz"
+
+# Rows scored per matrix product, bounds the float32 scratch memory
+SEARCH_BLOCK_ROWS = 65536
+# float16 rows and int8/PQ codes are widened to float32 this many at a time
+# while scoring
+CONVERT_TILE_ROWS = 4096
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class FlatVectorStore:
+    """
+    Exact cosine-similarity vector store kept as one contiguous matrix.
+
+    Vectors are L2-normalized and stored as a raw float32 or float16 row
+    matrix that is opened with `np.memmap`, so loading is zero-copy and
+    worker processes share the same page cache. Chunk text and metadata
+    live in a JSON-lines side file addressed by a byte-offset array, and are
+    only parsed for the rows a query returns.
+
+    Each `commit` writes a new generation directory and then atomically
+    repoints the CURRENT file, so readers never see a half-written index.
+    Writes are staged in memory until `commit`, and only committed rows
+    are searchable. The store also implements the ingestion sink interface
+    (`upsert`, `delete`, `documents`).
+
+    With `quantization` ("int8" or "pq") each generation also stores compact
+    codes of the vectors. Searches then scan the codes and re-score only a
+    shortlist of `rescore_factor * k` rows with the full-precision matrix,
+    so the float vectors are only paged in for those rows. The matrix is
+    still written in full for that re-scoring: quantization shrinks what a
+    search keeps resident and scans, not the index on disk.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        dtype: str = "float32",
+        readonly: bool = False,
+        quantization: Optional[str] = None,
+        pq_subspaces: Optional[int] = None,
+        rescore_factor: int = 4,
+    ):
+        if np.dtype(dtype) not in (np.float32, np.float16):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        if quantization is not None and quantization not in QUANTIZERS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.readonly = readonly
+        self.quantization = quantization
+        self.pq_subspaces = pq_subspaces
+        self.rescore_factor = max(1, rescore_factor)
+        self._pending: Dict[str, Tuple[Document, np.ndarray]] = {}
+        self._deleted: set = set()
+        self._chunks_file = None
+        self._chunks = None
+        self.reload()
+
+    # -- loading -------------------------------------------------------------
+
+    def _generation_path(self) -> Optional[str]:
+        current = os.path.join(self.directory, CURRENT_FILENAME)
+        if not os.path.isfile(current):
+            return None
+        with open(current, "r", encoding="utf-8") as f:
+            return os.path.join(self.directory, f.read().strip())
+
+    def reload(self) -> None:
+        """(Re)open the latest committed generation."""
+        self._close()
+        self.generation = self._generation_path()
+        self.dim: Optional[int] = None
+        self.ids: List[str] = []
+        self._row: Dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=self.dtype)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self.quantizer = None
+        self._codes: Optional[np.ndarray] = None
+        self._stored_quantization: Optional[str] = None
+        if self.generation is None:
+            return
+        with open(
+            os.path.join(self.generation, HEADER_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            header = json.load(f)
+        count, self.dim = header["count"], header["dim"]
+        with open(
+            os.path.join(self.generation, IDS_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            self.ids = json.load(f)
+        self._row = {cid: i for i, cid in enumerate(self.ids)}
+        if count:
+            self._vectors = np.memmap(
+                os.path.join(self.generation, VECTORS_FILENAME),
+                dtype=np.dtype(header["dtype"]),
+                mode="r",
+                shape=(count, self.dim),
+            )
+            self._offsets = np.load(
+                os.path.join(self.generation, OFFSETS_FILENAME), mmap_mode="r"
+            )
+            self._chunks_file = open(
+                os.path.join(self.generation, CHUNKS_FILENAME), "rb"
+            )
+            self._chunks = mmap.mmap(
+                self._chunks_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        self._stored_quantization = header.get("quantization")
+        if count and self._stored_quantization:
+            with np.load(os.path.join(self.generation, QUANTIZER_FILENAME)) as state:
+                self.quantizer = QUANTIZERS[self._stored_quantization].from_state(state)
+            self._codes = np.memmap(
+                os.path.join(self.generation, CODES_FILENAME),
+                dtype=self.quantizer.code_dtype,
+                mode="r",
+                shape=(count, self.quantizer.code_size(self.dim)),
+            )
+
+    def _close(self) -> None:
+        if self._chunks is not None:
+            self._chunks.close()
+            self._chunks = None
+        if self._chunks_file is not None:
+            self._chunks_file.close()
+            self._chunks_file = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._vectors.nbytes)
+
+    @property
+    def code_nbytes(self) -> int:
+        return int(self._codes.nbytes) if self._codes is not None else 0
+
+    # -- reading -------------------------------------------------------------
+
+    def vectors(self) -> np.ndarray:
+        """The committed (memory-mapped) vector matrix."""
+        return self._vectors
+
+    def document(self, row: int) -> Document:
+        record = json.loads(self._chunks[self._offsets[row] : self._offsets[row + 1]])
+        return Document(
+            id=self.ids[row],
+            page_content=record["text"],
+            metadata=record.get("metadata") or {},
+        )
+
+    def documents(self):
+        """(ids, documents) of every committed chunk."""
+        return list(self.ids), [self.document(i) for i in range(len(self.ids))]
+
+    def _scan(
+        self, score_block, n_queries: int, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Running top-k over all committed rows, scored `SEARCH_BLOCK_ROWS`
+        rows at a time by `score_block(start, stop)`.
+        """
+        best_rows = np.zeros((n_queries, 0), dtype=np.int64)
+        best_scores = np.zeros((n_queries, 0), dtype=np.float32)
+        for start in range(0, len(self.ids), SEARCH_BLOCK_ROWS):
+            scores = score_block(start, start + SEARCH_BLOCK_ROWS)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+            else:
+                top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return (
+            np.take_along_axis(best_rows, order, axis=1),
+            np.take_along_axis(best_scores, order, axis=1),
+        )
+
+    def _exact(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._vectors.dtype == np.float32:
+            return self._scan(
+                lambda start, stop: queries @ self._vectors[start:stop].T,
+                len(queries),
+                k,
+            )
+        # Widening a whole float16 block would take SEARCH_BLOCK_ROWS float32
+        # rows of scratch per query; tiles go through one small reused buffer
+        tile = np.empty(
+            (min(CONVERT_TILE_ROWS, len(self.ids)), self._vectors.shape[1]),
+            dtype=np.float32,
+        )
+
+        def score_block(start, stop):
+            block = self._vectors[start:stop]
+            scores = np.empty((len(queries), len(block)), dtype=np.float32)
+            for i in range(0, len(block), CONVERT_TILE_ROWS):
+                part = block[i : i + CONVERT_TILE_ROWS]
+                widened = tile[: len(part)]
+                np.copyto(widened, part)
+                scores[:, i : i + len(part)] = queries @ widened.T
+            return scores
+
+        return self._scan(score_block, len(queries), k)
+
+    def _quantized(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        prepared = self.quantizer.prepare(queries)
+
+        def score_block(start, stop):
+            # Scored a tile of codes at a time, like float16 rows, so the
+            # float32 scratch stays at CONVERT_TILE_ROWS rows
+            codes = self._codes[start:stop]
+            scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+            for i in range(0, len(codes), CONVERT_TILE_ROWS):
+                part = codes[i : i + CONVERT_TILE_ROWS]
+                scores[:, i : i + len(part)] = self.quantizer.scores(prepared, part)
+            return scores
+
+        return self._scan(score_block, len(queries), k)
+
+    def _rescore(
+        self, queries: np.ndarray, shortlist: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        rows_out = np.empty((len(queries), k), dtype=np.int64)
+        scores_out = np.empty((len(queries), k), dtype=np.float32)
+        for i, (query, rows) in enumerate(zip(queries, shortlist)):
+            rows = np.sort(rows)  # sequential page access
+            scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+            order = np.argsort(-scores, kind="stable")[:k]
+            rows_out[i], scores_out[i] = rows[order], scores[order]
+        return rows_out, scores_out
+
+    def search_vectors(
+        self, queries: np.ndarray, k: int = 4, rescore: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k rows for a batch of query vectors.
+
+        Returns (rows, scores), each of shape (n_queries, min(k, len(self))),
+        best first. Without quantization the search is exact. With it, the
+        codes are scanned for a shortlist that is re-scored with the full
+        vectors; `rescore=False` returns the code-only ranking instead.
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        k = min(k, len(self.ids))
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if self._codes is None:
+            return self._exact(queries, k)
+        if not rescore:
+            return self._quantized(queries, k)
+        shortlist, _ = self._quantized(
+            queries, min(k * self.rescore_factor, len(self.ids))
+        )
+        return self._rescore(queries, shortlist, k)
+
+    def search_vectors_exact(
+        self, queries: np.ndarray, k: int = 4
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k over the full-precision matrix, ignoring any codes.
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        return self._exact(queries, min(k, len(self.ids)))
+
+    def recall_at_k(self, queries: np.ndarray, k: int = 4) -> Dict[str, float]:
+        """
+        Recall@k of the quantized search against exact search, before
+        ("quantized") and after ("rescored") full-precision re-scoring.
+        """
+        if self._codes is None:
+            return {"quantized": 1.0, "rescored": 1.0}
+        exact, _ = self.search_vectors_exact(queries, k)
+        report = {}
+        for name, rescore in (("quantized", False), ("rescored", True)):
+            found, _ = self.search_vectors(queries, k, rescore=rescore)
+            hits = sum(
+                len(set(a) & set(b)) for a, b in zip(exact.tolist(), found.tolist())
+            )
+            report[name] = hits / exact.size if exact.size else 1.0
+        return report
+
+    def search(
+        self, query_vector: np.ndarray, k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        rows, scores = self.search_vectors(query_vector, k)
+        return [(self.document(int(r)), float(s)) for r, s in zip(rows[0], scores[0])]
+
+    # -- writing -------------------------------------------------------------
+
+    def _check_writable(self) -> None:
+        if self.readonly:
+            raise RuntimeError("FlatVectorStore is opened read-only")
+
+    def upsert(
+        self, ids: List[str], documents: List[Document], vectors: np.ndarray
+    ) -> None:
+        self._check_writable()
+        vectors = _normalize(vectors)
+        for cid, doc, vec in zip(ids, documents, vectors):
+            self._pending[cid] = (doc, vec)
+            self._deleted.discard(cid)
+
+    def delete(self, ids: List[str]) -> None:
+        self._check_writable()
+        for cid in ids:
+            self._pending.pop(cid, None)
+            if cid in self._row:
+                self._deleted.add(cid)
+
+    def commit(self) -> None:
+        """Write staged changes as a new generation and switch to it."""
+        self._check_writable()
+        if (
+            not self._pending
+            and not self._deleted
+            and self.quantization == self._stored_quantization
+        ):
+            return
+        keep = [
+            i
+            for i, cid in enumerate(self.ids)
+            if cid not in self._deleted and cid not in self._pending
+        ]
+        dims = {len(vec) for _, vec in self._pending.values()}
+        if self.dim is not None and keep:
+            dims.add(self.dim)
+        if len(dims) > 1:
+            raise ValueError(f"Inconsistent embedding dimensions: {sorted(dims)}")
+        dim = dims.pop() if dims else (self.dim or 0)
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"gen-{uuid.uuid4().hex[:12]}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(path)
+        ids: List[str] = []
+        offsets = [0]
+        with (
+            open(os.path.join(path, VECTORS_FILENAME), "wb") as vf,
+            open(os.path.join(path, CHUNKS_FILENAME), "wb") as cf,
+        ):
+            for start in range(0, len(keep), SEARCH_BLOCK_ROWS):
+                rows = keep[start : start + SEARCH_BLOCK_ROWS]
+                np.asarray(self._vectors[rows], dtype=self.dtype).tofile(vf)
+                for row in rows:
+                    cf.write(self._chunks[self._offsets[row] : self._offsets[row + 1]])
+                    offsets.append(cf.tell())
+                    ids.append(self.ids[row])
+            for cid, (doc, vec) in self._pending.items():
+                np.asarray(vec, dtype=self.dtype).tofile(vf)
+                record = {"text": doc.page_content, "metadata": doc.metadata or {}}
+                cf.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+                offsets.append(cf.tell())
+                ids.append(cid)
+        np.save(
+            os.path.join(path, OFFSETS_FILENAME), np.asarray(offsets, dtype=np.int64)
+        )
+        with open(os.path.join(path, IDS_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(ids, f)
+        if self.quantization and ids:
+            self._write_codes(path, len(ids), dim)
+        with open(os.path.join(path, HEADER_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "count": len(ids),
+                    "dim": dim,
+                    "dtype": self.dtype.name,
+                    "quantization": self.quantization if ids else None,
+                },
+                f,
+            )
+
+        current = os.path.join(self.directory, CURRENT_FILENAME)
+        with open(f"{current}.tmp", "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(f"{current}.tmp", current)
+        previous = self.generation
+        self._pending.clear()
+        self._deleted.clear()
+        self.reload()
+        if previous and os.path.isdir(previous):
+            # Processes still mapping the old files keep them alive on POSIX
+            shutil.rmtree(previous, ignore_errors=True)
+        logger.info(
+            f"Flat index committed: {len(ids)} vectors of dim {dim} "
+            f"({self.dtype.name}, quantization: {self.quantization})"
+        )
+
+    def _write_codes(self, path: str, count: int, dim: int) -> None:
+        vectors = np.memmap(
+            os.path.join(path, VECTORS_FILENAME),
+            dtype=self.dtype,
+            mode="r",
+            shape=(count, dim),
+        )
+        kwargs = {"subspaces": self.pq_subspaces} if self.quantization == "pq" else {}
+        quantizer = make_quantizer(self.quantization, **kwargs).fit(vectors)
+        with open(os.path.join(path, CODES_FILENAME), "wb") as f:
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                quantizer.encode(vectors[start : start + SEARCH_BLOCK_ROWS]).tofile(f)
+        np.savez(os.path.join(path, QUANTIZER_FILENAME), **quantizer.state())
+        del vectors
+
+
+class FlatRetriever(BaseRetriever):
+    """Retriever over a `FlatVectorStore`, embedding queries with `encode_queries`."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    store: FlatVectorStore
+    embedding: object
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector, _ = self.embedding.encode_queries(query)
+        return [doc for doc, _ in self.store.search(vector, self.k)]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        aencode = getattr(self.embedding, "aencode_queries", None)
+        if aencode is not None:
+            vector, _ = await aencode(query)
+        else:
+            vector, _ = await asyncio.to_thread(self.embedding.encode_queries, query)
+        hits = await asyncio.to_thread(self.store.search, vector, self.k)
+        return [doc for doc, _ in hits]
+
+    def search_many(self, queries: List[str]) -> List[List[Document]]:
+        """Answer several queries with one embedding call and one scan."""
+        batch = getattr(self.embedding, "encode_queries_batch", None)
+        if batch is not None:
+            vectors, _ = batch(queries)
+        else:
+            vectors = np.stack([self.embedding.encode_queries(q)[0] for q in queries])
+        rows, _ = self.store.search_vectors(vectors, self.k)
+        return [
+            [self.store.document(int(r)) for r in query_rows] for query_rows in rows
+        ]
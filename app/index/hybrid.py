@@ -0,0 +1,92 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from .bm25 import BM25Index
+from .manifest import content_hash
+
+
+def _doc_key(doc: Document) -> str:
+    # Chroma's langchain wrapper drops the chunk id from dense results, so
+    # both rankings are matched on content rather than id
+    return content_hash(doc.page_content)
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Document]], k: int = 60, weights: Optional[List[float]] = None
+) -> List[Document]:
+    """
+    Fuse several rankings with RRF: a document scores sum(w / (k + rank))
+    over the rankings it appears in. Documents are matched by content; of
+    the copies of a document the first one with an id is returned.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            if key not in docs or (docs[key].id is None and doc.id):
+                docs[key] = doc
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [docs[key] for key in ordered]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense + BM25 retriever. Each ranker contributes its `fetch_k` best
+    chunks, and the two rankings are fused with reciprocal-rank fusion
+    before keeping the top `k`.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    dense: BaseRetriever
+    sparse: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    dense_weight: float = 1.0
+    sparse_weight: float = 1.0
+
+    def _sparse_search(self, query: str) -> List[Document]:
+        return [
+            Document(id=cid, page_content=doc.page_content, metadata=doc.metadata)
+            for cid, doc, _ in self.sparse.search(query, self.fetch_k)
+        ]
+
+    def _fuse(
+        self, dense_docs: List[Document], sparse_docs: List[Document]
+    ) -> List[Document]:
+        fused = reciprocal_rank_fusion(
+            [dense_docs, sparse_docs],
+            k=self.rrf_k,
+            weights=[self.dense_weight, self.sparse_weight],
+        )
+        return fused[: self.k]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        dense_docs = self.dense.invoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        return self._fuse(dense_docs, self._sparse_search(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # BM25 scoring runs in a thread while the dense side awaits its embedding
+        dense_docs, sparse_docs = await asyncio.gather(
+            self.dense.ainvoke(query, config={"callbacks": run_manager.get_child()}),
+            asyncio.to_thread(self._sparse_search, query),
+        )
+        return self._fuse(dense_docs, sparse_docs)
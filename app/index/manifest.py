@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    """
+    Stable SHA-256 hex digest of a piece of text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(source: str, texts: Iterable[str]) -> List[str]:
+    """
+    Content-addressed ids for the chunks of one source.
+
+    The id only depends on the source and the chunk text, so an unchanged
+    chunk keeps its id when the rest of the source is edited. Repeated
+    chunks within a source get an occurrence suffix to keep ids unique.
+    """
+    ids = []
+    seen: Dict[str, int] = {}
+    for text in texts:
+        base = content_hash(f"{source}\0{text}")
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        ids.append(base if n == 0 else f"{base}-{n}")
+    return ids
+
+
+class IndexManifest:
+    """
+    Bookkeeping for a persisted vector index.
+
+    Records, per source, the hash of its loaded content and the ids of the
+    chunks it produced, together with the settings the index was built with
+    (splitter parameters, embedding model). A settings change invalidates
+    every chunk, since vectors from different models or splits can't be mixed.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        settings: Optional[Dict] = None,
+        sources: Optional[Dict[str, Dict]] = None,
+    ):
+        self.directory = directory
+        self.settings = settings or {}
+        self.sources: Dict[str, Dict] = sources or {}
+
+    @property
+    def path(self) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, MANIFEST_FILENAME)
+
+    @classmethod
+    def load(cls, directory: Optional[str]) -> "IndexManifest":
+        """
+        Load the manifest stored in `directory`, or an empty one if there is
+        none yet (or no directory at all, for in-memory indexes).
+        """
+        manifest = cls(directory)
+        path = manifest.path
+        if not path or not os.path.isfile(path):
+            return manifest
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError(
+                f"Unsupported index manifest version: {data.get('version')}"
+            )
+        manifest.settings = data.get("settings", {})
+        manifest.sources = data.get("sources", {})
+        return manifest
+
+    def save(self) -> None:
+        path = self.path
+        if not path:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "settings": self.settings,
+                    "sources": self.sources,
+                },
+                f,
+                ensure_ascii=False,
+                indent=1,
+            )
+        # Atomic on POSIX and Windows, a crash never leaves a half-written file
+        os.replace(tmp_path, path)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Hash of the indexed content. Changes whenever a chunk is added or
+        removed, so it can be used to invalidate anything derived from the index.
+        """
+        payload = json.dumps(
+            [self.settings, sorted((s, e["chunks"]) for s, e in self.sources.items())],
+            sort_keys=True,
+        )
+        return content_hash(payload)
+
+    def source_hash(self, source: str) -> Optional[str]:
+        entry = self.sources.get(source)
+        return entry["hash"] if entry else None
+
+    def chunk_ids(self, source: str) -> List[str]:
+        entry = self.sources.get(source)
+        return list(entry["chunks"]) if entry else []
+
+    def all_chunk_ids(self) -> List[str]:
+        return [cid for entry in self.sources.values() for cid in entry["chunks"]]
+
+    def set_source(self, source: str, source_hash: str, ids: List[str]) -> None:
+        self.sources[source] = {"hash": source_hash, "chunks": list(ids)}
+
+    def remove_source(self, source: str) -> List[str]:
+        """
+        Forget `source` and return the ids of the chunks it owned.
+        """
+        entry = self.sources.pop(source, None)
+        return list(entry["chunks"]) if entry else []
+
+    def diff_source(self, source: str, ids: List[str]):
+        """
+        Compare the new chunk ids of `source` with the recorded ones.
+
+        Returns (added, removed): ids that need embedding, and ids whose
+        vectors must be deleted from the store.
+        """
+        old = set(self.chunk_ids(source))
+        new = set(ids)
+        added = [cid for cid in ids if cid not in old]
+        removed = [cid for cid in self.chunk_ids(source) if cid not in new]
+        return added, removed
@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import queue
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .manifest import IndexManifest, chunk_ids, content_hash
+
+logger = logging.getLogger(__name__)
+
+# End-of-stream marker passed down the queues
+_DONE = object()
+# Loaded in place of the documents of a source that no longer exists
+_MISSING = object()
+
+SourceLoader = Callable[[], Optional[List[Document]]]
+
+
+class ChromaSink:
+    """
+    Writes precomputed vectors into a LangChain `Chroma` store.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def upsert(
+        self, ids: List[str], documents: List[Document], vectors: np.ndarray
+    ) -> None:
+        self.store._collection.upsert(
+            ids=ids,
+            embeddings=np.asarray(vectors, dtype=np.float32).tolist(),
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata or None for doc in documents],
+        )
+
+    def delete(self, ids: List[str]) -> None:
+        if ids:
+            self.store.delete(ids=ids)
+
+    def commit(self) -> None:
+        """
+        Chroma persists every write on its own.
+        """
+
+    def documents(self):
+        """
+        (ids, documents) of every chunk in the store.
+        """
+        data = self.store.get(include=["documents", "metadatas"])
+        docs = [
+            Document(id=cid, page_content=text or "", metadata=meta or {})
+            for cid, text, meta in zip(
+                data["ids"], data["documents"], data["metadatas"]
+            )
+        ]
+        return data["ids"], docs
+
+    def vectors(self, limit: Optional[int] = None) -> np.ndarray:
+        """
+        Up to `limit` stored chunk vectors.
+        """
+        data = self.store.get(include=["embeddings"], limit=limit)
+        return np.asarray(data["embeddings"], dtype=np.float32)
+
+
+class IngestionStats:
+    def __init__(self):
+        self.sources = 0
+        self.skipped = 0
+        self.failed = 0
+        self.embedded = 0
+        self.removed = 0
+        self.tokens = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+
+class IngestionPipeline:
+    """
+    load -> split -> embed -> upsert, each stage in its own thread(s) and
+    connected by bounded queues.
+
+    Sources are fetched by `load_workers` threads at once, and embedding
+    starts as soon as the first chunks are split, while later sources are
+    still loading. Backends with an async `aencode` get up to
+    `embed_concurrency` batches at once per embed worker, which they pack
+    into requests by their token budget. The bounded queues apply
+    back-pressure, so at most `queue_size` loaded sources and embedding
+    batches (plus the ones being embedded) are held in memory at any time.
+    Unchanged sources (same content hash as in the manifest) are skipped;
+    changed ones only embed chunks the manifest doesn't know.
+    A loader raising `FileNotFoundError` marks its source as deleted, and
+    its chunks are removed; any other load error keeps the indexed copy.
+    The manifest is only updated once every chunk has been written.
+    """
+
+    def __init__(
+        self,
+        splitter,
+        embedding,
+        sink,
+        manifest: IndexManifest,
+        load_workers: int = 8,
+        embed_workers: int = 1,
+        embed_batch_size: int = 64,
+        queue_size: int = 8,
+        embed_concurrency: int = 4,
+    ):
+        self.splitter = splitter
+        self.embedding = embedding
+        self.sink = sink
+        self.manifest = manifest
+        self.load_workers = max(1, load_workers)
+        self.embed_workers = max(1, embed_workers)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.queue_size = max(1, queue_size)
+        self.embed_concurrency = max(1, embed_concurrency)
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._lock = threading.Lock()
+
+    # -- queue helpers that give up once another stage failed --------------
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _stage(self, target, *args):
+        def runner():
+            try:
+                target(*args)
+            except BaseException as e:
+                logger.exception(f"Ingestion stage {target.__name__} failed: {e}")
+                with self._lock:
+                    self._errors.append(e)
+                self._stop.set()
+
+        thread = threading.Thread(
+            target=runner, name=f"ingest-{target.__name__}", daemon=True
+        )
+        thread.start()
+        return thread
+
+    # -- stages --------------------------------------------------------------
+
+    def _load(self, sources: queue.Queue, loaded: queue.Queue) -> None:
+        while not self._stop.is_set():
+            try:
+                source, loader = sources.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                docs = loader()
+            except FileNotFoundError:
+                logger.info(f"{source} no longer exists, removing its chunks")
+                docs = _MISSING
+            except Exception as e:
+                logger.warning(f"Failed to load {source}, keeping indexed copy: {e}")
+                docs = None
+            if not self._put(loaded, (source, docs)):
+                return
+        self._put(loaded, _DONE)
+
+    def _split(
+        self,
+        loaded: queue.Queue,
+        chunks: queue.Queue,
+        pending: Dict[str, Tuple[Optional[str], List[str], List[str]]],
+    ) -> None:
+        remaining = self.load_workers
+        batch: List[Tuple[str, Document]] = []
+        while remaining:
+            item = self._get(loaded)
+            if item is _DONE:
+                if self._stop.is_set():
+                    return
+                remaining -= 1
+                continue
+            source, docs = item
+            self.stats.sources += 1
+            if docs is None:
+                self.stats.failed += 1
+                continue
+            if docs is _MISSING:
+                pending[source] = (None, [], self.manifest.chunk_ids(source))
+                continue
+            source_hash = content_hash("\0".join(doc.page_content for doc in docs))
+            if self.manifest.source_hash(source) == source_hash:
+                self.stats.skipped += 1
+                continue
+            corpus = self.splitter.split_documents(docs)
+            ids = chunk_ids(source, (doc.page_content for doc in corpus))
+            added, removed = self.manifest.diff_source(source, ids)
+            # Stale chunks are deleted only once the new ones are written
+            pending[source] = (source_hash, ids, removed)
+            by_id = dict(zip(ids, corpus))
+            for cid in added:
+                batch.append((cid, by_id[cid]))
+                if len(batch) >= self.embed_batch_size:
+                    if not self._put(chunks, batch):
+                        return
+                    batch = []
+        if batch:
+            self._put(chunks, batch)
+        for _ in range(self.embed_workers):
+            self._put(chunks, _DONE)
+
+    def _embedded(self, batch, embds, tokens):
+        docs = [doc for _, doc in batch]
+        if len(embds) != len(docs):
+            raise RuntimeError(
+                f"Embedding backend returned {len(embds)} vectors "
+                f"for {len(docs)} chunks"
+            )
+        with self._lock:
+            self.stats.tokens += tokens
+        return [cid for cid, _ in batch], docs, embds
+
+    def _embed(self, chunks: queue.Queue, vectors: queue.Queue) -> None:
+        if getattr(self.embedding, "aencode", None) is not None:
+            if asyncio.run(self._aembed(chunks, vectors)):
+                self._put(vectors, _DONE)
+            return
+        while True:
+            batch = self._get(chunks)
+            if batch is _DONE:
+                break
+            embds, tokens = self.embedding.encode(
+                [doc.page_content for _, doc in batch]
+            )
+            if not self._put(vectors, self._embedded(batch, embds, tokens)):
+                return
+        self._put(vectors, _DONE)
+
+    async def _aembed(self, chunks: queue.Queue, vectors: queue.Queue) -> bool:
+        """
+        Embed stage for backends with `aencode`: up to `embed_concurrency`
+        batches in flight. False when the pipeline stopped early.
+        """
+        slots = asyncio.Semaphore(self.embed_concurrency)
+
+        async def embed(batch):
+            try:
+                embds, tokens = await self.embedding.aencode(
+                    [doc.page_content for _, doc in batch]
+                )
+                item = self._embedded(batch, embds, tokens)
+                await asyncio.to_thread(self._put, vectors, item)
+            except BaseException:
+                # Unblock the queue reads still waiting in worker threads
+                self._stop.set()
+                raise
+            finally:
+                slots.release()
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                while True:
+                    await slots.acquire()
+                    batch = await asyncio.to_thread(self._get, chunks)
+                    if batch is _DONE:
+                        break
+                    tg.create_task(embed(batch))
+        except BaseExceptionGroup as group:
+            # Report the failing batch's own error, like the sync stage
+            raise group.exceptions[0]
+        return not self._stop.is_set()
+
+    def _upsert(self, vectors: queue.Queue) -> None:
+        remaining = self.embed_workers
+        while remaining:
+            item = self._get(vectors)
+            if item is _DONE:
+                if self._stop.is_set():
+                    return
+                remaining -= 1
+                continue
+            ids, docs, embds = item
+            self.sink.upsert(ids, docs, embds)
+            self.stats.embedded += len(ids)
+
+    def run(self, sources: List[Tuple[str, SourceLoader]]) -> IngestionStats:
+        """
+        Ingest `sources`, given as (source key, loader) pairs. Raises the
+        first stage error, in which case the manifest is left untouched and
+        no chunk is deleted.
+        """
+        self.stats = IngestionStats()
+        self._stop.clear()
+        self._errors = []
+        source_q: queue.Queue = queue.Queue()
+        for item in sources:
+            source_q.put(item)
+        loaded_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        chunk_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        vector_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        pending: Dict[str, Tuple[Optional[str], List[str], List[str]]] = {}
+
+        threads = [
+            self._stage(self._load, source_q, loaded_q)
+            for _ in range(self.load_workers)
+        ]
+        threads.append(self._stage(self._split, loaded_q, chunk_q, pending))
+        threads.extend(
+            self._stage(self._embed, chunk_q, vector_q)
+            for _ in range(self.embed_workers)
+        )
+        threads.append(self._stage(self._upsert, vector_q))
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+        for source, (source_hash, ids, removed) in pending.items():
+            self.sink.delete(removed)
+            self.stats.removed += len(removed)
+            if source_hash is None:
+                self.manifest.remove_source(source)
+            else:
+                self.manifest.set_source(source, source_hash, ids)
+        return self.stats
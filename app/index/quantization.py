@@ -0,0 +1,170 @@
+from typing import Optional
+
+import numpy as np
+
+
+class ScalarQuantizer:
+    """
+    int8 scalar quantization with a per-dimension range (4x smaller than
+    float32).
+
+    Each dimension is mapped linearly from [lo, hi] onto the 256 int8
+    levels. An inner product is then estimated directly from the codes:
+    q . x ~= q . lo + (q * scale) . (code + 128).
+    """
+
+    name = "int8"
+    code_dtype = np.int8
+
+    def __init__(
+        self, lo: Optional[np.ndarray] = None, scale: Optional[np.ndarray] = None
+    ):
+        self.lo = lo
+        self.scale = scale
+
+    def fit(self, vectors: np.ndarray) -> "ScalarQuantizer":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.lo = vectors.min(axis=0)
+        span = vectors.max(axis=0) - self.lo
+        self.scale = np.where(span > 0, span / 255.0, 1.0).astype(np.float32)
+        return self
+
+    def code_size(self, dim: int) -> int:
+        return dim
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.lo) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.lo + self.scale * (codes.astype(np.float32) + 128)
+
+    def prepare(self, queries: np.ndarray):
+        scaled = queries * self.scale
+        # The +128 of every code is folded into the per-query offset
+        return scaled, queries @ self.lo + 128 * scaled.sum(axis=1)
+
+    def scores(self, prepared, codes: np.ndarray) -> np.ndarray:
+        scaled, offset = prepared
+        return scaled @ codes.astype(np.float32).T + offset[:, None]
+
+    def state(self) -> dict:
+        return {"lo": self.lo, "scale": self.scale}
+
+    @classmethod
+    def from_state(cls, state) -> "ScalarQuantizer":
+        return cls(state["lo"], state["scale"])
+
+
+class ProductQuantizer:
+    """
+    Product quantization: the vector is cut into `subspaces` equal slices and
+    each slice is replaced by the id of its nearest of 256 k-means centroids,
+    one byte per slice (32x smaller than float32 with 8 dims per slice).
+
+    Inner products are estimated asymmetrically: per query, a table of
+    slice-centroid products is computed once and the codes only index it.
+    """
+
+    name = "pq"
+    code_dtype = np.uint8
+
+    def __init__(
+        self,
+        subspaces: Optional[int] = None,
+        iterations: int = 15,
+        train_size: int = 20000,
+        seed: int = 0,
+        centroids: Optional[np.ndarray] = None,
+    ):
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = centroids  # (subspaces, ksub, dsub)
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        n, dim = vectors.shape
+        return vectors.reshape(n, self.subspaces, dim // self.subspaces)
+
+    def fit(self, vectors: np.ndarray) -> "ProductQuantizer":
+        dim = vectors.shape[1]
+        if self.subspaces is None:
+            self.subspaces = max(1, dim // 8)
+        if dim % self.subspaces:
+            raise ValueError(
+                f"Embedding dimension {dim} is not divisible by {self.subspaces} PQ subspaces"
+            )
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.train_size:
+            sample = np.sort(rng.choice(len(vectors), self.train_size, replace=False))
+            vectors = vectors[sample]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ksub = min(256, len(vectors))
+        sliced = self._split(vectors)
+        centroids = []
+        for j in range(self.subspaces):
+            data = sliced[:, j, :]
+            cents = data[rng.choice(len(data), ksub, replace=False)].copy()
+            for _ in range(self.iterations):
+                assign = self._nearest(data, cents)
+                sums = np.zeros_like(cents)
+                np.add.at(sums, assign, data)
+                counts = np.bincount(assign, minlength=ksub)[:, None]
+                cents = np.where(counts > 0, sums / np.maximum(counts, 1), cents)
+            centroids.append(cents)
+        self.centroids = np.stack(centroids).astype(np.float32)
+        return self
+
+    @staticmethod
+    def _nearest(data: np.ndarray, cents: np.ndarray) -> np.ndarray:
+        dists = (
+            (data**2).sum(1)[:, None] - 2 * data @ cents.T + (cents**2).sum(1)[None, :]
+        )
+        return np.argmin(dists, axis=1)
+
+    def code_size(self, dim: int) -> int:
+        return self.subspaces
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sliced = self._split(np.asarray(vectors, dtype=np.float32))
+        codes = np.empty((len(sliced), self.subspaces), dtype=np.uint8)
+        for j in range(self.subspaces):
+            codes[:, j] = self._nearest(sliced[:, j, :], self.centroids[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.centroids[j][codes[:, j]] for j in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def prepare(self, queries: np.ndarray) -> np.ndarray:
+        # (n_queries, subspaces, ksub) lookup table
+        return np.einsum("qjd,jkd->qjk", self._split(queries), self.centroids)
+
+    def scores(self, tables: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        out = np.zeros((tables.shape[0], len(codes)), dtype=np.float32)
+        for j in range(self.subspaces):
+            out += tables[:, j, codes[:, j]]
+        return out
+
+    def state(self) -> dict:
+        return {"centroids": self.centroids}
+
+    @classmethod
+    def from_state(cls, state) -> "ProductQuantizer":
+        centroids = state["centroids"]
+        return cls(subspaces=centroids.shape[0], centroids=centroids)
+
+
+QUANTIZERS = {
+    ScalarQuantizer.name: ScalarQuantizer,
+    ProductQuantizer.name: ProductQuantizer,
+}
+
+
+def make_quantizer(name: str, **kwargs):
+    if name not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization: {name}")
+    if name == ProductQuantizer.name:
+        return ProductQuantizer(**kwargs)
+    return ScalarQuantizer()
@@ -1,45 +1,84 @@
 import importlib
-import inspect
+from collections.abc import Mapping
+from typing import Dict, Iterator
 
 
-ChatModel = globals().get("ChatModel", {})
-CvModel = globals().get("CvModel", {})
-EmbeddingModel = globals().get("EmbeddingModel", {})
-RerankModel = globals().get("RerankModel", {})
+class LazyRegistry(Mapping):
+    """
+    Maps a backend's `_FACTORY_NAME` to its class without importing it.
 
+    Entries are "module:ClassName" paths relative to this package; the
+    backend module (and the SDK it wraps) is only imported on the first
+    lookup of one of its names. Lookups fall back to a case-insensitive
+    match, so EMBEDDING_MODEL_TYPE=openai finds "OpenAI".
+    """
 
-MODULE_MAPPING = {
-    "chat_model": ChatModel,
-    "cv_model": CvModel,
-    "embedding_model": EmbeddingModel,
-    "rerank_model": RerankModel,
-}
+    def __init__(self, entries: Dict[str, str]):
+        self._entries = dict(entries)
+        self._loaded: Dict[str, type] = {}
 
-package_name = __name__
+    def register(self, factory_name: str, target) -> None:
+        """Register a class, or a "module:ClassName" path to import lazily."""
+        if isinstance(target, str):
+            self._entries[factory_name] = target
+            self._loaded.pop(factory_name, None)
+        else:
+            self._entries[factory_name] = f"{target.__module__}:{target.__qualname__}"
+            self._loaded[factory_name] = target
 
-for module_name, mapping_dict in MODULE_MAPPING.items():
-    full_module_name = f"{package_name}.{module_name}"
-    module = importlib.import_module(full_module_name)
+    def _resolve_name(self, factory_name: str) -> str:
+        if factory_name in self._entries:
+            return factory_name
+        if isinstance(factory_name, str):
+            for name in self._entries:
+                if name.lower() == factory_name.lower():
+                    return name
+        raise KeyError(factory_name)
 
-    base_class = None
-    for name, obj in inspect.getmembers(module):
-        if inspect.isclass(obj) and name == "Base":
-            base_class = obj
-            break
-    if base_class is None:
-        continue
+    def __getitem__(self, factory_name: str) -> type:
+        name = self._resolve_name(factory_name)
+        cls = self._loaded.get(name)
+        if cls is None:
+            module_path, _, class_name = self._entries[name].partition(":")
+            if not module_path.startswith("app."):
+                module_path = f"{__name__}.{module_path}"
+            cls = getattr(importlib.import_module(module_path), class_name)
+            self._loaded[name] = cls
+        return cls
 
-    for _, obj in inspect.getmembers(module):
-        if inspect.isclass(obj) and issubclass(obj, base_class) and obj is not base_class and hasattr(obj, "_FACTORY_NAME"):
-            if isinstance(obj._FACTORY_NAME, list):
-                for factory_name in obj._FACTORY_NAME:
-                    mapping_dict[factory_name] = obj
-            else:
-                mapping_dict[obj._FACTORY_NAME] = obj
+    def __contains__(self, factory_name) -> bool:
+        try:
+            self._resolve_name(factory_name)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+ChatModel = LazyRegistry({})
+
+CvModel = LazyRegistry({})
+
+EmbeddingModel = LazyRegistry(
+    {
+        "OpenAI": "embedding_model:OpenAIEmbed",
+        "LocalAI": "embedding_model:LocalAIEmbed",
+        "Tongyi-Qianwen": "embedding_model:QWenEmbed",
+        "Ollama": "embedding_model:OllamaEmbed",
+    }
+)
+
+RerankModel = LazyRegistry({})
 
 __all__ = [
     "ChatModel",
     "CvModel",
     "EmbeddingModel",
     "RerankModel",
+    "LazyRegistry",
 ]
@@ -1,8 +1,4 @@
-from langchain_openai import ChatOpenAI
-from langchain_deepseek import ChatDeepSeek
-from langchain_litellm import ChatLiteLLM
-
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from typing import Literal
 from app.config import (
     REASONING_MODEL,
@@ -15,22 +11,45 @@ from app.config import (
     VL_BASE_URL,
     VL_API_KEY,
 )
+from .http_pool import async_client, sync_client
+from .scheduler import SchedulerCallback, SchedulerRateLimiter, get_scheduler
+
+# Provider integrations are imported on first use, so only the backend
+# actually configured is loaded
+if TYPE_CHECKING:
+    from langchain_deepseek import ChatDeepSeek
+    from langchain_openai import ChatOpenAI
 
 LLMType = Literal["basic", "reasoning", "vision"]
 
 
+def _pooled_clients() -> dict:
+    """
+    The shared keep-alive HTTP clients (see `http_pool`), so every chat
+    model reuses the same connections; callers may pass their own.
+    """
+    return {"http_client": sync_client(), "http_async_client": async_client()}
+
+
 def create_openai_llm(
     model: str,
     base_url: Optional[str] = None,
     api_key: Optional[str] = None,
     temperature: float = 0.0,
     **kwargs,
-) -> ChatOpenAI:
+) -> "ChatOpenAI":
     """
     Create a ChatOpenAI instance with the specified configuration
     """
+    from langchain_openai import ChatOpenAI
+
     # Only include base_url in the arguments if it's not None or empty
-    llm_kwargs = {"model": model, "temperature": temperature, **kwargs}
+    llm_kwargs = {
+        "model": model,
+        "temperature": temperature,
+        **_pooled_clients(),
+        **kwargs,
+    }
 
     if base_url:  # This will handle None or empty string
         llm_kwargs["base_url"] = base_url
@@ -47,12 +66,19 @@ def create_deepseek_llm(
     api_key: Optional[str] = None,
     temperature: float = 0.0,
     **kwargs,
-) -> ChatDeepSeek:
+) -> "ChatDeepSeek":
     """
     Create a ChatDeepSeek instance with the specified configuration
     """
+    from langchain_deepseek import ChatDeepSeek
+
     # Only include base_url in the arguments if it's not None or empty
-    llm_kwargs = {"model": model, "temperature": temperature, **kwargs}
+    llm_kwargs = {
+        "model": model,
+        "temperature": temperature,
+        **_pooled_clients(),
+        **kwargs,
+    }
 
     if base_url:  # This will handle None or empty string
         llm_kwargs["api_base"] = base_url
@@ -64,10 +90,26 @@ def create_deepseek_llm(
 
 
 # Cache for LLM instances
-_llm_cache: dict[LLMType, ChatOpenAI | ChatDeepSeek] = {}
+_llm_cache: dict[LLMType, "ChatOpenAI | ChatDeepSeek"] = {}
+
+
+def _scheduling_kwargs(llm_type: LLMType) -> dict:
+    """
+    Route a client through the shared scheduler of its endpoint
+    (RATE_LIMIT_<LLM_TYPE>_* settings): the request and token buckets gate
+    every call, and in-flight requests and usage are tracked. Retries stay
+    with the SDK, which backs off with jitter and honours Retry-After, within
+    the scheduler's retry budget.
+    """
+    scheduler = get_scheduler(llm_type)
+    return {
+        "rate_limiter": SchedulerRateLimiter(scheduler),
+        "callbacks": [SchedulerCallback(scheduler)],
+        "max_retries": scheduler.max_retries,
+    }
 
 
-def get_llm(llm_type: LLMType) -> ChatOpenAI | ChatDeepSeek:
+def get_llm(llm_type: LLMType) -> "ChatOpenAI | ChatDeepSeek":
     """
     Get LLM instance by type. Returns cached instance if available.
     """
@@ -79,18 +121,21 @@ def get_llm(llm_type: LLMType) -> ChatOpenAI | ChatDeepSeek:
             model=REASONING_MODEL,
             base_url=REASONING_BASE_URL,
             api_key=REASONING_API_KEY,
+            **_scheduling_kwargs(llm_type),
         )
     elif llm_type == "basic":
         llm = create_openai_llm(
             model=BASIC_MODEL,
             base_url=BASIC_BASE_URL,
             api_key=BASIC_API_KEY,
+            **_scheduling_kwargs(llm_type),
         )
     elif llm_type == "vision":
         llm = create_openai_llm(
             model=VL_MODEL,
             base_url=VL_BASE_URL,
             api_key=VL_API_KEY,
+            **_scheduling_kwargs(llm_type),
         )
     else:
         raise ValueError(f"Unknown LLM type: {llm_type}")
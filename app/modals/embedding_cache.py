@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .embedding_model import Base
+
+logger = logging.getLogger(__name__)
+
+
+class DiskVectorCache:
+    """
+    Size-bounded, LRU-evicted vector store on local disk, backed by SQLite.
+
+    Vectors are stored as float32 blobs. Once the stored payload exceeds
+    `max_bytes`, the least recently read entries are evicted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "embeddings.sqlite3")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS vectors_accessed ON vectors (accessed)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM vectors"
+        ).fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({marks})", part
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                self._conn.executemany(
+                    "UPDATE vectors SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, np.asarray(vec, dtype=np.float32).tobytes(), now)
+            for key, vec in items.items()
+        ]
+        with self._lock:
+            marks = ",".join("?" * len(rows))
+            replaced = self._conn.execute(
+                f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM vectors "
+                f"WHERE key IN ({marks})",
+                [r[0] for r in rows],
+            ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector, accessed) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            self._size += sum(len(r[1]) for r in rows) - replaced
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes:
+            victims = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM vectors " "ORDER BY accessed LIMIT 256"
+            ).fetchall()
+            if not victims:
+                self._size = 0
+                return
+            dropped = []
+            for key, size in victims:
+                dropped.append((key,))
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM vectors WHERE key = ?", dropped)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class _HotCache:
+    """In-memory LRU of recent query vectors."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._items.get(key)
+            if vec is not None:
+                self._items.move_to_end(key)
+            return vec
+
+    def put(self, key: str, vec: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._items[key] = vec
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+class CachedEmbed(Base):
+    """
+    Content-addressed cache in front of any `EmbeddingModel` backend.
+
+    Vectors are keyed by (factory name, model name, text kind, text hash).
+    The text kind separates document and query embeddings, which some
+    backends (e.g. Tongyi-Qianwen) compute differently. `encode` only sends
+    cache misses to the wrapped backend; `encode_queries` additionally goes
+    through an in-memory hot tier, and `aencode` is the async `encode`.
+    Cached vectors are returned as float32, and cache hits report no token
+    usage.
+    """
+
+    def __init__(
+        self,
+        model: Base,
+        factory_name: str,
+        cache_dir: str,
+        max_bytes: int = 1 << 30,
+        hot_entries: int = 4096,
+    ):
+        self.model = model
+        self.factory_name = factory_name
+        self.model_name = getattr(model, "model_name", "")
+        self.disk = DiskVectorCache(cache_dir, max_bytes=max_bytes)
+        self.hot = _HotCache(hot_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.factory_name}\0{self.model_name}\0{kind}\0{text_hash}"
+
+    def _lookup(self, texts: list):
+        keys = [self._key("document", t) for t in texts]
+        found = self.disk.get_many(list(set(keys)))
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return keys, found, missing
+
+    def _merge(self, keys, found, missing, vectors):
+        if missing:
+            if len(vectors) != len(missing):
+                raise RuntimeError(
+                    f"Embedding backend returned {len(vectors)} vectors "
+                    f"for {len(missing)} texts"
+                )
+            fresh = {
+                key: np.asarray(vec, dtype=np.float32)
+                for key, vec in zip(missing, vectors)
+            }
+            self.disk.put_many(fresh)
+            found.update(fresh)
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def encode(self, texts: list):
+        keys, found, missing = self._lookup(texts)
+        vectors, token_count = [], 0
+        if missing:
+            vectors, token_count = self.model.encode(list(missing.values()))
+        return self._merge(keys, found, missing, vectors), token_count
+
+    async def aencode(self, texts: list, concurrency: int = 4):
+        """
+        Async `encode`: misses go through the backend's `aencode` when it
+        has one, else its `encode` in a worker thread.
+        """
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts)
+        vectors, token_count = [], 0
+        if missing:
+            aencode = getattr(self.model, "aencode", None)
+            if aencode is not None:
+                vectors, token_count = await aencode(
+                    list(missing.values()), concurrency=concurrency
+                )
+            else:
+                vectors, token_count = await asyncio.to_thread(
+                    self.model.encode, list(missing.values())
+                )
+        merged = await asyncio.to_thread(self._merge, keys, found, missing, vectors)
+        return merged, token_count
+
+    def encode_queries(self, text: str):
+        key = self._key("query", text)
+        vec = self.hot.get(key)
+        if vec is None:
+            vec = self.disk.get_many([key]).get(key)
+            if vec is not None:
+                self.hot.put(key, vec)
+        if vec is not None:
+            self.hits += 1
+            return vec, 0
+
+        self.misses += 1
+        res = self.model.encode_queries(text)
+        if res is None:
+            return None
+        vec, token_count = res
+        vec = np.asarray(vec, dtype=np.float32)
+        self.disk.put_many({key: vec})
+        self.hot.put(key, vec)
+        return vec, token_count
+
+    def encode_queries_batch(self, texts: list):
+        keys = [self._key("query", t) for t in texts]
+        found = {}
+        for key in keys:
+            vec = self.hot.get(key)
+            if vec is not None:
+                found[key] = vec
+        from_disk = self.disk.get_many([k for k in set(keys) if k not in found])
+        for key, vec in from_disk.items():
+            self.hot.put(key, vec)
+        found.update(from_disk)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        token_count = 0
+        if missing:
+            vectors, token_count = self.model.encode_queries_batch(
+                list(missing.values())
+            )
+            fresh = {
+                key: np.asarray(vec, dtype=np.float32)
+                for key, vec in zip(missing, vectors)
+            }
+            self.disk.put_many(fresh)
+            for key, vec in fresh.items():
+                self.hot.put(key, vec)
+            found.update(fresh)
+        return np.stack([found[key] for key in keys]), token_count
+
+
+def cached_embedding_model(
+    factory_name: str,
+    key,
+    model_name: str,
+    base_url: Optional[str] = None,
+    *,
+    cache_dir: str,
+    **cache_kwargs,
+) -> CachedEmbed:
+    """
+    Build the `EmbeddingModel` backend registered as `factory_name` and wrap
+    it in a `CachedEmbed`.
+    """
+    from . import EmbeddingModel
+
+    model_cls = EmbeddingModel.get(factory_name)
+    if model_cls is None:
+        raise ValueError(f"Unknown embedding model type: {factory_name}")
+    model = model_cls(key, model_name, base_url=base_url)
+    return CachedEmbed(model, factory_name, cache_dir, **cache_kwargs)
@@ -1,23 +1,27 @@
+import asyncio
+import functools
 import json
 import logging
 import os
 import re
 import threading
 from abc import ABC
+from typing import Callable, List
 from urllib.parse import urljoin
 
-import dashscope
 import numpy as np
 import requests
 
-from ollama import Client
-from openai import OpenAI
+from . import http_pool
+from .scheduler import ProviderError, ProviderScheduler, get_scheduler
+
+# Provider SDKs (openai, dashscope, ollama) are imported by the backend that
+# needs them, so loading this module doesn't pull in every SDK.
 
 # --- Utility Functions ---
 # Configure logging
 logging.basicConfig(
-    format='%((asctime)s)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    format="%((asctime)s)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 
 
@@ -51,16 +55,106 @@ def log_exception(exc: Exception, resp=None) -> None:
     logging.exception(exc)
 
 
+@functools.lru_cache(maxsize=1)
+def _token_encoder():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def num_tokens(text: str) -> int:
+    """
+    Token count of `text` with the cl100k_base encoding, or a rough
+    4-characters-per-token estimate when tiktoken is not available.
+    """
+    encoder = _token_encoder()
+    if encoder is None:
+        return len(text) // 4 + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    The longest prefix of `text` within `max_tokens` tokens, by the same
+    count as `num_tokens`.
+    """
+    encoder = _token_encoder()
+    if encoder is None:
+        return text[: max(0, max_tokens - 1) * 4]
+    tokens = encoder.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoder.decode(tokens[:max_tokens])
+
+
+def pack_batches(
+    texts: List[str],
+    max_tokens: int,
+    max_items: int,
+    count_tokens: Callable[[str], int] = num_tokens,
+) -> List[List[int]]:
+    """
+    Group consecutive texts into batches of at most `max_items` texts and
+    `max_tokens` tokens, returned as lists of indices into `texts`. A text
+    that alone exceeds the budget gets a batch of its own.
+    """
+    batches = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (
+            current_tokens + tokens > max_tokens or len(current) >= max_items
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
 class Base(ABC):
     def __init__(self, key, model_name):
         pass
 
+    @property
+    def scheduler(self) -> ProviderScheduler:
+        """
+        The shared rate-limit scheduler every request of this backend goes
+        through, see `ProviderScheduler`.
+        """
+        return get_scheduler(getattr(self, "_FACTORY_NAME", type(self).__name__))
+
+    def _token_estimate(self, texts: List[str]) -> int:
+        # Only worth counting when a tokens-per-minute budget applies
+        if self.scheduler.tokens is None:
+            return 0
+        return sum(num_tokens(t) for t in texts)
+
     def encode(self, texts: list):
         raise NotImplementedError("Please implement encode method!")
 
     def encode_queries(self, text: str):
         raise NotImplementedError("Please implement encode method!")
 
+    def encode_queries_batch(self, texts: list):
+        """
+        Query embeddings of several texts, as (vectors, total tokens).
+        Backends whose query and document embeddings are the same, or that
+        accept a query batch, override this with a single request.
+        """
+        vectors, total_tokens = [], 0
+        for text in texts:
+            res = self.encode_queries(text)
+            if res is None:
+                raise RuntimeError("Embedding backend returned no query vector")
+            vectors.append(res[0])
+            total_tokens += res[1]
+        return np.array(vectors), total_tokens
+
     def total_token_count(self, resp):
         try:
             return resp.usage.total_tokens
@@ -72,16 +166,97 @@ class Base(ABC):
             pass
         return 0
 
+    def token_count(self, resp, texts: List[str]) -> int:
+        """
+        Tokens reported in `resp`, or counted locally when the server does
+        not report usage (many local servers send none, or zero).
+        """
+        return self.total_token_count(resp) or sum(num_tokens(t) for t in texts)
+
+
+class _AsyncOpenAIEncodeMixin:
+    """
+    Concurrent `aencode` for backends speaking the OpenAI embeddings API.
+
+    Texts are packed into batches by token budget and up to `concurrency`
+    batches are in flight at once. Vectors come back in input order; a
+    batch that fails or returns the wrong number of vectors raises instead
+    of producing a short array.
+    """
+
+    batch_token_budget = 65536
+    max_batch_size = 256
+
+    async def aencode(self, texts: list, concurrency: int = 4):
+        batches = pack_batches(texts, self.batch_token_budget, self.max_batch_size)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def embed(indices):
+            batch = [texts[i] for i in indices]
+            async with semaphore:
+                res = await self.scheduler.acall(
+                    self.async_client.embeddings.create,
+                    input=batch,
+                    model=self.model_name,
+                    tokens=self._token_estimate(batch),
+                )
+            data = sorted(res.data, key=lambda d: d.index)
+            if len(data) != len(indices):
+                raise RuntimeError(
+                    f"Embedding batch returned {len(data)} vectors "
+                    f"for {len(indices)} texts"
+                )
+            return indices, [d.embedding for d in data], self.token_count(res, batch)
+
+        # A failing batch cancels the ones still in flight
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(embed(indices)) for indices in batches]
+        except BaseExceptionGroup as group:
+            raise group.exceptions[0]
+        ress = [None] * len(texts)
+        total_tokens = 0
+        for task in tasks:
+            indices, vectors, tokens = task.result()
+            for i, vector in zip(indices, vectors):
+                ress[i] = vector
+            total_tokens += tokens
+        return np.array(ress), total_tokens
+
 
-class OpenAIEmbed(Base):
+class OpenAIEmbed(_AsyncOpenAIEncodeMixin, Base):
     _FACTORY_NAME = "OpenAI"
 
-    def __init__(self, key, model_name="text-embedding-ada-002", base_url="https://api.openai.com/v1"):
+    def __init__(
+        self,
+        key,
+        model_name="text-embedding-ada-002",
+        base_url="https://api.openai.com/v1",
+    ):
+        from openai import AsyncOpenAI, OpenAI
+
         if not base_url:
             base_url = "https://api.openai.com/v1"
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        # Retries are left to the shared scheduler, connections to the
+        # shared pool
+        self.client = OpenAI(
+            api_key=key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_pool.sync_client(),
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_pool.async_client(),
+        )
         self.model_name = model_name
 
+    async def aencode(self, texts: list, concurrency: int = 4):
+        texts = [truncate(t, 8191) for t in texts]
+        return await super().aencode(texts, concurrency=concurrency)
+
     def encode(self, texts: list):
         # OpenAI requires batch size <=16
         batch_size = 16
@@ -89,8 +264,13 @@ class OpenAIEmbed(Base):
         ress = []
         total_tokens = 0
         for i in range(0, len(texts), batch_size):
-            res = self.client.embeddings.create(
-                input=texts[i: i + batch_size], model=self.model_name)
+            batch = texts[i : i + batch_size]
+            res = self.scheduler.call(
+                self.client.embeddings.create,
+                input=batch,
+                model=self.model_name,
+                tokens=self._token_estimate(batch),
+            )
             try:
                 ress.extend([d.embedding for d in res.data])
                 total_tokens += self.total_token_count(res)
@@ -99,38 +279,72 @@ class OpenAIEmbed(Base):
         return np.array(ress), total_tokens
 
     def encode_queries(self, text):
-        res = self.client.embeddings.create(
-            input=[truncate(text, 8191)], model=self.model_name)
+        text = truncate(text, 8191)
+        res = self.scheduler.call(
+            self.client.embeddings.create,
+            input=[text],
+            model=self.model_name,
+            tokens=self._token_estimate([text]),
+        )
         return np.array(res.data[0].embedding), self.total_token_count(res)
 
+    def encode_queries_batch(self, texts: list):
+        return self.encode(texts)
+
 
-class LocalAIEmbed(Base):
+class LocalAIEmbed(_AsyncOpenAIEncodeMixin, Base):
     _FACTORY_NAME = "LocalAI"
 
+    # Local servers usually run with a small embedding context
+    batch_token_budget = 4096
+    max_batch_size = 64
+
     def __init__(self, key, model_name, base_url):
         if not base_url:
             raise ValueError("Local embedding model url cannot be None")
+        from openai import AsyncOpenAI, OpenAI
+
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key="empty", base_url=base_url)
+        self.client = OpenAI(
+            api_key="empty",
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_pool.sync_client(),
+        )
+        self.async_client = AsyncOpenAI(
+            api_key="empty",
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_pool.async_client(),
+        )
         self.model_name = model_name.split("___")[0]
 
     def encode(self, texts: list):
         batch_size = 16
         ress = []
+        total_tokens = 0
         for i in range(0, len(texts), batch_size):
-            res = self.client.embeddings.create(
-                input=texts[i: i + batch_size], model=self.model_name)
+            batch = texts[i : i + batch_size]
+            res = self.scheduler.call(
+                self.client.embeddings.create,
+                input=batch,
+                model=self.model_name,
+                tokens=self._token_estimate(batch),
+            )
             try:
                 ress.extend([d.embedding for d in res.data])
+                total_tokens += self.token_count(res, batch)
             except Exception as _e:
                 log_exception(_e, res)
-        # local embedding for LmStudio do not count tokens
-        return np.array(ress), 1024
+        return np.array(ress), total_tokens
 
     def encode_queries(self, text):
         embds, cnt = self.encode([text])
         return np.array(embds[0]), cnt
 
+    def encode_queries_batch(self, texts: list):
+        return self.encode(texts)
+
 
 class QWenEmbed(Base):
     _FACTORY_NAME = "Tongyi-Qianwen"
@@ -140,26 +354,45 @@ class QWenEmbed(Base):
         self.model_name = model_name
 
     def encode(self, texts: list):
-        import time
+        return self._encode(texts, "document")
+
+    def encode_queries_batch(self, texts: list):
+        return self._encode(texts, "query")
+
+    def _call(self, texts, text_type: str):
+        """
+        One dashscope request; a reply without embeddings raises a
+        `ProviderError` so the scheduler can retry it.
+        """
+        import dashscope
 
+        resp = dashscope.TextEmbedding.call(
+            model=self.model_name, input=texts, api_key=self.key, text_type=text_type
+        )
+        if resp.get("output") is None or resp["output"].get("embeddings") is None:
+            code = getattr(resp, "status_code", None)
+            raise ProviderError(
+                resp.get("message") or "calling embedding model failed",
+                # Throttling and server errors carry their status; an empty
+                # 200 reply is treated as transient
+                status_code=503 if code in (None, 200) else code,
+            )
+        return resp
+
+    def _encode(self, texts: list, text_type: str):
         batch_size = 4
         res = []
         token_count = 0
         texts = [truncate(t, 2048) for t in texts]
         for i in range(0, len(texts), batch_size):
-            retry_max = 5
-            resp = dashscope.TextEmbedding.call(
-                model=self.model_name, input=texts[i: i + batch_size], api_key=self.key, text_type="document")
-            while (resp.get("output") is None or resp["output"].get("embeddings") is None) and retry_max > 0:
-                time.sleep(10)
-                resp = dashscope.TextEmbedding.call(
-                    model=self.model_name, input=texts[i: i + batch_size], api_key=self.key, text_type="document")
-                retry_max -= 1
-            if retry_max == 0 and (resp.get("output") is None or resp["output"].get("embeddings") is None):
-                msg = resp.get(
-                    "message", "Retry_max reached, calling embedding model failed")
-                log_exception(ValueError(f"Retry_max reached: {msg}"))
-                raise RuntimeError(msg)
+            batch = texts[i : i + batch_size]
+            try:
+                resp = self.scheduler.call(
+                    self._call, batch, text_type, tokens=self._token_estimate(batch)
+                )
+            except ProviderError as e:
+                log_exception(e)
+                raise
             try:
                 embds = [[] for _ in range(len(resp["output"]["embeddings"]))]
                 for e in resp["output"]["embeddings"]:
@@ -172,45 +405,132 @@ class QWenEmbed(Base):
         return np.array(res), token_count
 
     def encode_queries(self, text):
-        resp = dashscope.TextEmbedding.call(
-            model=self.model_name, input=text[:2048], api_key=self.key, text_type="query")
+        text = text[:2048]
+        resp = self.scheduler.call(
+            self._call, text, "query", tokens=self._token_estimate([text])
+        )
         try:
-            return np.array(resp["output"]["embeddings"][0]["embedding"]), self.total_token_count(resp)
+            return np.array(
+                resp["output"]["embeddings"][0]["embedding"]
+            ), self.total_token_count(resp)
         except Exception as _e:
             log_exception(_e, resp)
 
 
 class OllamaEmbed(Base):
+    """
+    Ollama embeddings through the batched /api/embed endpoint.
+
+    `encode` sends `batch_size` texts per request with up to `concurrency`
+    requests in flight (defaults: $OLLAMA_EMBED_BATCH_SIZE or 32,
+    $OLLAMA_EMBED_CONCURRENCY or 2; the server only runs requests in
+    parallel up to its OLLAMA_NUM_PARALLEL). Token counts are the server's
+    prompt_eval_count. Servers older than /api/embed get one legacy
+    /api/embeddings request per text.
+    """
+
     _FACTORY_NAME = "Ollama"
 
     _special_tokens = ["<|endoftext|>"]
 
-    def __init__(self, key, model_name, **kwargs):
-        self.client = Client(host=kwargs.get("base_url")) if not key or key == "x" else Client(
-            host=kwargs.get("base_url"), headers={"Authorization": f"Bear {key}"})
+    def __init__(self, key, model_name, batch_size=None, concurrency=None, **kwargs):
+        from ollama import Client
+
+        pooled = {
+            "transport": http_pool.shared_transport(),
+            "mounts": http_pool.shared_mounts(),
+            "timeout": http_pool.timeout(),
+        }
+        self.client = (
+            Client(host=kwargs.get("base_url"), **pooled)
+            if not key or key == "x"
+            else Client(
+                host=kwargs.get("base_url"),
+                headers={"Authorization": f"Bear {key}"},
+                **pooled,
+            )
+        )
         self.model_name = model_name
+        self.batch_size = max(
+            1, int(batch_size or os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32"))
+        )
+        self.concurrency = max(
+            1, int(concurrency or os.getenv("OLLAMA_EMBED_CONCURRENCY", "2"))
+        )
+        self._legacy = False
+
+    @classmethod
+    def _clean(cls, text: str) -> str:
+        for token in cls._special_tokens:
+            text = text.replace(token, "")
+        return text
+
+    def _embed_legacy(self, texts: List[str]):
+        vectors = []
+        for text in texts:
+            res = self.scheduler.call(
+                self.client.embeddings,
+                prompt=text,
+                model=self.model_name,
+                options={"use_mmap": True},
+                keep_alive=-1,
+                tokens=self._token_estimate([text]),
+            )
+            vectors.append(res["embedding"])
+        return vectors, sum(num_tokens(t) for t in texts)
+
+    def _embed(self, texts: List[str]):
+        """
+        One batch as (vectors, tokens).
+        """
+        from ollama import ResponseError
+
+        if not self._legacy:
+            try:
+                res = self.scheduler.call(
+                    self.client.embed,
+                    input=texts,
+                    model=self.model_name,
+                    options={"use_mmap": True},
+                    keep_alive=-1,
+                    tokens=self._token_estimate(texts),
+                )
+            except ResponseError as e:
+                if e.status_code != 404 or "model" in str(e.error).lower():
+                    raise
+                log("Ollama server has no /api/embed, embedding one text per request")
+                self._legacy = True
+            else:
+                if len(res["embeddings"]) != len(texts):
+                    raise RuntimeError(
+                        f"Embedding batch returned {len(res['embeddings'])} vectors "
+                        f"for {len(texts)} texts"
+                    )
+                tokens = res.get("prompt_eval_count") or sum(
+                    num_tokens(t) for t in texts
+                )
+                return res["embeddings"], tokens
+        return self._embed_legacy(texts)
 
     def encode(self, texts: list):
-        arr = []
-        tks_num = 0
-        for txt in texts:
-            for token in OllamaEmbed._special_tokens:
-                txt = txt.replace(token, "")
-            res = self.client.embeddings(
-                prompt=txt, model=self.model_name, options={"use_mmap": True}, keep_alive=-1)
-            try:
-                arr.append(res["embedding"])
-            except Exception as _e:
-                log_exception(_e, res)
-            tks_num += 128
-        return np.array(arr), tks_num
+        texts = [self._clean(t) for t in texts]
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) > 1 and self.concurrency > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(min(self.concurrency, len(batches))) as pool:
+                results = list(pool.map(self._embed, batches))
+        else:
+            results = [self._embed(batch) for batch in batches]
+        arr = [vector for vectors, _ in results for vector in vectors]
+        return np.array(arr), sum(tokens for _, tokens in results)
 
     def encode_queries(self, text):
-        for token in OllamaEmbed._special_tokens:
-            text = text.replace(token, "")
-        res = self.client.embeddings(
-            prompt=text, model=self.model_name, options={"use_mmap": True}, keep_alive=-1)
-        try:
-            return np.array(res["embedding"]), 128
-        except Exception as _e:
-            log_exception(_e, res)
+        vectors, tokens = self._embed([self._clean(text)])
+        return np.array(vectors[0]), tokens
+
+    def encode_queries_batch(self, texts: list):
+        return self.encode(texts)
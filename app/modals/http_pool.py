@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from typing import Dict, Optional
+
+from app.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+POOL_CONNECTIONS = registry.gauge(
+    "rag_http_pool_connections",
+    "Connections held by the shared HTTP pool, by client (sync/async) and state.",
+)
+POOL_QUEUED = registry.gauge(
+    "rag_http_pool_queued_requests",
+    "Requests waiting for a free connection of the shared HTTP pool, by client.",
+)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _settings() -> Dict:
+    """
+    Pool settings from the environment: HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP2, the
+    HTTP_CONNECT_TIMEOUT / _READ_ / _WRITE_ / _POOL_TIMEOUT in seconds, and
+    HTTP_POOL_PROXY, the proxy of every request. Without it the usual
+    HTTP(S)_PROXY, ALL_PROXY and NO_PROXY apply (see `_proxy_mounts`).
+    """
+    http2 = os.getenv("HTTP2", "false").strip().lower() in ("1", "true", "yes", "on")
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning(
+                "HTTP2 is set but the h2 package is not installed, using HTTP/1.1"
+            )
+            http2 = False
+    return {
+        "max_connections": int(_env_float("HTTP_MAX_CONNECTIONS", 100)),
+        "max_keepalive_connections": int(
+            _env_float("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+        ),
+        "keepalive_expiry": _env_float("HTTP_KEEPALIVE_EXPIRY", 30.0),
+        "http2": http2,
+        "proxy": os.getenv("HTTP_POOL_PROXY") or None,
+        "connect_timeout": _env_float("HTTP_CONNECT_TIMEOUT", 5.0),
+        "read_timeout": _env_float("HTTP_READ_TIMEOUT", 120.0),
+        "write_timeout": _env_float("HTTP_WRITE_TIMEOUT", 30.0),
+        "pool_timeout": _env_float("HTTP_POOL_TIMEOUT", 30.0),
+    }
+
+
+def _limits(settings: Dict):
+    import httpx
+
+    return httpx.Limits(
+        max_connections=settings["max_connections"],
+        max_keepalive_connections=settings["max_keepalive_connections"],
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+
+
+def _proxy_mounts(settings: Dict, make_transport) -> Dict:
+    """
+    httpx `mounts` routing requests through the HTTP(S)_PROXY / ALL_PROXY of
+    the environment, except for NO_PROXY hosts, with one pooled transport
+    per proxy from `make_transport(proxy)`. A client given its own transport
+    no longer reads these itself. Empty when HTTP_POOL_PROXY is set.
+    """
+    if settings["proxy"]:
+        return {}
+    # The same mapping httpx builds for clients without a custom transport
+    from httpx._utils import get_environment_proxies
+
+    transports = {}
+    mounts = {}
+    for pattern, proxy in get_environment_proxies().items():
+        if proxy is not None and proxy not in transports:
+            logger.info(f"Routing {pattern} requests through proxy {proxy}")
+            transports[proxy] = make_transport(proxy)
+        mounts[pattern] = transports.get(proxy)
+    return mounts
+
+
+def timeout():
+    """
+    The connect/read/write/pool timeouts of the shared clients.
+    """
+    import httpx
+
+    settings = _settings()
+    return httpx.Timeout(
+        connect=settings["connect_timeout"],
+        read=settings["read_timeout"],
+        write=settings["write_timeout"],
+        pool=settings["pool_timeout"],
+    )
+
+
+def _make_async_transport(settings: Dict):
+    import httpx
+
+    class LoopLocalTransport(httpx.AsyncBaseTransport):
+        """
+        One pooled transport per event loop: asyncio connections cannot be
+        reused across loops, e.g. successive `asyncio.run` calls.
+        """
+
+        def __init__(self, settings: Dict):
+            self.settings = settings
+            self.transports: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+            self._lock = threading.Lock()
+
+        def for_loop(self, loop) -> "httpx.AsyncHTTPTransport":
+            with self._lock:
+                transport = self.transports.get(loop)
+                if transport is None:
+                    transport = httpx.AsyncHTTPTransport(
+                        limits=_limits(self.settings),
+                        http2=self.settings["http2"],
+                        proxy=self.settings["proxy"],
+                    )
+                    self.transports[loop] = transport
+            return transport
+
+        async def handle_async_request(self, request):
+            transport = self.for_loop(asyncio.get_running_loop())
+            return await transport.handle_async_request(request)
+
+        async def aclose(self) -> None:
+            transport = self.transports.pop(asyncio.get_running_loop(), None)
+            if transport is not None:
+                await transport.aclose()
+
+        def pools(self):
+            with self._lock:
+                return [
+                    getattr(t, "_pool", None) for t in list(self.transports.values())
+                ]
+
+    return LoopLocalTransport(settings)
+
+
+class _Pool:
+    """
+    Process-wide sync and async transports, created on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transport = None
+        self._async_transport = None
+        self._client = None
+        self._async_client = None
+        self._mounts = None
+        self._async_mounts = None
+
+    def transport(self):
+        with self._lock:
+            if self._transport is None:
+                import httpx
+
+                settings = _settings()
+                self._transport = httpx.HTTPTransport(
+                    limits=_limits(settings),
+                    http2=settings["http2"],
+                    proxy=settings["proxy"],
+                )
+                registry.collect(_collect_stats)
+            return self._transport
+
+    def async_transport(self):
+        with self._lock:
+            if self._async_transport is None:
+                self._async_transport = _make_async_transport(_settings())
+                registry.collect(_collect_stats)
+            return self._async_transport
+
+    def mounts(self) -> Dict:
+        with self._lock:
+            if self._mounts is None:
+                import httpx
+
+                settings = _settings()
+                self._mounts = _proxy_mounts(
+                    settings,
+                    lambda proxy: httpx.HTTPTransport(
+                        limits=_limits(settings),
+                        http2=settings["http2"],
+                        proxy=proxy,
+                    ),
+                )
+            return self._mounts
+
+    def async_mounts(self) -> Dict:
+        with self._lock:
+            if self._async_mounts is None:
+                settings = _settings()
+                self._async_mounts = _proxy_mounts(
+                    settings,
+                    lambda proxy: _make_async_transport({**settings, "proxy": proxy}),
+                )
+            return self._async_mounts
+
+    def client(self):
+        transport = self.transport()
+        mounts = self.mounts()
+        with self._lock:
+            if self._client is None:
+                import httpx
+
+                self._client = httpx.Client(
+                    transport=transport, mounts=mounts, timeout=timeout()
+                )
+            return self._client
+
+    def async_client(self):
+        transport = self.async_transport()
+        mounts = self.async_mounts()
+        with self._lock:
+            if self._async_client is None:
+                import httpx
+
+                self._async_client = httpx.AsyncClient(
+                    transport=transport, mounts=mounts, timeout=timeout()
+                )
+            return self._async_client
+
+    def reset(self) -> None:
+        """
+        Forget the shared clients, e.g. after a fork or when settings change.
+        """
+        with self._lock:
+            self._transport = self._async_transport = None
+            self._client = self._async_client = None
+            self._mounts = self._async_mounts = None
+
+
+_pool = _Pool()
+
+
+def shared_transport():
+    """
+    The pooled keep-alive `httpx.HTTPTransport` every sync client shares,
+    for SDKs that build their own `httpx.Client` (e.g. ollama).
+    """
+    return _pool.transport()
+
+
+def shared_async_transport():
+    """
+    Async counterpart of `shared_transport`.
+    """
+    return _pool.async_transport()
+
+
+def shared_mounts() -> Dict:
+    """
+    The environment's proxy `mounts` for a client built on
+    `shared_transport`, which would otherwise bypass HTTP(S)_PROXY.
+    """
+    return _pool.mounts()
+
+
+def sync_client():
+    """
+    The shared `httpx.Client`, for SDKs that take a ready-made client
+    (openai, langchain_openai). Headers and base URLs are per request, so
+    one client serves every provider.
+    """
+    return _pool.client()
+
+
+def async_client():
+    """
+    The shared `httpx.AsyncClient`.
+    """
+    return _pool.async_client()
+
+
+def _pool_stats(pool) -> Optional[Dict[str, int]]:
+    if pool is None:
+        return None
+    connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for c in connections if c.is_idle())
+    return {
+        "active": len(connections) - idle,
+        "idle": idle,
+        "queued": sum(1 for r in list(getattr(pool, "_requests", [])) if r.is_queued()),
+    }
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Active and idle connections and queued requests of the shared pools,
+    by client ("sync", "async"); pools not created yet are left out.
+    """
+    stats = {}
+    if _pool._transport is not None:
+        stats["sync"] = _pool_stats(getattr(_pool._transport, "_pool", None))
+    if _pool._async_transport is not None:
+        total = {"active": 0, "idle": 0, "queued": 0}
+        for pool in _pool._async_transport.pools():
+            for key, value in (_pool_stats(pool) or {}).items():
+                total[key] += value
+        stats["async"] = total
+    return {client: s for client, s in stats.items() if s is not None}
+
+
+def _collect_stats() -> None:
+    for client, stats in pool_stats().items():
+        POOL_CONNECTIONS.set(stats["active"], client=client, state="active")
+        POOL_CONNECTIONS.set(stats["idle"], client=client, state="idle")
+        POOL_QUEUED.set(stats["queued"], client=client)
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.telemetry import registry
+
+from .embedding_model import Base
+
+logger = logging.getLogger(__name__)
+
+QUERY_BATCH_SIZE = registry.histogram(
+    "rag_embedding_query_batch_size",
+    "Query embeddings sent per coalesced backend call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+# Queued by `close` to stop the dispatcher
+_STOP = object()
+
+
+class BatchingEmbed(Base):
+    """
+    Coalesces concurrent `encode_queries` calls into batched backend calls.
+
+    Callers (request threads, or coroutines through `aencode_queries`) put
+    their question on a queue and wait on a future. A dispatcher thread takes
+    the first waiting question, collects more for up to `max_wait_ms` or
+    until `max_batch_size` are queued, and answers them all with one
+    `encode_queries_batch` call. Identical questions in a batch are embedded
+    once. At most `max_in_flight` batches run at a time; while they do, new
+    questions pile up and go out together in the next batch. Each caller
+    gets its own vector and its share of the batch's tokens. A failing
+    batch fails every caller in it.
+
+    `encode` (document embedding) is passed straight through. `close` stops
+    the dispatcher thread and the batch executor.
+    """
+
+    def __init__(
+        self,
+        model: Base,
+        max_wait_ms: float = 2.0,
+        max_batch_size: int = 32,
+        max_in_flight: int = 4,
+    ):
+        self.model = model
+        self.model_name = getattr(model, "model_name", "")
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._slots = threading.Semaphore(max(1, max_in_flight))
+        self._executor = ThreadPoolExecutor(
+            max(1, max_in_flight), thread_name_prefix="embedding-query-batch"
+        )
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._dispatcher = None
+        self._closed = False
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+
+    def __getattr__(self, name):
+        # e.g. aencode, batch_token_budget of the wrapped backend
+        model = self.__dict__.get("model")
+        if model is None:
+            raise AttributeError(name)
+        return getattr(model, name)
+
+    def encode(self, texts: list):
+        return self.model.encode(texts)
+
+    def encode_queries_batch(self, texts: list):
+        batch = getattr(self.model, "encode_queries_batch", None)
+        if batch is None:
+            # Duck-typed backends without a batch call
+            return Base.encode_queries_batch(self.model, texts)
+        return batch(texts)
+
+    def submit(self, text: str) -> Future:
+        """Queue a question; the future resolves to (vector, tokens)."""
+        future: Future = Future()
+        with self._start_lock:
+            if self._closed:
+                raise RuntimeError("Query embedding batcher is closed")
+            self._ensure_dispatcher()
+            self._queue.put((text, future))
+        return future
+
+    def encode_queries(self, text: str):
+        return self.submit(text).result()
+
+    async def aencode_queries(self, text: str):
+        return await asyncio.wrap_future(self.submit(text))
+
+    # -- dispatcher ------------------------------------------------------------
+
+    def close(self) -> None:
+        """
+        Answer the questions already queued, then stop the dispatcher thread
+        and the executor; later calls raise RuntimeError. The wrapped
+        backend is left open.
+        """
+        with self._start_lock:
+            if self._closed:
+                return
+            self._closed = True
+            dispatcher = self._dispatcher
+            if dispatcher is not None:
+                self._queue.put(_STOP)
+        if dispatcher is not None:
+            dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def _ensure_dispatcher(self) -> None:
+        # Called with _start_lock held
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(
+                target=self._dispatch, name="embedding-query-batcher", daemon=True
+            )
+            self._dispatcher.start()
+
+    def _collect(self) -> Tuple[List[Tuple[str, Future]], bool]:
+        """
+        The next batch of queued questions, and whether `close` was called.
+        """
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _dispatch(self) -> None:
+        while True:
+            self._slots.acquire()
+            batch, stop = self._collect()
+            if batch:
+                self._executor.submit(self._run, batch)
+            else:
+                self._slots.release()
+            if stop:
+                return
+
+    def _run(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            batch = [
+                (text, future)
+                for text, future in batch
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                return
+            unique: Dict[str, int] = {}
+            for text, _ in batch:
+                unique.setdefault(text, len(unique))
+            QUERY_BATCH_SIZE.observe(len(unique))
+            self.batches += 1
+            self.queries += len(batch)
+            try:
+                vectors, tokens = self.encode_queries_batch(list(unique))
+                if len(vectors) != len(unique):
+                    raise RuntimeError(
+                        f"Embedding backend returned {len(vectors)} vectors "
+                        f"for {len(unique)} queries"
+                    )
+            except Exception as e:
+                logger.warning(f"Batched query embedding failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            share = tokens // len(batch)
+            for text, future in batch:
+                future.set_result((np.asarray(vectors[unique[text]]), share))
+        finally:
+            self._slots.release()
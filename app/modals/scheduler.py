@@ -0,0 +1,442 @@
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from app.telemetry import registry, token_usage
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = registry.gauge(
+    "rag_provider_in_flight", "Requests currently in flight, by provider."
+)
+PROVIDER_REQUESTS = registry.counter(
+    "rag_provider_requests_total", "Provider requests, by provider and outcome."
+)
+PROVIDER_RETRIES = registry.counter(
+    "rag_provider_retries_total", "Retried provider requests, by provider and reason."
+)
+THROTTLED_SECONDS = registry.counter(
+    "rag_provider_throttled_seconds_total",
+    "Time spent waiting for rate-limit budget, by provider.",
+)
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "RateLimitError",
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "ConnectError",
+    "ReadTimeout",
+    "ConnectTimeout",
+    "RemoteProtocolError",
+}
+
+
+class ProviderError(RuntimeError):
+    """
+    A failed provider response, e.g. a dashscope reply without embeddings,
+    carrying what the scheduler needs to decide on a retry.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(
+            0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        )
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Seconds the provider asked us to wait, from `retry_after` or a
+    Retry-After / retry-after-ms response header.
+    """
+    if getattr(exc, "retry_after", None) is not None:
+        return exc.retry_after
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms") is not None:
+        delay = _parse_retry_after(headers.get("retry-after-ms"))
+        return delay / 1000.0 if delay is not None else None
+    return _parse_retry_after(headers.get("retry-after"))
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in RETRYABLE_ERRORS:
+        return True
+    return status_code(exc) in RETRYABLE_STATUS
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `per_minute / 60` tokens a second,
+    holding at most `capacity` (default: one minute's worth).
+
+    `reserve` always succeeds and returns how long the caller must wait
+    before using what it took; the balance may go negative, which makes
+    later callers queue up behind it in order.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # A request larger than the bucket only waits for a full bucket
+            self._tokens -= min(amount, self.capacity)
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def debit(self, amount: float) -> None:
+        """Take `amount` without waiting, e.g. once actual usage is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ProviderScheduler:
+    """
+    Shared gate for every request to one provider.
+
+    Requests wait for budget from a requests-per-minute and a
+    tokens-per-minute bucket, and at most `max_in_flight` run at once.
+    Retryable failures (429, 5xx, timeouts, connection errors) are retried
+    up to `max_retries` times. The wait is the provider's Retry-After when
+    given, which also pauses every other request to that provider, else
+    exponential backoff with full jitter.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_in_flight: Optional[int] = None,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        # Coroutines waiting for a slot, as (loop, future), first come first
+        # served; a freed slot is handed to them before sync waiters
+        self._waiters: deque = deque()
+        self._paused_until = 0.0
+
+    @classmethod
+    def from_env(cls, name: str) -> "ProviderScheduler":
+        """
+        Limits from RATE_LIMIT_<NAME>_RPM, _TPM, _MAX_IN_FLIGHT and
+        _MAX_RETRIES, with NAME upper-cased and non-alphanumerics as "_".
+        """
+        prefix = "RATE_LIMIT_" + re.sub(r"[^A-Za-z0-9]+", "_", name).upper()
+
+        def number(suffix, cast=float):
+            value = os.getenv(f"{prefix}_{suffix}")
+            return cast(value) if value else None
+
+        max_retries = number("MAX_RETRIES", int)
+        return cls(
+            name,
+            rpm=number("RPM"),
+            tpm=number("TPM"),
+            max_in_flight=number("MAX_IN_FLIGHT", int),
+            max_retries=5 if max_retries is None else max_retries,
+        )
+
+    # -- budget ----------------------------------------------------------------
+
+    def _budget_delay(self, tokens: float) -> float:
+        delay = max(0.0, self._paused_until - time.monotonic())
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if delay:
+            THROTTLED_SECONDS.inc(delay, provider=self.name)
+        return delay
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        delay = retry_after(exc)
+        if delay is not None:
+            with self._cond:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            return delay
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def record_usage(self, tokens: float) -> None:
+        """Debit tokens whose count is only known after the response."""
+        if self.tokens is not None and tokens:
+            self.tokens.debit(tokens)
+
+    # -- in-flight tracking ------------------------------------------------------
+
+    def _full(self) -> bool:
+        return bool(self.max_in_flight) and self.in_flight >= self.max_in_flight
+
+    def _enter(self) -> None:
+        with self._cond:
+            while self._full() or self._waiters:
+                self._cond.wait()
+            self.in_flight += 1
+        IN_FLIGHT.set(self.in_flight, provider=self.name)
+
+    async def _aenter(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if not self._full() and not self._waiters:
+                self.in_flight += 1
+                waiter = None
+            else:
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+        if waiter is not None:
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._cond:
+                    handed = (loop, waiter) not in self._waiters
+                    if not handed:
+                        self._waiters.remove((loop, waiter))
+                        self._cond.notify()
+                if handed:
+                    # The slot arrived as the wait was cancelled, pass it on
+                    self._exit()
+                raise
+        IN_FLIGHT.set(self.in_flight, provider=self.name)
+
+    def _exit(self) -> None:
+        with self._cond:
+            while self._waiters:
+                # The slot moves to the waiter as is, in_flight is unchanged
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_wake, waiter)
+                    break
+                except RuntimeError:
+                    # Its event loop is closed
+                    continue
+            else:
+                self.in_flight -= 1
+                self._cond.notify()
+        IN_FLIGHT.set(self.in_flight, provider=self.name)
+
+    def track(self, delta: int) -> None:
+        """Count a request started (+1) or finished (-1) elsewhere, unlimited."""
+        if delta < 0:
+            self._exit()
+            return
+        with self._cond:
+            self.in_flight += delta
+        IN_FLIGHT.set(self.in_flight, provider=self.name)
+
+    # -- calls -------------------------------------------------------------------
+
+    def _should_retry(self, attempt: int, exc: BaseException) -> bool:
+        if attempt >= self.max_retries or not is_retryable(exc):
+            PROVIDER_REQUESTS.inc(provider=self.name, outcome="error")
+            return False
+        PROVIDER_RETRIES.inc(
+            provider=self.name, reason=str(status_code(exc) or type(exc).__name__)
+        )
+        return True
+
+    def call(self, fn: Callable[..., Any], *args, tokens: float = 0, **kwargs) -> Any:
+        """Run `fn(*args, **kwargs)` within the provider's budget, with retries."""
+        attempt = 0
+        while True:
+            delay = self._budget_delay(tokens)
+            if delay:
+                time.sleep(delay)
+            self._enter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(
+                    f"{self.name} request failed ({e}), retry "
+                    f"{attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+            else:
+                PROVIDER_REQUESTS.inc(provider=self.name, outcome="ok")
+                return result
+            finally:
+                self._exit()
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(
+        self, fn: Callable[..., Awaitable[Any]], *args, tokens: float = 0, **kwargs
+    ) -> Any:
+        """Async `call` for a coroutine function."""
+        attempt = 0
+        while True:
+            delay = self._budget_delay(tokens)
+            if delay:
+                await asyncio.sleep(delay)
+            await self._aenter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(
+                    f"{self.name} request failed ({e}), retry "
+                    f"{attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+            else:
+                PROVIDER_REQUESTS.inc(provider=self.name, outcome="ok")
+                return result
+            finally:
+                self._exit()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+class SchedulerRateLimiter(BaseRateLimiter):
+    """
+    LangChain chat-model rate limiter drawing on a `ProviderScheduler`.
+
+    Chat models call `acquire` before every request. The request bucket
+    is charged there. The token bucket is charged afterwards with the
+    reported usage, through `SchedulerCallback`, and a request also waits
+    while that bucket is in debt.
+    """
+
+    def __init__(self, scheduler: ProviderScheduler):
+        self.scheduler = scheduler
+
+    def _delay(self) -> float:
+        delay = self.scheduler._budget_delay(0)
+        tokens = self.scheduler.tokens
+        if tokens is not None and tokens.available() < 0:
+            delay = max(delay, -tokens.available() / tokens.rate)
+        return delay
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        delay = self._delay()
+        if delay and not blocking:
+            return False
+        if delay:
+            time.sleep(delay)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        delay = self._delay()
+        if delay and not blocking:
+            return False
+        if delay:
+            await asyncio.sleep(delay)
+        return True
+
+
+class SchedulerCallback(BaseCallbackHandler):
+    """
+    Tracks a chat model's in-flight requests, outcomes and token usage on
+    its `ProviderScheduler`. In-flight requests are only counted here, not
+    capped, since a callback must not block the model call.
+    """
+
+    def __init__(self, scheduler: ProviderScheduler):
+        self.scheduler = scheduler
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        self.scheduler.track(1)
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        self.scheduler.track(1)
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        self.scheduler.track(-1)
+        PROVIDER_REQUESTS.inc(provider=self.scheduler.name, outcome="ok")
+        self.scheduler.record_usage(sum(token_usage(response)))
+
+    def on_llm_error(self, error, **kwargs) -> None:
+        self.scheduler.track(-1)
+        PROVIDER_REQUESTS.inc(provider=self.scheduler.name, outcome="error")
+
+
+_schedulers: Dict[str, ProviderScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(provider: str) -> ProviderScheduler:
+    """
+    The process-wide scheduler of `provider`, created from the environment
+    on first use.
+    """
+    key = provider.lower()
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = ProviderScheduler.from_env(provider)
+        return _schedulers[key]
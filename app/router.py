@@ -0,0 +1,323 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+ROUTE_DECISIONS = registry.counter(
+    "rag_route_decisions_total",
+    "Question routing decisions, by deciding method and datasource.",
+)
+
+DATASOURCES = ("vectorstore", "web_search")
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0
+) -> np.ndarray:
+    """
+    `k` unit centroids of unit `vectors` by cosine k-means.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    cents = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ cents.T, axis=1)
+        sums = np.zeros_like(cents)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=k)[:, None]
+        cents = np.where(counts > 0, sums, cents)
+        cents = _unit_rows(cents)
+    return cents
+
+
+class LogisticModel:
+    """
+    Binary logistic regression on a handful of features, fitted by plain
+    gradient descent with L2 regularisation.
+    """
+
+    def __init__(self, weights: Optional[np.ndarray] = None):
+        self.weights = weights
+
+    @staticmethod
+    def _design(features: np.ndarray) -> np.ndarray:
+        return np.hstack([features, np.ones((len(features), 1), dtype=features.dtype)])
+
+    def fit(
+        self,
+        features: np.ndarray,
+        labels: np.ndarray,
+        iterations: int = 500,
+        lr: float = 0.5,
+        l2: float = 1e-3,
+    ) -> "LogisticModel":
+        x = self._design(np.asarray(features, dtype=np.float64))
+        y = np.asarray(labels, dtype=np.float64)
+        w = np.zeros(x.shape[1])
+        for _ in range(iterations):
+            p = 1.0 / (1.0 + np.exp(-(x @ w)))
+            w -= lr * (x.T @ (p - y) / len(y) + l2 * w)
+        self.weights = w
+        return self
+
+    def predict(self, features: np.ndarray) -> float:
+        x = self._design(np.asarray(features, dtype=np.float64)[None, :])
+        return float(1.0 / (1.0 + np.exp(-(x @ self.weights)[0])))
+
+
+class EmbeddingRouter:
+    """
+    Routes questions between "vectorstore" and "web_search" from their
+    embedding, so most requests skip the LLM routing call.
+
+    A question is compared with `clusters` centroids of the indexed chunk
+    vectors and, when given, with labelled `exemplars` questions. It is
+    decided, in order, by:
+
+    - a logistic model over those similarities, trained on the decisions the
+      LLM made for uncertain questions once `min_samples` of them (with both
+      answers) are logged, when its probability is at least `confidence`;
+    - the exemplars, when the best match of one datasource beats the other
+      by `exemplar_margin`;
+    - the centroids: at least `in_domain` similarity goes to the
+      vectorstore, at most `out_of_domain` to web search. They are not
+      calibrated from the corpus, since a short question scores far lower
+      against the centroids than the chunks themselves do. Unless given,
+      they are fitted from the logged decisions once `min_samples` are
+      logged and all of them picked the same datasource, which leaves the
+      logistic model nothing to separate: the median best similarity of
+      those questions becomes that datasource's threshold.
+
+    Anything else returns None, and the caller asks the LLM and hands its
+    answer to `record`. Without exemplars or thresholds every question goes
+    to the LLM until enough decisions are logged to train the model.
+    Decisions are appended to `log_path` as JSON lines and reloaded on
+    start, for the index version they were made against; only the last
+    `max_decisions` are kept, in memory and in the log.
+    """
+
+    def __init__(
+        self,
+        embedding,
+        corpus_vectors: Optional[Callable[[], np.ndarray]] = None,
+        exemplars: Optional[Dict[str, List[str]]] = None,
+        clusters: int = 32,
+        in_domain: Optional[float] = None,
+        out_of_domain: Optional[float] = None,
+        exemplar_margin: float = 0.1,
+        confidence: float = 0.9,
+        min_samples: int = 50,
+        max_decisions: int = 1000,
+        log_path: Optional[str] = None,
+        index_version: Optional[Callable[[], Optional[str]]] = None,
+    ):
+        self.embedding = embedding
+        self.corpus_vectors = corpus_vectors
+        self.exemplars = exemplars or {}
+        self.clusters = clusters
+        self.in_domain = in_domain
+        self.out_of_domain = out_of_domain
+        self.exemplar_margin = exemplar_margin
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.max_decisions = max(min_samples, max_decisions)
+        self.log_path = log_path
+        self.index_version = index_version
+        self.model: Optional[LogisticModel] = None
+        # Centroid thresholds fitted from one-sided decisions
+        self._thresholds: Dict[str, float] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._exemplars: Dict[str, np.ndarray] = {}
+        self._fitted = False
+        self._fitted_version = None
+        self._decisions: List[tuple] = []
+        self._recorded = 0
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._fit_lock = threading.Lock()
+
+    # -- fitting -----------------------------------------------------------------
+
+    def _version(self) -> Optional[str]:
+        return self.index_version() if self.index_version else None
+
+    def fit(self) -> None:
+        """
+        Cluster the corpus, embed the exemplars and reload logged decisions.
+        Runs on first use and again whenever the index version changes.
+        """
+        version = self._version()
+        centroids = None
+        vectors = self.corpus_vectors() if self.corpus_vectors else None
+        if vectors is not None and len(vectors):
+            centroids = spherical_kmeans(_unit_rows(vectors), self.clusters)
+        exemplars = {}
+        for datasource, questions in self.exemplars.items():
+            if questions:
+                exemplars[datasource] = _unit_rows(
+                    self.embedding.encode(list(questions))[0]
+                )
+        with self._lock:
+            self._centroids = centroids
+            self._exemplars = exemplars
+            self._fitted_version = version
+            self._decisions = self._load_decisions(version)
+            self.model = None
+            self._thresholds = {}
+            self._train()
+            self._fitted = True
+
+    def _ensure_fitted(self) -> None:
+        if self._fitted and self._fitted_version == self._version():
+            return
+        with self._fit_lock:
+            if not self._fitted or self._fitted_version != self._version():
+                self.fit()
+
+    def _load_decisions(self, version) -> List[tuple]:
+        self._log_lines = 0
+        if not self.log_path or not os.path.isfile(self.log_path):
+            return []
+        decisions = []
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                self._log_lines += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("index_version") == version:
+                    decisions.append((record["features"], record["datasource"]))
+        decisions = decisions[-self.max_decisions :]
+        if self._log_lines > 2 * self.max_decisions:
+            self._rewrite_log(decisions, version)
+        return decisions
+
+    @staticmethod
+    def _log_line(features: List[float], datasource: str, version) -> str:
+        record = {"features": features, "datasource": datasource}
+        return json.dumps({**record, "index_version": version}) + "\n"
+
+    def _rewrite_log(self, decisions: List[tuple], version) -> None:
+        """
+        Replace the log with `decisions`, dropping those of older index
+        versions and past `max_decisions`.
+        """
+        tmp_path = f"{self.log_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(self._log_line(*decision, version) for decision in decisions)
+        os.replace(tmp_path, self.log_path)
+        self._log_lines = len(decisions)
+
+    def _train(self) -> None:
+        labels = [datasource == "vectorstore" for _, datasource in self._decisions]
+        if len(labels) < self.min_samples:
+            return
+        features = np.array([f for f, _ in self._decisions], dtype=np.float64)
+        if all(labels) or not any(labels):
+            self._thresholds = {self._decisions[0][1]: float(np.median(features[:, 0]))}
+            return
+        self._thresholds = {}
+        self.model = LogisticModel().fit(features, np.array(labels))
+
+    # -- routing -------------------------------------------------------------------
+
+    def features(self, vector: np.ndarray) -> List[float]:
+        """
+        [best and top-3 mean centroid similarity, best exemplar similarity
+        per datasource], 0 for what is not configured.
+        """
+        q = _unit_rows(vector)
+        feats = [0.0, 0.0]
+        if self._centroids is not None:
+            sims = np.sort(self._centroids @ q)[::-1]
+            feats = [float(sims[0]), float(sims[:3].mean())]
+        for datasource in DATASOURCES:
+            ex = self._exemplars.get(datasource)
+            feats.append(float(np.max(ex @ q)) if ex is not None else 0.0)
+        return feats
+
+    def _decide(self, feats: List[float]) -> Optional[tuple]:
+        model = self.model
+        if model is not None:
+            p = model.predict(np.array(feats))
+            if max(p, 1 - p) >= self.confidence:
+                return ("vectorstore" if p >= 0.5 else "web_search"), "logistic"
+        if all(d in self._exemplars for d in DATASOURCES):
+            margin = feats[2] - feats[3]
+            if abs(margin) >= self.exemplar_margin:
+                return ("vectorstore" if margin > 0 else "web_search"), "exemplars"
+        if self._centroids is not None:
+            in_domain = self.in_domain
+            if in_domain is None:
+                in_domain = self._thresholds.get("vectorstore")
+            out_of_domain = self.out_of_domain
+            if out_of_domain is None:
+                out_of_domain = self._thresholds.get("web_search")
+            if in_domain is not None and feats[0] >= in_domain:
+                return "vectorstore", "centroids"
+            if out_of_domain is not None and feats[0] <= out_of_domain:
+                return "web_search", "centroids"
+        return None
+
+    def route_vector(self, vector: np.ndarray) -> tuple:
+        """
+        (datasource or None when unsure, features) of a question embedding.
+        """
+        self._ensure_fitted()
+        feats = self.features(vector)
+        decision = self._decide(feats)
+        if decision is None:
+            return None, feats
+        datasource, method = decision
+        ROUTE_DECISIONS.inc(method=method, datasource=datasource)
+        return datasource, feats
+
+    def route(self, question: str) -> tuple:
+        vector, _ = self.embedding.encode_queries(question)
+        return self.route_vector(vector)
+
+    async def aroute(self, question: str) -> tuple:
+        aencode = getattr(self.embedding, "aencode_queries", None)
+        if aencode is not None:
+            vector, _ = await aencode(question)
+        else:
+            vector, _ = await asyncio.to_thread(self.embedding.encode_queries, question)
+        return await asyncio.to_thread(self.route_vector, vector)
+
+    def record(self, features: List[float], datasource: str) -> None:
+        """
+        Log the LLM's decision for an uncertain question, retraining the
+        logistic model as decisions accumulate.
+        """
+        ROUTE_DECISIONS.inc(method="llm", datasource=datasource)
+        with self._lock:
+            self._decisions.append((features, datasource))
+            del self._decisions[: -self.max_decisions]
+            self._recorded += 1
+            if len(self._decisions) >= self.min_samples and (
+                self.model is None or self._recorded % 10 == 0
+            ):
+                self._train()
+            if not self.log_path:
+                return
+            if self._log_lines >= 2 * self.max_decisions:
+                self._rewrite_log(self._decisions, self._fitted_version)
+                return
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(self._log_line(features, datasource, self._fitted_version))
+            self._log_lines += 1
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from app.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = registry.counter(
+    "rag_semantic_cache_lookups_total", "Semantic answer cache lookups, by result."
+)
+
+
+class CacheEntry:
+    def __init__(
+        self,
+        question: str,
+        generation: str,
+        documents: list,
+        created: float,
+        similarity: float = 1.0,
+    ):
+        self.question = question
+        self.generation = generation
+        self.documents = documents
+        self.created = created
+        self.similarity = similarity
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by question embedding.
+
+    A question is a hit when the cosine similarity between its embedding
+    (from the backend's `encode_queries`) and a previously answered one is at
+    least `threshold`. Entries expire after `ttl` seconds; beyond
+    `max_entries` the least recently used entry is evicted. When
+    `index_version` is given, the whole cache is dropped as soon as its
+    value changes, so answers never outlive the index they were built from.
+    """
+
+    def __init__(
+        self,
+        embedding,
+        threshold: float = 0.95,
+        ttl: float = 3600.0,
+        max_entries: int = 1024,
+        index_version: Optional[Callable[[], Optional[str]]] = None,
+    ):
+        self.embedding = embedding
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index_version = index_version
+        self._version = index_version() if index_version else None
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[CacheEntry] = []
+        self._last_used: List[float] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _unit(res) -> Optional[np.ndarray]:
+        if res is None:
+            return None
+        vector = np.asarray(res[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        return self._unit(self.embedding.encode_queries(question))
+
+    async def aembed(self, question: str) -> Optional[np.ndarray]:
+        aencode = getattr(self.embedding, "aencode_queries", None)
+        if aencode is None:
+            return await asyncio.to_thread(self.embed, question)
+        return self._unit(await aencode(question))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+            self._last_used = []
+
+    def _check_version(self) -> None:
+        if self.index_version is None:
+            return
+        version = self.index_version()
+        if version != self._version:
+            if self._entries:
+                logger.info("Index changed, clearing the semantic answer cache")
+            self._version = version
+            self._vectors = None
+            self._entries = []
+            self._last_used = []
+
+    def _drop(self, keep: np.ndarray) -> None:
+        self._vectors = self._vectors[keep] if keep.any() else None
+        self._entries = [e for e, k in zip(self._entries, keep) if k]
+        self._last_used = [t for t, k in zip(self._last_used, keep) if k]
+
+    def _expire(self, now: float) -> None:
+        if not self._entries:
+            return
+        created = np.fromiter((e.created for e in self._entries), dtype=np.float64)
+        keep = now - created < self.ttl
+        if not keep.all():
+            self._drop(keep)
+
+    def lookup(
+        self, question: str, vector: Optional[np.ndarray] = None
+    ) -> Tuple[Optional[CacheEntry], Optional[np.ndarray]]:
+        """
+        Return (entry, vector): the best cached answer above the threshold,
+        or None, and the question embedding to pass on to `store` on a miss.
+        `vector` is the question's embedding from `aembed`, if already known.
+        """
+        if vector is None:
+            vector = self.embed(question)
+        if vector is None:
+            return None, None
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self._expire(now)
+            if self._vectors is None:
+                CACHE_LOOKUPS.inc(result="miss")
+                return None, vector
+            similarities = self._vectors @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                CACHE_LOOKUPS.inc(result="miss")
+                return None, vector
+            self._last_used[best] = now
+            entry = self._entries[best]
+        CACHE_LOOKUPS.inc(result="hit")
+        return (
+            CacheEntry(
+                entry.question,
+                entry.generation,
+                entry.documents,
+                entry.created,
+                similarity,
+            ),
+            vector,
+        )
+
+    def store(
+        self,
+        question: str,
+        generation: str,
+        documents: list,
+        vector: Optional[np.ndarray] = None,
+    ) -> None:
+        if vector is None:
+            vector = self.embed(question)
+            if vector is None:
+                return
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self._expire(now)
+            if self._vectors is not None and self._vectors.shape[1] != vector.shape[0]:
+                # The embedding model changed under us
+                self._vectors, self._entries, self._last_used = None, [], []
+            if self._vectors is not None and len(self._entries) >= self.max_entries:
+                keep = np.ones(len(self._entries), dtype=bool)
+                keep[int(np.argmin(self._last_used))] = False
+                self._drop(keep)
+            row = vector[np.newaxis, :]
+            self._vectors = (
+                row if self._vectors is None else np.vstack([self._vectors, row])
+            )
+            self._entries.append(CacheEntry(question, generation, list(documents), now))
+            self._last_used.append(now)
@@ -0,0 +1,465 @@
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter as _Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Chains whose duration, LLM calls and tokens are tracked, by run name
+TRACKED_CHAINS = (
+    "question_router",
+    "retrieval_grader",
+    "rag_chain",
+    "hallucination_grader",
+    "answer_grader",
+    "generation_grader",
+    "question_rewriter",
+)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def header(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> Iterable[str]:
+        yield from self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(sorted(labels.items())))
+        return entry[2] if entry else 0
+
+    def render(self) -> Iterable[str]:
+        yield from self.header()
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        for labels, (bucket_counts, total, count) in items:
+            for bound, n in zip(self.buckets, bucket_counts):
+                le = labels + (("le", repr(float(bound))),)
+                yield f"{self.name}_bucket{_format_labels(le)} {n}"
+            le = labels + (("le", "+Inf"),)
+            yield f"{self.name}_bucket{_format_labels(le)} {count}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text
+    exposition format.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: list = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._register(Gauge(name, documentation))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def collect(self, collector: Callable[[], None]) -> None:
+        """
+        Run `collector` before every render, to refresh gauges that sample
+        state kept elsewhere.
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter(
+    "rag_requests_total", "Questions answered by the RAG workflow."
+)
+REQUEST_DURATION = registry.histogram(
+    "rag_request_duration_seconds", "End-to-end latency of a question."
+)
+NODE_DURATION = registry.histogram(
+    "rag_node_duration_seconds", "Wall time of a workflow node or edge."
+)
+CHAIN_DURATION = registry.histogram(
+    "rag_chain_duration_seconds", "Wall time of a router or grader chain call."
+)
+LLM_CALLS = registry.counter("rag_llm_calls_total", "LLM calls, by calling chain.")
+LLM_TOKENS = registry.counter(
+    "rag_llm_tokens_total", "LLM tokens, by calling chain and token type."
+)
+LOOP_ITERATIONS = registry.histogram(
+    "rag_loop_iterations",
+    "Graph loop iterations per question.",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21),
+)
+
+
+class RequestTrace:
+    """
+    Per-question record of node timings, chain calls, LLM calls, token
+    usage and loop iterations.
+    """
+
+    def __init__(self, question: str = ""):
+        self.id = uuid.uuid4().hex
+        self.question = question
+        self.started = time.perf_counter()
+        self.nodes: list = []
+        self.node_counts: _Counter = _Counter()
+        self.chains: Dict[str, Dict[str, float]] = {}
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.duration: Optional[float] = None
+        self._lock = threading.Lock()
+        self.callback = TelemetryCallbackHandler(self)
+
+    def record_node(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.nodes.append((name, seconds))
+            self.node_counts[name] += 1
+
+    def record_chain(self, name: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.chains.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "llm_calls": 0, "tokens": 0}
+            )
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+
+    def record_llm(
+        self, chain: str, prompt_tokens: int, completion_tokens: int
+    ) -> None:
+        LLM_CALLS.inc(chain=chain)
+        LLM_TOKENS.inc(prompt_tokens, chain=chain, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, chain=chain, type="completion")
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            entry = self.chains.setdefault(
+                chain, {"calls": 0, "seconds": 0.0, "llm_calls": 0, "tokens": 0}
+            )
+            entry["llm_calls"] += 1
+            entry["tokens"] += prompt_tokens + completion_tokens
+
+    @property
+    def loop_iterations(self) -> Dict[str, int]:
+        return {
+            "rewrite": self.node_counts.get("transform_query", 0),
+            "regenerate": max(self.node_counts.get("generate", 0) - 1, 0),
+        }
+
+    def finish(self, error: Optional[BaseException] = None) -> Dict:
+        self.duration = time.perf_counter() - self.started
+        if error is None:
+            status = "ok"
+        elif isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+            status = "cancelled"
+        else:
+            status = "error"
+        REQUESTS.inc(status=status)
+        REQUEST_DURATION.observe(self.duration)
+        for loop, n in self.loop_iterations.items():
+            LOOP_ITERATIONS.observe(n, loop=loop)
+        summary = self.as_dict()
+        summary["status"] = status
+        if status == "error":
+            summary["error"] = repr(error)
+        logger.info(json.dumps({"event": "rag_request", **summary}, ensure_ascii=False))
+        return summary
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "trace_id": self.id,
+                "duration_s": self.duration,
+                "nodes": [{"node": n, "seconds": s} for n, s in self.nodes],
+                "chains": {k: dict(v) for k, v in self.chains.items()},
+                "llm_calls": self.llm_calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "loop_iterations": self.loop_iterations,
+            }
+
+
+def token_usage(response) -> Tuple[int, int]:
+    """(prompt, completion) tokens of an LLMResult, 0 when not reported."""
+    for generations in response.generations or []:
+        for generation in generations:
+            usage = getattr(
+                getattr(generation, "message", None), "usage_metadata", None
+            )
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """
+    Attributes chain wall time, LLM calls and token usage to the tracked
+    chain (see `TRACKED_CHAINS`) each run belongs to.
+    """
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._parents: Dict[uuid.UUID, Optional[uuid.UUID]] = {}
+        self._chains: Dict[uuid.UUID, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _chain_of(self, run_id) -> str:
+        with self._lock:
+            while run_id is not None:
+                if run_id in self._chains:
+                    return self._chains[run_id][0]
+                run_id = self._parents.get(run_id)
+        return "other"
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs
+    ) -> None:
+        name = kwargs.get("name")
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            if name in TRACKED_CHAINS:
+                self._chains[run_id] = (name, time.perf_counter())
+
+    def _end_chain(self, run_id) -> None:
+        with self._lock:
+            self._parents.pop(run_id, None)
+            chain = self._chains.pop(run_id, None)
+        if chain is not None:
+            name, started = chain
+            seconds = time.perf_counter() - started
+            CHAIN_DURATION.observe(seconds, chain=name)
+            self.trace.record_chain(name, seconds)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs) -> None:
+        self._end_chain(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs) -> None:
+        self._end_chain(run_id)
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id, parent_run_id=None, **kwargs
+    ) -> None:
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+
+    def on_llm_start(
+        self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs
+    ) -> None:
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        prompt_tokens, completion_tokens = token_usage(response)
+        self.trace.record_llm(self._chain_of(run_id), prompt_tokens, completion_tokens)
+        with self._lock:
+            self._parents.pop(run_id, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self.trace.record_llm(self._chain_of(run_id), 0, 0)
+        with self._lock:
+            self._parents.pop(run_id, None)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "rag_request_trace", default=None
+)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_request(question: str = ""):
+    """
+    Collect a `RequestTrace` for everything run inside the block; the trace
+    is logged as one JSON line and exported to the metrics on exit. Pass
+    `trace.callback` in the run config so LangChain calls get attributed.
+    """
+    trace = RequestTrace(question)
+    token = _current_trace.set(trace)
+    error = None
+    try:
+        yield trace
+    except (GeneratorExit, asyncio.CancelledError) as e:
+        # The consumer went away (e.g. a client closed its stream)
+        error = e
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # Async generators may be closed from another context
+            pass
+        trace.finish(error)
+
+
+def traced_node(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator timing a workflow node or edge function under `name`.
+    """
+
+    def record(started: float) -> None:
+        seconds = time.perf_counter() - started
+        NODE_DURATION.observe(seconds, node=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.record_node(name, seconds)
+
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def awrapper(*args: Any, **kwargs: Any) -> Any:
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    record(started)
+
+            return awrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(started)
+
+        return wrapper
+
+    return decorator
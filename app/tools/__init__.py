@@ -1,5 +1,25 @@
-from .search import tavily_tool
+from .web_search import (
+    CachedSearch,
+    SearchResultCache,
+    StubSearch,
+    asearch_many,
+    search_many,
+)
 
 __all__ = [
     "tavily_tool",
+    "CachedSearch",
+    "SearchResultCache",
+    "StubSearch",
+    "asearch_many",
+    "search_many",
 ]
+
+
+def __getattr__(name):
+    # The Tavily tool pulls in langchain_community, so it is built on first use
+    if name == "tavily_tool":
+        from .search import tavily_tool
+
+        return tavily_tool
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
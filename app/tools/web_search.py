@@ -0,0 +1,364 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_LOOKUPS = registry.counter(
+    "rag_search_cache_lookups_total",
+    "Web search result cache lookups, by result (memory, disk, miss).",
+)
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Case-folded query with runs of whitespace collapsed and surrounding
+    whitespace and punctuation removed, so trivially different spellings
+    of a query share a cache entry.
+    """
+    return _SPACE.sub(" ", str(query).casefold()).strip(" \t\n?!.,;:")
+
+
+def _query_of(payload) -> str:
+    if isinstance(payload, dict):
+        return payload.get("query", "")
+    return str(payload)
+
+
+class SearchResultCache:
+    """
+    Web search results by query, in memory with a SQLite disk tier.
+
+    Entries expire `ttl` seconds after they were fetched, in both tiers.
+    The memory tier keeps the `max_entries` most recently used entries and
+    the disk tier (when `directory` is given) the `max_disk_entries` most
+    recently fetched ones. Only lists (or dicts) of results are cached,
+    never a provider's error string.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        max_entries: int = 1024,
+        directory: Optional[str] = None,
+        max_disk_entries: int = 100000,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(
+                os.path.join(directory, "search.sqlite3"), check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, results TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_created ON results (created)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def key(provider: str, query: str, **params) -> str:
+        body = json.dumps(
+            [provider, normalize_query(query), sorted(params.items())],
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                SEARCH_CACHE_LOOKUPS.inc(result="memory")
+                return entry[0]
+            self._memory.pop(key, None)
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT results, created FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] < self.ttl:
+                    results = json.loads(row[0])
+                    self._remember(key, results, row[1])
+                    SEARCH_CACHE_LOOKUPS.inc(result="disk")
+                    return results
+        SEARCH_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def _remember(self, key: str, results: List[Dict], created: float) -> None:
+        self._memory[key] = (results, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key: str, results) -> None:
+        if not isinstance(results, (list, dict)):
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, results, now)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, results, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(results, ensure_ascii=False, default=str), now),
+                )
+                self._conn.execute(
+                    "DELETE FROM results WHERE created < ? OR key IN (SELECT key FROM results "
+                    "ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (now - self.ttl, self.max_disk_entries),
+                )
+                self._conn.commit()
+
+    def fetch(self, key: str, search: Callable[[], Any]):
+        """Cached results of `key`, or `search()` stored under it."""
+        results = self.get(key)
+        if results is None:
+            results = search()
+            self.put(key, results)
+        return results
+
+    async def afetch(self, key: str, asearch):
+        results = self.get(key)
+        if results is None:
+            results = await asearch()
+            self.put(key, results)
+        return results
+
+
+_shared_cache: Optional[SearchResultCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchResultCache:
+    """
+    The process-wide cache, sized by WEB_SEARCH_CACHE_TTL (seconds),
+    WEB_SEARCH_CACHE_SIZE and, for the disk tier, WEB_SEARCH_CACHE_DIR.
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = SearchResultCache(
+                ttl=float(os.getenv("WEB_SEARCH_CACHE_TTL", "3600")),
+                max_entries=int(os.getenv("WEB_SEARCH_CACHE_SIZE", "1024")),
+                directory=os.getenv("WEB_SEARCH_CACHE_DIR") or None,
+            )
+        return _shared_cache
+
+
+class CachedSearch:
+    """
+    Wraps any search tool with `invoke` (and optionally `ainvoke`) taking
+    {"query": ...} so its results go through a `SearchResultCache`.
+    """
+
+    def __init__(
+        self,
+        tool,
+        cache: Optional[SearchResultCache] = None,
+        provider: Optional[str] = None,
+    ):
+        self.tool = tool
+        self.search_cache = cache or get_search_cache()
+        self.provider = provider or getattr(tool, "name", None) or type(tool).__name__
+
+    def _key(self, payload) -> str:
+        return self.search_cache.key(
+            self.provider,
+            _query_of(payload),
+            max_results=getattr(self.tool, "max_results", None),
+        )
+
+    def invoke(self, payload, *args, **kwargs):
+        return self.search_cache.fetch(
+            self._key(payload), lambda: self.tool.invoke(payload, *args, **kwargs)
+        )
+
+    async def ainvoke(self, payload, *args, **kwargs):
+        ainvoke = getattr(self.tool, "ainvoke", None)
+
+        async def search():
+            if ainvoke is None:
+                return await asyncio.to_thread(
+                    self.tool.invoke, payload, *args, **kwargs
+                )
+            return await ainvoke(payload, *args, **kwargs)
+
+        return await self.search_cache.afetch(self._key(payload), search)
+
+
+def _result_key(result) -> str:
+    if isinstance(result, dict):
+        if result.get("url"):
+            return "url:" + str(result["url"]).rstrip("/").casefold()
+        return "content:" + normalize_query(result.get("content", ""))
+    return "content:" + normalize_query(result)
+
+
+def merge_results(
+    result_lists: List[List[Dict]], max_results: Optional[int] = None
+) -> List[Dict]:
+    """
+    Interleave the result lists rank by rank (each variant's first result,
+    then each one's second, ...), dropping results already seen by url, or
+    by content when there is no url.
+    """
+    merged, seen = [], set()
+    depth = max((len(r) for r in result_lists), default=0)
+    for rank in range(depth):
+        for results in result_lists:
+            if rank < len(results):
+                key = _result_key(results[rank])
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(results[rank])
+    return merged[:max_results] if max_results else merged
+
+
+def _variants(queries: List[str]) -> List[str]:
+    unique, seen = [], set()
+    for query in queries:
+        norm = normalize_query(query)
+        if norm and norm not in seen:
+            seen.add(norm)
+            unique.append(query)
+    return unique
+
+
+def _usable(results_per_query, queries) -> List[List[Dict]]:
+    usable = []
+    for query, results in zip(queries, results_per_query):
+        if isinstance(results, BaseException) or not isinstance(results, list):
+            logger.warning(f"Search for {query!r} failed: {results}")
+            continue
+        usable.append(results)
+    if not usable and results_per_query:
+        first = results_per_query[0]
+        if isinstance(first, BaseException):
+            raise first
+        raise RuntimeError(f"Web search failed for every query variant: {first}")
+    return usable
+
+
+def search_many(
+    tool,
+    queries: List[str],
+    max_results: Optional[int] = None,
+    max_concurrency: int = 4,
+) -> List[Dict]:
+    """
+    Search every distinct variant of `queries` at once with `tool` and
+    merge the results (see `merge_results`). A failing variant is skipped;
+    only when all fail is the error raised.
+    """
+    queries = _variants(queries)
+    if not queries:
+        return []
+
+    def search(query):
+        try:
+            return tool.invoke({"query": query})
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_concurrency, len(queries)), thread_name_prefix="web-search"
+    ) as pool:
+        results = list(pool.map(search, queries))
+    return merge_results(_usable(results, queries), max_results)
+
+
+async def asearch_many(
+    tool,
+    queries: List[str],
+    max_results: Optional[int] = None,
+    max_concurrency: int = 4,
+) -> List[Dict]:
+    """Async `search_many`."""
+    queries = _variants(queries)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    ainvoke = getattr(tool, "ainvoke", None)
+
+    async def search(query):
+        async with semaphore:
+            if ainvoke is None:
+                return await asyncio.to_thread(tool.invoke, {"query": query})
+            return await ainvoke({"query": query})
+
+    results = await asyncio.gather(
+        *(search(q) for q in queries), return_exceptions=True
+    )
+    return merge_results(_usable(results, queries), max_results)
+
+
+class StubSearch:
+    """
+    Offline search provider for tests and local runs.
+
+    `documents` maps a url to its content; a query returns, best first, the
+    documents sharing the most words with it, in Tavily's result format.
+    Every call is recorded in `calls`.
+    """
+
+    name = "stub_search"
+
+    def __init__(
+        self, documents: Dict[str, str], max_results: int = 3, latency: float = 0.0
+    ):
+        self.documents = documents
+        self.max_results = max_results
+        self.latency = latency
+        self.calls: List[str] = []
+        self._lock = threading.Lock()
+
+    def _search(self, query: str) -> List[Dict]:
+        words = set(normalize_query(query).split())
+        scored = []
+        for url, content in self.documents.items():
+            overlap = len(words & set(normalize_query(content).split()))
+            if overlap:
+                scored.append((-overlap, url, content))
+        return [
+            {"url": url, "content": content, "score": -neg}
+            for neg, url, content in sorted(scored)[: self.max_results]
+        ]
+
+    def invoke(self, payload, *args, **kwargs) -> List[Dict]:
+        query = _query_of(payload)
+        with self._lock:
+            self.calls.append(query)
+        if self.latency:
+            time.sleep(self.latency)
+        return self._search(query)
+
+    async def ainvoke(self, payload, *args, **kwargs) -> List[Dict]:
+        query = _query_of(payload)
+        with self._lock:
+            self.calls.append(query)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._search(query)
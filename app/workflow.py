@@ -1,27 +1,46 @@
 from langgraph.graph import END, StateGraph, START
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain import hub
+from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
-from typing import List, Literal, Optional, Dict
+from typing import List, Literal, Optional, Dict, Tuple, Union
 from typing_extensions import TypedDict
 from pprint import pprint
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.runnables import RunnableLambda
 from pydantic import BaseModel, Field
-from langchain_ollama import Ollama
-from langchain.document_loaders import TextLoader  # 支持本地文本加载
-from langchain_community.vectorstores import Chroma
-from modals import *
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import asyncio
+import contextvars
+import functools
+import logging
 import os
+import tempfile
 
+import numpy as np
 
+
+from app.budget import BUDGET_EXHAUSTED, BudgetTracker, RequestBudget
+from app.config import RAG_LOCAL_ROUTER
+from app.context import ContextAssembler
+from app.index import IndexManifest
+from app.index.bm25 import BM25Index
+from app.index.embeddings import EmbeddingAdapter
+from app.index.flat_store import FlatRetriever, FlatVectorStore
+from app.index.hybrid import HybridRetriever
+from app.index.pipeline import ChromaSink, IngestionPipeline, SourceLoader
+from app.modals import EmbeddingModel
 from app.modals.chat_llm import get_llm
+from app.modals.embedding_cache import cached_embedding_model
+from app.modals.query_batcher import BatchingEmbed
+from app.router import EmbeddingRouter
+from app.semantic_cache import SemanticCache
+from app.telemetry import RequestTrace, trace_request, traced_node
+from app.tools.web_search import CachedSearch
 from dotenv import load_dotenv, find_dotenv
+
 load_dotenv(find_dotenv())
 
+logger = logging.getLogger(__name__)
+
 
 class RouteQuery(BaseModel):
     datasource: Literal["vectorstore", "web_search"] = Field(...)
@@ -39,97 +58,541 @@ class GradeAnswer(BaseModel):
     binary_score: str = Field(...)
 
 
-class GraphState(TypedDict):
+class GradeGeneration(BaseModel):
+    grounded: str = Field(
+        ..., description="yes if the answer is supported by the facts"
+    )
+    answers_question: str = Field(
+        ..., description="yes if the answer resolves the question"
+    )
+
+
+GradingMode = Literal["sequential", "concurrent", "batch"]
+
+GenerationGradingMode = Literal["sequential", "speculative", "merged"]
+
+RetrievalMode = Literal["dense", "hybrid"]
+
+VectorStoreType = Literal["chroma", "flat"]
+
+# Tag of the answer-generating chain, used to pick its tokens out of the stream
+GENERATION_TAG = "rag_generation"
+
+# Answer of a request whose budget ran out before anything was generated
+NO_ANSWER = (
+    "Sorry, I could not find enough relevant information to answer this question."
+)
+
+
+class GraphState(TypedDict, total=False):
     question: str
     generation: str
     documents: List[Document]
+    # Spending of the request, see `RequestBudget`
+    budget: BudgetTracker
+    # Why the answer is a best-effort one, set once the budget ran out
+    degraded: str
 
 
 def format_docs(docs: List[Document]) -> str:
     return "\n\n".join(doc.page_content for doc in docs)
 
 
+def web_documents(results) -> List[Document]:
+    """
+    One document per web search result, keeping its url as the source.
+    Search tools report a failed search as a string (e.g. the repr of an
+    HTTPError), which yields no documents rather than "facts".
+    """
+    if isinstance(results, str):
+        logger.warning(f"Web search failed: {results}")
+        return []
+    docs = []
+    for result in results or []:
+        content = result.get("content") or ""
+        if content.strip():
+            metadata = {k: result[k] for k in ("url", "title") if result.get(k)}
+            if "url" in metadata:
+                metadata["source"] = metadata["url"]
+            docs.append(Document(page_content=content, metadata=metadata))
+    return docs
+
+
+async def _ainvoke(runnable, payload):
+    """
+    `ainvoke`, or `invoke` in a worker thread for tools that only have that.
+    """
+    ainvoke = getattr(runnable, "ainvoke", None)
+    if ainvoke is None:
+        return await asyncio.to_thread(runnable.invoke, payload)
+    return await ainvoke(payload)
+
+
 class DocumentVectorizer:
     def __init__(
         self,
         urls: Optional[List[str]] = None,
         local_paths: Optional[List[str]] = None,
         chunk_size: int = 500,
-        chunk_overlap: int = 0
+        chunk_overlap: int = 0,
+        persist_directory: Optional[str] = None,
+        collection_name: str = "rag-chroma",
+        load_workers: int = 8,
+        embed_batch_size: int = 64,
+        embedding=None,
+        retrieval_mode: RetrievalMode = "dense",
+        top_k: int = 4,
+        fetch_k: int = 20,
+        rrf_k: int = 60,
+        vector_store: Optional[VectorStoreType] = None,
+        flat_dtype: str = "float32",
+        quantization: Optional[str] = None,
+        rescore_factor: int = 4,
+        query_batch_wait_ms: Optional[float] = None,
+        splitter=None,
     ):
+        """
+        persist_directory: where the vector index and its manifest live.
+            Defaults to $VECTOR_INDEX_DIR; without either the index is kept
+            in memory (the flat store: in a temporary directory removed with
+            the vectorizer) and rebuilt on every start.
+        load_workers: number of sources fetched concurrently during `build`.
+        embed_batch_size: number of chunks handed to the embedding backend at
+            once during `build`; backends with `aencode` embed several such
+            batches concurrently.
+        embedding: an `EmbeddingModel` backend instance to use instead of the
+            one configured by the EMBEDDING_MODEL_* environment variables.
+        retrieval_mode: "dense" searches the vector store only; "hybrid"
+            also builds an in-process BM25 index over the chunks and fuses
+            the `fetch_k` best of both rankings with reciprocal-rank fusion
+            (constant `rrf_k`), which catches exact terms such as drug names
+            and gene ids.
+        top_k: number of chunks returned per query.
+        vector_store: "chroma" (default, or $VECTOR_STORE) or "flat", an
+            exact search over one memory-mapped matrix (see
+            `FlatVectorStore`) stored in "flat/" under `persist_directory`.
+        flat_dtype: "float32" or "float16" storage for the flat store.
+        quantization: "int8" or "pq" to search the flat store over compact
+            codes first and re-score the `rescore_factor * top_k` best rows
+            with the full vectors (flat store only). The full vectors stay on
+            disk for that, so this saves resident memory, not disk space.
+        query_batch_wait_ms: coalesce concurrent `encode_queries` calls that
+            arrive within this many milliseconds into one backend call (see
+            `BatchingEmbed`). Defaults to $EMBEDDING_QUERY_BATCH_MS, or 2,
+            for the configured backend; an injected `embedding` is only
+            wrapped when this is given. A negative value disables batching.
+        splitter: a text splitter to chunk documents with instead of the
+            tiktoken-sized `RecursiveCharacterTextSplitter` of `chunk_size`
+            tokens, which downloads its BPE files on first use.
+        """
+        if retrieval_mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        vector_store = vector_store or os.getenv("VECTOR_STORE", "chroma")
+        if vector_store not in ("chroma", "flat"):
+            raise ValueError(f"Unknown vector store: {vector_store}")
+        self.vector_store = vector_store
+        self.flat_dtype = flat_dtype
+        if quantization and vector_store != "flat":
+            raise ValueError("Quantization requires the flat vector store")
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.retrieval_mode = retrieval_mode
+        self.top_k = top_k
+        self.fetch_k = max(fetch_k, top_k)
+        self.rrf_k = rrf_k
         self.urls = urls or []
         self.local_paths = local_paths or []
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.persist_directory = persist_directory or os.getenv("VECTOR_INDEX_DIR")
+        self.collection_name = collection_name
+        self.load_workers = load_workers
+        self.embed_batch_size = embed_batch_size
+        self.splitter = splitter
         model_type = os.getenv("EMBEDDING_MODEL_TYPE")
         model_name = os.getenv("EMBEDDING_MODEL_NAME")
         model_key = os.getenv("EMBEDDING_MODEL_API_KEY")
         modal_base_url = os.getenv("EMBEDDING_MODEL_BASE_URL")
-        self.embedding = EmbeddingModel.get(model_type)(
-            model_name, model_name, modal_base_url)
+        self.embedding_settings = {"type": model_type, "name": model_name}
+        cache_dir = os.getenv("EMBEDDING_CACHE_DIR")
+        if embedding is not None:
+            self.embedding = embedding
+            self.embedding_settings = {
+                "type": type(embedding).__name__,
+                "name": getattr(embedding, "model_name", None),
+            }
+        elif cache_dir:
+            self.embedding = cached_embedding_model(
+                model_type, model_key, model_name, modal_base_url, cache_dir=cache_dir
+            )
+        else:
+            self.embedding = EmbeddingModel.get(model_type)(
+                model_key, model_name, base_url=modal_base_url
+            )
+        if query_batch_wait_ms is None and embedding is None:
+            query_batch_wait_ms = float(os.getenv("EMBEDDING_QUERY_BATCH_MS", "2"))
+        self._batcher = None
+        if query_batch_wait_ms is not None and query_batch_wait_ms >= 0:
+            self.embedding = self._batcher = BatchingEmbed(
+                self.embedding, max_wait_ms=query_batch_wait_ms
+            )
+        self.manifest: Optional[IndexManifest] = None
+        self.index_version: Optional[str] = None
+        self.bm25: Optional[BM25Index] = None
         self._retriever = None
+        self._sink = None
+        self._tempdir = None
+
+    def _index_settings(self) -> Dict:
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embedding": self.embedding_settings,
+            "vector_store": self.vector_store,
+        }
+
+    def _sources(self) -> List[Tuple[str, SourceLoader]]:
+        """
+        (source key, loader) per configured url and local file.
+        """
+        from langchain_community.document_loaders import TextLoader, WebBaseLoader
 
-    def build(self):
-        docs: List[Document] = []
         # 加载网络文档
-        for url in self.urls:
-            docs.extend(WebBaseLoader(url).load())
+        sources = [(url, WebBaseLoader(url).load) for url in self.urls]
+
+        def load_local(path):
+            # A deleted file is a removed source, see `IngestionPipeline`
+            if not os.path.isfile(path):
+                raise FileNotFoundError(path)
+            return TextLoader(path).load()
+
         # 加载本地文档
-        for path in self.local_paths:
-            docs.extend(TextLoader(path).load())
-        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap
-        )
-        corpus = splitter.split_documents(docs)
-        store = Chroma.from_documents(
-            documents=corpus,
-            collection_name="rag-chroma",
-            embedding=self.embedding
-        )
-        self._retriever = store.as_retriever()
+        sources.extend(
+            (os.path.normpath(path), functools.partial(load_local, path))
+            for path in self.local_paths
+        )
+        return sources
+
+    def _open_store(self, readonly: bool = False):
+        """
+        (store, sink) of the configured vector store backend.
+        """
+        if self.vector_store == "flat":
+            if self.persist_directory is None:
+                # Removed along with the vectorizer, or at exit
+                self._tempdir = tempfile.TemporaryDirectory(prefix="rag-flat-")
+                self.persist_directory = self._tempdir.name
+            store = FlatVectorStore(
+                os.path.join(self.persist_directory, "flat"),
+                dtype=self.flat_dtype,
+                readonly=readonly,
+                quantization=self.quantization,
+                rescore_factor=self.rescore_factor,
+            )
+            return store, store
+        from langchain_community.vectorstores import Chroma
+
+        store = Chroma(
+            collection_name=self.collection_name,
+            embedding_function=EmbeddingAdapter(self.embedding),
+            persist_directory=self.persist_directory,
+        )
+        return store, ChromaSink(store)
+
+    def _dense_retriever(self, store, k: int):
+        if isinstance(store, FlatVectorStore):
+            return FlatRetriever(store=store, embedding=self.embedding, k=k)
+        return store.as_retriever(search_kwargs={"k": k})
+
+    def build(self):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        store, sink = self._open_store()
+        manifest = IndexManifest.load(self.persist_directory)
+        settings = self._index_settings()
+        if manifest.settings != settings:
+            stale = manifest.all_chunk_ids()
+            if stale:
+                logger.info("Index settings changed, rebuilding the index")
+                sink.delete(stale)
+            manifest = IndexManifest(self.persist_directory, settings=settings)
+
+        splitter = (
+            self.splitter
+            or RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+            )
+        )
+        sources = self._sources()
+        pipeline = IngestionPipeline(
+            splitter,
+            self.embedding,
+            sink,
+            manifest,
+            load_workers=self.load_workers,
+            embed_batch_size=self.embed_batch_size,
+        )
+        stats = pipeline.run(sources)
+
+        seen = {source for source, _ in sources}
+        for source in [s for s in manifest.sources if s not in seen]:
+            removed = manifest.remove_source(source)
+            sink.delete(removed)
+            stats.removed += len(removed)
+
+        sink.commit()
+        manifest.save()
+        self.manifest = manifest
+        self.index_version = manifest.fingerprint
+        logger.info(
+            f"Index ready: {len(manifest.all_chunk_ids())} chunks, "
+            f"{stats.embedded} embedded, {stats.removed} removed, "
+            f"{stats.skipped} sources unchanged, {stats.failed} failed to load"
+        )
+        return self._make_retriever(store, sink)
+
+    def attach(self):
+        """
+        Open the index a previous `build` persisted, without loading or
+        embedding any source. The flat store is opened read-only, so any
+        number of processes can attach to the same files.
+        """
+        manifest = IndexManifest.load(self.persist_directory)
+        if manifest.path is None or not os.path.isfile(manifest.path):
+            raise RuntimeError(
+                f"No index found in {self.persist_directory!r}, build it first"
+            )
+        if manifest.settings != self._index_settings():
+            raise RuntimeError(
+                f"The index in {self.persist_directory!r} was built with other "
+                f"settings, rebuild it: {manifest.settings}"
+            )
+        store, sink = self._open_store(readonly=True)
+        self.manifest = manifest
+        self.index_version = manifest.fingerprint
+        logger.info(f"Attached to index with {len(manifest.all_chunk_ids())} chunks")
+        return self._make_retriever(store, sink)
+
+    def corpus_vectors(self, limit: int = 20000) -> np.ndarray:
+        """
+        Up to `limit` chunk vectors of the built or attached index, sampled
+        evenly, e.g. to fit an `EmbeddingRouter`.
+        """
+        if isinstance(self._sink, FlatVectorStore):
+            vectors = self._sink.vectors()
+            step = max(1, len(vectors) // limit)
+            return np.asarray(vectors[::step][:limit], dtype=np.float32)
+        if self._sink is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._sink.vectors(limit)
+
+    def _make_retriever(self, store, sink):
+        self._sink = sink
+        if self.retrieval_mode == "hybrid":
+            self.bm25 = BM25Index.from_documents(*sink.documents())
+            self._retriever = HybridRetriever(
+                dense=self._dense_retriever(store, self.fetch_k),
+                sparse=self.bm25,
+                k=self.top_k,
+                fetch_k=self.fetch_k,
+                rrf_k=self.rrf_k,
+            )
+        else:
+            self._retriever = self._dense_retriever(store, self.top_k)
         return self._retriever
 
+    def close(self) -> None:
+        """
+        Stop the query batching threads this vectorizer started and remove
+        its temporary index directory, if any. The retriever is unusable
+        afterwards.
+        """
+        if self._batcher is not None:
+            self._batcher.close()
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+
 
 class RAGWorkflow:
     def __init__(
         self,
         llm_provider: str = "basic",
         urls: Optional[List[str]] = None,
-        local_paths: Optional[List[str]] = None
+        local_paths: Optional[List[str]] = None,
+        grading_mode: GradingMode = "sequential",
+        grading_max_concurrency: int = 4,
+        grading_stop_after: Optional[int] = None,
+        generation_grading: GenerationGradingMode = "sequential",
+        persist_directory: Optional[str] = None,
+        llm=None,
+        embedding=None,
+        web_search_tool=None,
+        semantic_cache: Union[bool, SemanticCache, None] = None,
+        vectorizer_kwargs: Optional[Dict] = None,
+        attach_index: bool = False,
+        budget: Optional[RequestBudget] = None,
+        router: Union[bool, EmbeddingRouter, None] = None,
+        context_assembler: Optional[ContextAssembler] = None,
     ):
-        self.llm = get_llm(llm_provider)
+        """
+        grading_mode: how `_grade_documents` calls the retrieval grader.
+            "sequential" grades one document at a time, "concurrent" runs up
+            to `grading_max_concurrency` grader calls in a thread pool, and
+            "batch" goes through the runnable's `batch` API in waves of
+            `grading_max_concurrency`.
+        grading_stop_after: stop grading once this many (at least 1)
+            relevant documents have been found. The kept documents are always
+            the first relevant ones in retrieval order, whatever the mode.
+        generation_grading: how a generated answer is graded. "sequential"
+            runs the answer grader only after the hallucination grader
+            passed; "speculative" starts both at once and drops the answer
+            grade when the answer is not grounded; "merged" asks for both
+            scores in one structured-output call. A dropped answer grade
+            that is already running (always, in sync runs) still completes,
+            costing its LLM call and tokens against the request budget, so
+            speculation falls back to sequential grading when the budget has
+            no room for the extra call.
+        persist_directory: directory of the persisted vector index, see
+            `DocumentVectorizer`.
+        llm, embedding, web_search_tool: ready-made components replacing the
+            configured chat model, embedding backend and Tavily search, e.g.
+            local stand-ins for tests and benchmarks.
+        semantic_cache: answer paraphrases of already answered questions
+            without running the graph. True builds a `SemanticCache` on the
+            index's embedding backend; an instance is used as is. Either way
+            the cache is cleared whenever the index changes.
+        vectorizer_kwargs: extra `DocumentVectorizer` options, such as
+            retrieval_mode="hybrid" or top_k.
+        attach_index: open the index already built in `persist_directory`
+            (see `DocumentVectorizer.attach`) instead of ingesting the
+            sources, e.g. in server workers sharing a prebuilt index.
+        budget: default per-request limits on query rewrites, regenerations,
+            wall-clock time, LLM calls and tokens; see `RequestBudget`,
+            defaults from the RAG_MAX_* environment variables. Once one runs
+            out the request returns its best answer so far, flagged as
+            degraded, instead of looping on.
+        router: route questions by embedding instead of an LLM call, asking
+            the LLM only when the router is unsure. True (the default when
+            RAG_LOCAL_ROUTER is on) builds an `EmbeddingRouter` on the
+            index's chunk vectors, which logs its decisions next to the
+            index unless it is attached; an instance is used as is.
+        context_assembler: packs the documents into the generation prompt
+            within a token budget, dropping near-duplicates; defaults to a
+            `ContextAssembler` of RAG_MAX_CONTEXT_TOKENS (3000) tokens. The
+            graders see the same packed documents.
+        """
+        if grading_mode not in ("sequential", "concurrent", "batch"):
+            raise ValueError(f"Unknown grading mode: {grading_mode}")
+        if grading_max_concurrency < 1:
+            raise ValueError("grading_max_concurrency must be at least 1")
+        if grading_stop_after is not None and grading_stop_after < 1:
+            raise ValueError("grading_stop_after must be at least 1")
+        if generation_grading not in ("sequential", "speculative", "merged"):
+            raise ValueError(f"Unknown generation grading mode: {generation_grading}")
+        self.generation_grading = generation_grading
+        self.grading_mode = grading_mode
+        self.grading_max_concurrency = grading_max_concurrency
+        self.grading_stop_after = grading_stop_after
+        self.budget = budget or RequestBudget.from_env()
+        self.context_assembler = context_assembler or ContextAssembler.from_env()
+        self.llm = llm or get_llm(llm_provider)
         self.question_router = self._init_router()
-        self.web_search_tool = TavilySearchResults(k=3)
+        if web_search_tool is None:
+            from app.tools.search import tavily_tool
+
+            web_search_tool = tavily_tool
+        if not isinstance(web_search_tool, CachedSearch):
+            web_search_tool = CachedSearch(web_search_tool)
+        self.web_search_tool = web_search_tool
         vectorizer = DocumentVectorizer(
             urls=urls,
-            local_paths=local_paths
+            local_paths=local_paths,
+            persist_directory=persist_directory,
+            embedding=embedding,
+            **(vectorizer_kwargs or {}),
         )
-        self.retriever = vectorizer.build()
+        self.vectorizer = vectorizer
+        self.retriever = vectorizer.attach() if attach_index else vectorizer.build()
         self.retrieval_grader = self._init_retrieval_grader()
         self.rag_chain = self._init_rag_chain()
         self.hallucination_grader = self._init_hallucination_grader()
         self.answer_grader = self._init_answer_grader()
+        self.generation_grader = (
+            self._init_generation_grader() if generation_grading == "merged" else None
+        )
         self.question_rewriter = self._init_question_rewriter()
         self.app = self._build_workflow()
+        if semantic_cache is True:
+            semantic_cache = SemanticCache(vectorizer.embedding)
+        # An empty cache is falsy, so test for the instance
+        self.semantic_cache = (
+            semantic_cache if isinstance(semantic_cache, SemanticCache) else None
+        )
+        if (
+            self.semantic_cache is not None
+            and self.semantic_cache.index_version is None
+        ):
+            self.semantic_cache.index_version = lambda: self.vectorizer.index_version
+        if router is None:
+            router = RAG_LOCAL_ROUTER
+        if router is True:
+            # Workers attached to a shared index don't write next to it
+            log_path = (
+                os.path.join(vectorizer.persist_directory, "router_decisions.jsonl")
+                if vectorizer.persist_directory and not attach_index
+                else None
+            )
+            router = EmbeddingRouter(
+                vectorizer.embedding,
+                corpus_vectors=vectorizer.corpus_vectors,
+                log_path=log_path,
+            )
+        self.router = router if isinstance(router, EmbeddingRouter) else None
+        if self.router is not None and self.router.index_version is None:
+            self.router.index_version = lambda: self.vectorizer.index_version
+
+    def close(self) -> None:
+        """
+        Release the threads and temporary files of the index, see
+        `DocumentVectorizer.close`.
+        """
+        self.vectorizer.close()
+
+    def warm_up(self, ping_llm: bool = False) -> None:
+        """
+        Run one retrieval so the embedding client connects and the index is
+        paged in before the first request. With `ping_llm` the chat model
+        also answers a one-word prompt.
+        """
+        self.retriever.invoke("warm up")
+        if self.router is not None:
+            self.router.route("warm up")
+        if ping_llm:
+            self.llm.invoke("ping")
 
     def _init_router(self):
         structured = self.llm.with_structured_output(RouteQuery)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Route question to rag or web search."),
-            ("human", "{question}")
-        ])
-        return prompt | structured
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", "Route question to rag or web search."),
+                ("human", "{question}"),
+            ]
+        )
+        return (prompt | structured).with_config(run_name="question_router")
 
     def _init_retrieval_grader(self):
 
         structured = self.llm.with_structured_output(GradeDocuments)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Assess document relevance. Give a binary score of yes or no."),
-            ("human",
-             "Retrieved document: {document}\nUser question: {question}")
-        ])
-        return prompt | structured
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    "Assess document relevance. Give a binary score of yes or no.",
+                ),
+                ("human", "Retrieved document: {document}\nUser question: {question}"),
+            ]
+        )
+        return (prompt | structured).with_config(run_name="retrieval_grader")
 
     def _init_rag_chain(self):
 
@@ -139,102 +602,722 @@ class RAGWorkflow:
         Answer:"""
 
         prompt = PromptTemplate.from_template(prompt_str)
-        return prompt | self.llm | StrOutputParser()
+        chain = prompt | self.llm | StrOutputParser()
+        return chain.with_config(run_name="rag_chain", tags=[GENERATION_TAG])
 
     def _init_hallucination_grader(self):
 
         structured = self.llm.with_structured_output(GradeHallucinations)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Grade groundedness."),
-            ("human", "Facts: {documents}\nGeneration: {generation}")
-        ])
-        return prompt | structured
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", "Grade groundedness."),
+                ("human", "Facts: {documents}\nGeneration: {generation}"),
+            ]
+        )
+        return (prompt | structured).with_config(run_name="hallucination_grader")
 
     def _init_answer_grader(self):
 
         structured = self.llm.with_structured_output(GradeAnswer)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Grade answer completeness."),
-            ("human", "Question: {question}\nGeneration: {generation}")
-        ])
-        return prompt | structured
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", "Grade answer completeness."),
+                ("human", "Question: {question}\nGeneration: {generation}"),
+            ]
+        )
+        return (prompt | structured).with_config(run_name="answer_grader")
+
+    def _init_generation_grader(self):
+
+        structured = self.llm.with_structured_output(GradeGeneration)
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    "Grade the generation. grounded: is it supported by the facts, "
+                    "yes or no. answers_question: does it resolve the question, yes or no.",
+                ),
+                (
+                    "human",
+                    "Facts: {documents}\nQuestion: {question}\nGeneration: {generation}",
+                ),
+            ]
+        )
+        return (prompt | structured).with_config(run_name="generation_grader")
 
     def _init_question_rewriter(self):
 
-        return ChatPromptTemplate.from_messages([
-            ("system", "Rewrite question for vector retrieval."),
-            ("human",
-             "Original question: {question}\nFormulate improved question:")
-        ]) | self.llm | StrOutputParser()
+        chain = (
+            ChatPromptTemplate.from_messages(
+                [
+                    ("system", "Rewrite question for vector retrieval."),
+                    (
+                        "human",
+                        "Original question: {question}\nFormulate improved question:",
+                    ),
+                ]
+            )
+            | self.llm
+            | StrOutputParser()
+        )
+        return chain.with_config(run_name="question_rewriter")
 
     def _retrieve(self, state: GraphState) -> GraphState:
         docs = self.retriever.invoke(state["question"])
         return {**state, "documents": docs}
 
-    def _grade_documents(self, state: GraphState) -> GraphState:
-        qs = state["question"]
-        filtered = []
-        for doc in state.get("documents", []):
-            score = self.retrieval_grader.invoke(
-                {"question": qs, "document": doc.page_content})
-            if score.binary_score == "yes":
-                filtered.append(doc)
+    async def _aretrieve(self, state: GraphState) -> GraphState:
+        docs = await self.retriever.ainvoke(state["question"])
+        return {**state, "documents": docs}
+
+    @staticmethod
+    def _grading_inputs(state: GraphState) -> List[Dict]:
+        return [
+            {"question": state["question"], "document": doc.page_content}
+            for doc in state.get("documents", [])
+        ]
+
+    def _keep_relevant(
+        self, state: GraphState, scores: List[Optional[bool]]
+    ) -> GraphState:
+        docs = state.get("documents", [])
+        filtered = [doc for doc, relevant in zip(docs, scores) if relevant]
+        if self.grading_stop_after is not None:
+            filtered = filtered[: self.grading_stop_after]
         return {**state, "documents": filtered}
 
+    def _grade_documents(self, state: GraphState) -> GraphState:
+        inputs = self._grading_inputs(state)
+        if self.grading_mode == "concurrent":
+            scores = self._grade_concurrent(inputs)
+        elif self.grading_mode == "batch":
+            scores = self._grade_batch(inputs)
+        else:
+            scores = self._grade_sequential(inputs)
+        return self._keep_relevant(state, scores)
+
+    async def _agrade_documents(self, state: GraphState) -> GraphState:
+        inputs = self._grading_inputs(state)
+        if self.grading_mode == "concurrent":
+            scores = await self._agrade_concurrent(inputs)
+        elif self.grading_mode == "batch":
+            scores = await self._agrade_batch(inputs)
+        else:
+            scores = await self._agrade_sequential(inputs)
+        return self._keep_relevant(state, scores)
+
+    def _enough_relevant(self, scores: List[Optional[bool]]) -> bool:
+        """
+        True once the leading graded prefix of `scores` holds
+        `grading_stop_after` relevant documents. Documents still being
+        graded (None) end the prefix, so the result never depends on the
+        order in which concurrent calls complete.
+        """
+        if self.grading_stop_after is None:
+            return False
+        found = 0
+        for relevant in scores:
+            if relevant is None:
+                return False
+            if relevant:
+                found += 1
+                if found >= self.grading_stop_after:
+                    return True
+        return False
+
+    def _grade_sequential(self, inputs: List[Dict]) -> List[Optional[bool]]:
+        scores: List[Optional[bool]] = [None] * len(inputs)
+        for i, payload in enumerate(inputs):
+            score = self.retrieval_grader.invoke(payload)
+            scores[i] = score.binary_score == "yes"
+            if self._enough_relevant(scores[: i + 1]):
+                break
+        return scores
+
+    def _grade_concurrent(self, inputs: List[Dict]) -> List[Optional[bool]]:
+        scores: List[Optional[bool]] = [None] * len(inputs)
+        if not inputs:
+            return scores
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.grading_max_concurrency, len(inputs)),
+            thread_name_prefix="grade-documents",
+        )
+        try:
+            # Each call runs in a copy of the caller's context so tracing and
+            # LangChain's run-tree propagation keep working in the pool
+            pending = {
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self.retrieval_grader.invoke,
+                    payload,
+                ): i
+                for i, payload in enumerate(inputs)
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scores[pending.pop(future)] = future.result().binary_score == "yes"
+                if self._enough_relevant(scores):
+                    break
+        finally:
+            # Do not wait for grader calls whose result is no longer needed
+            executor.shutdown(wait=False, cancel_futures=True)
+        return scores
+
+    def _grade_batch(self, inputs: List[Dict]) -> List[Optional[bool]]:
+        scores: List[Optional[bool]] = [None] * len(inputs)
+        wave = (
+            self.grading_max_concurrency
+            if self.grading_stop_after is not None
+            else len(inputs)
+        )
+        for start in range(0, len(inputs), max(wave, 1)):
+            batch = inputs[start : start + wave]
+            results = self.retrieval_grader.batch(
+                batch, config={"max_concurrency": self.grading_max_concurrency}
+            )
+            for offset, score in enumerate(results):
+                scores[start + offset] = score.binary_score == "yes"
+            if self._enough_relevant(scores[: start + len(batch)]):
+                break
+        return scores
+
+    async def _agrade_sequential(self, inputs: List[Dict]) -> List[Optional[bool]]:
+        scores: List[Optional[bool]] = [None] * len(inputs)
+        for i, payload in enumerate(inputs):
+            score = await self.retrieval_grader.ainvoke(payload)
+            scores[i] = score.binary_score == "yes"
+            if self._enough_relevant(scores[: i + 1]):
+                break
+        return scores
+
+    async def _agrade_concurrent(self, inputs: List[Dict]) -> List[Optional[bool]]:
+        scores: List[Optional[bool]] = [None] * len(inputs)
+        semaphore = asyncio.Semaphore(self.grading_max_concurrency)
+
+        async def grade(payload):
+            async with semaphore:
+                return await self.retrieval_grader.ainvoke(payload)
+
+        tasks = {
+            asyncio.ensure_future(grade(payload)): i for i, payload in enumerate(inputs)
+        }
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    scores[tasks[task]] = task.result().binary_score == "yes"
+                if self._enough_relevant(scores):
+                    break
+        finally:
+            # Drop grader calls whose result is no longer needed
+            for task in tasks:
+                task.cancel()
+        return scores
+
+    async def _agrade_batch(self, inputs: List[Dict]) -> List[Optional[bool]]:
+        scores: List[Optional[bool]] = [None] * len(inputs)
+        wave = (
+            self.grading_max_concurrency
+            if self.grading_stop_after is not None
+            else len(inputs)
+        )
+        for start in range(0, len(inputs), max(wave, 1)):
+            batch = inputs[start : start + wave]
+            results = await self.retrieval_grader.abatch(
+                batch, config={"max_concurrency": self.grading_max_concurrency}
+            )
+            for offset, score in enumerate(results):
+                scores[start + offset] = score.binary_score == "yes"
+            if self._enough_relevant(scores[: start + len(batch)]):
+                break
+        return scores
+
+    @staticmethod
+    def _count(state: GraphState, loop: str) -> None:
+        tracker = state.get("budget")
+        if tracker is not None:
+            setattr(tracker, loop, getattr(tracker, loop) + 1)
+
     def _transform_query(self, state: GraphState) -> GraphState:
+        self._count(state, "rewrites")
         new_q = self.question_rewriter.invoke({"question": state["question"]})
         return {**state, "question": new_q}
 
+    async def _atransform_query(self, state: GraphState) -> GraphState:
+        self._count(state, "rewrites")
+        new_q = await self.question_rewriter.ainvoke({"question": state["question"]})
+        return {**state, "question": new_q}
+
     def _web_search(self, state: GraphState) -> GraphState:
         results = self.web_search_tool.invoke({"query": state["question"]})
-        content = "\n".join(r["content"] for r in results)
-        return {**state, "documents": [Document(page_content=content)]}
+        return {**state, "documents": web_documents(results)}
+
+    async def _aweb_search(self, state: GraphState) -> GraphState:
+        results = await _ainvoke(self.web_search_tool, {"query": state["question"]})
+        return {**state, "documents": web_documents(results)}
 
     def _generate(self, state: GraphState) -> GraphState:
-        ctx = format_docs(state.get("documents", []))
+        self._count(state, "generations")
+        docs = self.context_assembler.select(state.get("documents", []))
         out = self.rag_chain.invoke(
-            {"context": ctx, "question": state["question"]})
-        return {**state, "generation": out}
+            {
+                "context": self.context_assembler.format(docs),
+                "question": state["question"],
+            }
+        )
+        # The graders check the answer against the context it was given
+        return {**state, "documents": docs, "generation": out}
+
+    async def _agenerate(self, state: GraphState) -> GraphState:
+        self._count(state, "generations")
+        docs = self.context_assembler.select(state.get("documents", []))
+        out = await self.rag_chain.ainvoke(
+            {
+                "context": self.context_assembler.format(docs),
+                "question": state["question"],
+            }
+        )
+        return {**state, "documents": docs, "generation": out}
+
+    def _route_question(self, state: GraphState) -> str:
+        features = None
+        if self.router is not None:
+            try:
+                datasource, features = self.router.route(state["question"])
+            except Exception as e:
+                logger.warning(f"Local routing failed, asking the LLM: {e}")
+            else:
+                if datasource is not None:
+                    return datasource
+        datasource = self.question_router.invoke(
+            {"question": state["question"]}
+        ).datasource
+        if features is not None:
+            self.router.record(features, datasource)
+        return datasource
+
+    async def _aroute_question(self, state: GraphState) -> str:
+        features = None
+        if self.router is not None:
+            try:
+                datasource, features = await self.router.aroute(state["question"])
+            except Exception as e:
+                logger.warning(f"Local routing failed, asking the LLM: {e}")
+            else:
+                if datasource is not None:
+                    return datasource
+        route = await self.question_router.ainvoke({"question": state["question"]})
+        if features is not None:
+            self.router.record(features, route.datasource)
+        return route.datasource
+
+    @staticmethod
+    def _generation_inputs(state: GraphState) -> Tuple[Dict, Dict]:
+        """
+        Inputs of the hallucination and the answer grader.
+        """
+        generation = state.get("generation", "")
+        return (
+            {
+                "documents": format_docs(state.get("documents", [])),
+                "generation": generation,
+            },
+            {"question": state["question"], "generation": generation},
+        )
+
+    @staticmethod
+    def _generation_verdict(grounded: bool, useful: Optional[bool]) -> str:
+        if not grounded:
+            return "not supported"
+        return "useful" if useful else "not useful"
+
+    @staticmethod
+    def _can_speculate(state: GraphState) -> bool:
+        # Both graders at once, where sequential grading may need only one
+        tracker = state.get("budget")
+        return tracker is None or tracker.has_room(2)
 
     def _grade_generation(self, state: GraphState) -> str:
-        hall = self.hallucination_grader.invoke({"documents": state.get(
-            "documents", []), "generation": state.get("generation", "")})
+        if self.generation_grading == "merged":
+            return self._grade_generation_merged(state)
+        if self.generation_grading == "speculative" and self._can_speculate(state):
+            return self._grade_generation_speculative(state)
+        hall_input, answer_input = self._generation_inputs(state)
+        hall = self.hallucination_grader.invoke(hall_input)
         if hall.binary_score == "yes":
-            ans = self.answer_grader.invoke(
-                {"question": state["question"], "generation": state["generation"]})
-            return "useful" if ans.binary_score == "yes" else "not useful"
+            ans = self.answer_grader.invoke(answer_input)
+            return self._generation_verdict(True, ans.binary_score == "yes")
         return "not supported"
 
+    def _grade_generation_speculative(self, state: GraphState) -> str:
+        hall_input, answer_input = self._generation_inputs(state)
+        executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="grade-generation"
+        )
+        try:
+            # As in `_grade_concurrent`, each call keeps the caller's context
+            hall = executor.submit(
+                contextvars.copy_context().run,
+                self.hallucination_grader.invoke,
+                hall_input,
+            )
+            ans = executor.submit(
+                contextvars.copy_context().run, self.answer_grader.invoke, answer_input
+            )
+            if hall.result().binary_score != "yes":
+                return "not supported"
+            return self._generation_verdict(True, ans.result().binary_score == "yes")
+        finally:
+            # An answer grade still running after a failed hallucination
+            # check is not waited for, but a thread cannot be interrupted:
+            # the call completes and is billed
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _grade_generation_merged(self, state: GraphState) -> str:
+        hall_input, answer_input = self._generation_inputs(state)
+        grade = self.generation_grader.invoke({**hall_input, **answer_input})
+        return self._generation_verdict(
+            grade.grounded == "yes", grade.answers_question == "yes"
+        )
+
+    async def _agrade_generation(self, state: GraphState) -> str:
+        hall_input, answer_input = self._generation_inputs(state)
+        if self.generation_grading == "merged":
+            grade = await self.generation_grader.ainvoke({**hall_input, **answer_input})
+            return self._generation_verdict(
+                grade.grounded == "yes", grade.answers_question == "yes"
+            )
+        if self.generation_grading == "speculative" and self._can_speculate(state):
+            ans = asyncio.ensure_future(self.answer_grader.ainvoke(answer_input))
+            try:
+                hall = await self.hallucination_grader.ainvoke(hall_input)
+                if hall.binary_score != "yes":
+                    return "not supported"
+                return self._generation_verdict(True, (await ans).binary_score == "yes")
+            finally:
+                # Drop the answer grade when the answer is not grounded
+                ans.cancel()
+        hall = await self.hallucination_grader.ainvoke(hall_input)
+        if hall.binary_score == "yes":
+            ans = await self.answer_grader.ainvoke(answer_input)
+            return self._generation_verdict(True, ans.binary_score == "yes")
+        return "not supported"
+
+    @staticmethod
+    def _after_grading(state: GraphState) -> str:
+        if state.get("documents"):
+            return "generate"
+        tracker = state.get("budget")
+        if tracker is not None:
+            reason = tracker.spent() or (None if tracker.can_rewrite() else "rewrites")
+            if reason:
+                tracker.exhausted = reason
+                return "budget_exhausted"
+        return "transform_query"
+
+    @staticmethod
+    def _within_budget(state: GraphState, grade: str) -> str:
+        """
+        The next step for a generation graded `grade`, or "budget_exhausted"
+        when that step would go over the request's budget.
+        """
+        tracker = state.get("budget")
+        if tracker is None or grade == "useful":
+            return grade
+        reason = tracker.spent()
+        if reason is None and grade == "not supported" and not tracker.can_regenerate():
+            reason = "regenerations"
+        if reason is None and grade == "not useful" and not tracker.can_rewrite():
+            reason = "rewrites"
+        if reason is None:
+            return grade
+        tracker.exhausted = reason
+        return "budget_exhausted"
+
+    def _check_generation(self, state: GraphState) -> str:
+        tracker = state.get("budget")
+        if tracker is not None and tracker.spent():
+            # No budget left to grade the answer, return it as is
+            return self._within_budget(state, "not useful")
+        return self._within_budget(state, self._grade_generation(state))
+
+    async def _acheck_generation(self, state: GraphState) -> str:
+        tracker = state.get("budget")
+        if tracker is not None and tracker.spent():
+            return self._within_budget(state, "not useful")
+        return self._within_budget(state, await self._agrade_generation(state))
+
+    def _budget_exhausted(self, state: GraphState) -> GraphState:
+        tracker = state.get("budget")
+        reason = (tracker.exhausted if tracker is not None else None) or "budget"
+        BUDGET_EXHAUSTED.inc(reason=reason)
+        logger.info(
+            f"Request budget exhausted ({reason}), returning best answer so far"
+        )
+        return {
+            **state,
+            "degraded": reason,
+            "generation": state.get("generation") or NO_ANSWER,
+        }
+
+    async def _abudget_exhausted(self, state: GraphState) -> GraphState:
+        return self._budget_exhausted(state)
+
+    @staticmethod
+    def _step(name: str, func, afunc) -> RunnableLambda:
+        """
+        Traced graph step with a sync body for `stream`/`invoke` and an
+        async one that `astream`/`ainvoke` run on the event loop.
+        """
+        return RunnableLambda(
+            traced_node(name)(func), afunc=traced_node(name)(afunc), name=name
+        )
+
     def _build_workflow(self):
         wf = StateGraph(GraphState)
-        wf.add_node("web_search", self._web_search)
-        wf.add_node("retrieve", self._retrieve)
-        wf.add_node("grade_documents", self._grade_documents)
-        wf.add_node("transform_query", self._transform_query)
-        wf.add_node("generate", self._generate)
+        wf.add_node(
+            "web_search", self._step("web_search", self._web_search, self._aweb_search)
+        )
+        wf.add_node("retrieve", self._step("retrieve", self._retrieve, self._aretrieve))
+        wf.add_node(
+            "grade_documents",
+            self._step(
+                "grade_documents", self._grade_documents, self._agrade_documents
+            ),
+        )
+        wf.add_node(
+            "transform_query",
+            self._step(
+                "transform_query", self._transform_query, self._atransform_query
+            ),
+        )
+        wf.add_node("generate", self._step("generate", self._generate, self._agenerate))
+        wf.add_node(
+            "budget_exhausted",
+            self._step(
+                "budget_exhausted", self._budget_exhausted, self._abudget_exhausted
+            ),
+        )
         wf.add_conditional_edges(
             START,
-            lambda s: self.question_router.invoke(
-                {"question": s["question"]}).datasource,
-            {"web_search": "web_search", "vectorstore": "retrieve"}
+            self._step("route_question", self._route_question, self._aroute_question),
+            {"web_search": "web_search", "vectorstore": "retrieve"},
         )
         wf.add_edge("web_search", "generate")
         wf.add_edge("retrieve", "grade_documents")
         wf.add_conditional_edges(
             "grade_documents",
-            lambda s: "generate" if s.get("documents") else "transform_query",
-            {"transform_query": "transform_query", "generate": "generate"}
+            self._after_grading,
+            {
+                "transform_query": "transform_query",
+                "generate": "generate",
+                "budget_exhausted": "budget_exhausted",
+            },
         )
         wf.add_edge("transform_query", "retrieve")
         wf.add_conditional_edges(
             "generate",
-            self._grade_generation,
-            {"useful": END, "not useful": "transform_query",
-                "not supported": "generate"}
+            self._step(
+                "grade_generation", self._check_generation, self._acheck_generation
+            ),
+            {
+                "useful": END,
+                "not useful": "transform_query",
+                "not supported": "generate",
+                "budget_exhausted": "budget_exhausted",
+            },
         )
+        wf.add_edge("budget_exhausted", END)
         return wf.compile()
 
-    def run(self, question: str):
-        for output in self.app.stream({"question": question}):
-            pprint(output)
-        print(output.get("generation", ""))
+    @staticmethod
+    def _node_event(node: str, update: Optional[Dict]) -> Dict:
+        event = {"node": node}
+        update = update or {}
+        if node == "transform_query":
+            event["question"] = update.get("question", "")
+        elif node in ("retrieve", "grade_documents", "web_search"):
+            event["documents"] = len(update.get("documents") or [])
+        elif node == "budget_exhausted":
+            event["degraded"] = update.get("degraded")
+        return event
+
+    def _start(
+        self, question: str, trace: RequestTrace, budget: Optional[RequestBudget]
+    ) -> Tuple[Dict, Dict]:
+        """
+        Graph input and run config of one request.
+        """
+        tracker = BudgetTracker(budget or self.budget)
+        return (
+            {"question": question, "budget": tracker},
+            {"callbacks": [trace.callback, tracker]},
+        )
+
+    @staticmethod
+    def _outcome(state: Dict) -> Dict:
+        """
+        Budget spending of a finished request, plus "degraded" with the
+        reason when its answer is a best-effort one.
+        """
+        outcome = {}
+        tracker = state.get("budget")
+        if tracker is not None:
+            outcome["budget"] = tracker.as_dict()
+        if state.get("degraded"):
+            outcome["degraded"] = state["degraded"]
+        return outcome
+
+    async def astream(self, question: str, budget: Optional[RequestBudget] = None):
+        """
+        Run the graph and yield (event, data) pairs as they happen: "route"
+        with the datasource picked by the router, "node" after each node
+        finishes, "token" for every token of the generated answer, and "end"
+        with the final generation. A regenerated answer streams its tokens
+        again after a new "node" event for "generate". When `budget` (or the
+        workflow's default) runs out, "end" carries the best answer so far
+        and "degraded" with the reason.
+        """
+        with trace_request(question) as trace:
+            cached, vector = await self._acache_lookup(question)
+            if cached is not None:
+                yield "node", {
+                    "node": "semantic_cache",
+                    "similarity": cached.similarity,
+                }
+                yield "token", {"content": cached.generation}
+                yield "end", {
+                    "generation": cached.generation,
+                    "trace_id": trace.id,
+                    "cached": True,
+                }
+                return
+            async for event, data in self._astream_events(question, trace, budget):
+                if event == "end":
+                    self._cache_store(
+                        question,
+                        vector,
+                        data["generation"],
+                        data.pop("documents"),
+                        data.get("degraded"),
+                    )
+                yield event, data
+
+    async def _astream_events(
+        self, question: str, trace: RequestTrace, budget: Optional[RequestBudget] = None
+    ):
+        generation = ""
+        documents = []
+        final = {}
+        routed = False
+        inputs, config = self._start(question, trace, budget)
+        async for mode, payload in self.app.astream(
+            inputs, config, stream_mode=["updates", "messages"]
+        ):
+            if mode == "messages":
+                chunk, metadata = payload
+                content = getattr(chunk, "content", None)
+                if (
+                    content
+                    and isinstance(content, str)
+                    and GENERATION_TAG in metadata.get("tags", ())
+                ):
+                    yield "token", {"content": content}
+                continue
+            for node, update in payload.items():
+                if not routed and node in ("retrieve", "web_search"):
+                    routed = True
+                    yield "route", {
+                        "datasource": (
+                            "vectorstore" if node == "retrieve" else "web_search"
+                        )
+                    }
+                if node in ("generate", "budget_exhausted") and update:
+                    generation = update.get("generation", "")
+                    documents = update.get("documents", [])
+                    final = update
+                yield "node", self._node_event(node, update)
+        yield "end", {
+            "generation": generation,
+            "trace_id": trace.id,
+            "documents": documents,
+            **self._outcome({**final, "budget": inputs["budget"]}),
+        }
+
+    def _cache_lookup(self, question: str):
+        if self.semantic_cache is None:
+            return None, None
+        return self.semantic_cache.lookup(question)
+
+    async def _acache_lookup(self, question: str):
+        if self.semantic_cache is None:
+            return None, None
+        vector = await self.semantic_cache.aembed(question)
+        if vector is None:
+            return None, None
+        return self.semantic_cache.lookup(question, vector)
+
+    def _cache_store(
+        self,
+        question: str,
+        vector,
+        generation: str,
+        documents,
+        degraded: Optional[str] = None,
+    ) -> None:
+        # Best-effort answers of an exhausted budget are never reused
+        if self.semantic_cache is not None and generation and not degraded:
+            self.semantic_cache.store(question, generation, documents, vector)
+
+    def run(self, question: str, budget: Optional[RequestBudget] = None):
+        with trace_request(question) as trace:
+            cached, vector = self._cache_lookup(question)
+            if cached is not None:
+                print(cached.generation)
+                return {**trace.as_dict(), "cached": True}
+            inputs, config = self._start(question, trace, budget)
+            for output in self.app.stream(inputs, config):
+                pprint(output)
+            state = output.get("generate") or output.get("budget_exhausted") or {}
+            outcome = self._outcome({**state, "budget": inputs["budget"]})
+            self._cache_store(
+                question,
+                vector,
+                state.get("generation", ""),
+                state.get("documents", []),
+                outcome.get("degraded"),
+            )
+        print(state.get("generation", ""))
+        return {**trace.as_dict(), **outcome}
+
+    async def arun(self, question: str, budget: Optional[RequestBudget] = None) -> Dict:
+        """
+        Async `run`: answer `question` on the running event loop, with every
+        node awaiting its LLM, embedding and search calls, and return the
+        trace summary plus the final "generation", the "budget" spent and,
+        for a best-effort answer, the "degraded" reason.
+        """
+        with trace_request(question) as trace:
+            cached, vector = await self._acache_lookup(question)
+            if cached is not None:
+                return {
+                    **trace.as_dict(),
+                    "generation": cached.generation,
+                    "cached": True,
+                }
+            inputs, config = self._start(question, trace, budget)
+            state = await self.app.ainvoke(inputs, config)
+            generation = state.get("generation", "")
+            outcome = self._outcome(state)
+            self._cache_store(
+                question,
+                vector,
+                generation,
+                state.get("documents", []),
+                outcome.get("degraded"),
+            )
+        return {**trace.as_dict(), "generation": generation, **outcome}
@@ -0,0 +1,548 @@
+"""
+Offline benchmark for RAGWorkflow.
+
+Builds the workflow against deterministic local stand-ins for the chat
+model, the embedding backend and web search, each with a configurable
+fake latency, and measures:
+
+- ingestion throughput of DocumentVectorizer.build, cold and warm
+- per-node latency (a node's time includes its outgoing conditional edge)
+- end-to-end p50/p95/p99 latency and LLM calls per question, answered
+  through `RAGWorkflow.arun` with a request budget, counting failed and
+  budget-exhausted runs
+- peak Python memory (tracemalloc) and peak RSS
+- size, recall@k and query latency of the flat vector store with int8 and
+  product-quantized codes, before and after full-precision re-scoring
+
+The index uses the flat store and a word-count text splitter, so nothing
+needs the network or chromadb; --tiktoken switches to the token-sized
+splitter of a real index. Results are written as JSON so runs can be
+compared, e.g.
+
+    python examples/benchmark.py --docs 200 --queries 50 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import ConfigDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.budget import RequestBudget  # noqa: E402
+from app.index.flat_store import FlatVectorStore  # noqa: E402
+from app.workflow import DocumentVectorizer, RAGWorkflow  # noqa: E402
+
+VOCABULARY = [
+    "crohn",
+    "colitis",
+    "ulcerative",
+    "mucosa",
+    "biopsy",
+    "remission",
+    "flare",
+    "infliximab",
+    "adalimumab",
+    "vedolizumab",
+    "ustekinumab",
+    "mesalamine",
+    "steroid",
+    "fistula",
+    "stricture",
+    "calprotectin",
+    "endoscopy",
+    "diet",
+    "microbiome",
+    "NOD2",
+    "IL-23",
+    "TNF",
+    "integrin",
+    "JAK",
+    "surgery",
+    "ileum",
+    "colon",
+    "inflammation",
+    "dosage",
+    "trial",
+    "pediatric",
+    "fatigue",
+]
+
+
+def _stable_fraction(text: str) -> float:
+    return (zlib.crc32(text.encode("utf-8")) % 10000) / 10000
+
+
+class CallStats:
+    """Thread-safe call counters and latencies of the fake components."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.calls[name] += 1
+            self.latencies[name].append(seconds)
+
+    def total_calls(self, prefix: str = "") -> int:
+        with self._lock:
+            return sum(n for name, n in self.calls.items() if name.startswith(prefix))
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model. Plain calls return a short synthetic answer;
+    structured-output calls return the schema filled in from a hash of the
+    prompt, so the same question always takes the same path through the graph.
+    """
+
+    latency: float = 0.05
+    relevance: float = 0.5
+    web_ratio: float = 0.2
+    stats: CallStats
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        time.sleep(self.latency)
+        prompt = messages[-1].content
+        words = [w for w in prompt.split() if w in VOCABULARY][:12]
+        text = "Synthetic answer about " + " ".join(words or ["nothing"]) + "."
+        self.stats.record("llm.generate", time.perf_counter() - started)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def with_structured_output(self, schema, **kwargs):
+        name = schema.__name__
+
+        def respond(prompt_value):
+            started = time.perf_counter()
+            time.sleep(self.latency)
+            text = prompt_value.to_string()
+            if name == "RouteQuery":
+                datasource = (
+                    "web_search"
+                    if _stable_fraction(text) < self.web_ratio
+                    else "vectorstore"
+                )
+                result = schema(datasource=datasource)
+            elif name == "GradeDocuments":
+                relevant = _stable_fraction(text) < self.relevance
+                result = schema(binary_score="yes" if relevant else "no")
+            else:
+                result = schema(binary_score="yes")
+            self.stats.record(f"llm.{name}", time.perf_counter() - started)
+            return result
+
+        return RunnableLambda(respond)
+
+
+class FakeEmbedding:
+    """
+    Hashed bag-of-words embedding with the `EmbeddingModel` interface.
+    """
+
+    model_name = "fake-hash-embedding"
+
+    def __init__(self, stats: CallStats, dim: int = 256, latency: float = 0.02):
+        self.stats = stats
+        self.dim = dim
+        self.latency = latency
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vec[zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def encode(self, texts: list):
+        started = time.perf_counter()
+        time.sleep(self.latency)
+        vectors = (
+            np.stack([self._vector(t) for t in texts])
+            if texts
+            else np.zeros((0, self.dim))
+        )
+        self.stats.record("embedding.encode", time.perf_counter() - started)
+        return vectors, sum(len(t.split()) for t in texts)
+
+    def encode_queries(self, text: str):
+        started = time.perf_counter()
+        time.sleep(self.latency)
+        vector = self._vector(text)
+        self.stats.record("embedding.encode_queries", time.perf_counter() - started)
+        return vector, len(text.split())
+
+
+class FakeWebSearch:
+    """Stand-in for the Tavily tool, returning `k` synthetic results."""
+
+    def __init__(self, stats: CallStats, latency: float = 0.3, k: int = 3):
+        self.stats = stats
+        self.latency = latency
+        self.k = k
+
+    def invoke(self, payload: Dict):
+        started = time.perf_counter()
+        time.sleep(self.latency)
+        query = payload["query"]
+        rng = random.Random(query)
+        results = [
+            {
+                "url": f"https://example.org/{i}",
+                "content": f"{query} " + " ".join(rng.choices(VOCABULARY, k=40)),
+            }
+            for i in range(self.k)
+        ]
+        self.stats.record("web_search", time.perf_counter() - started)
+        return results
+
+
+def write_corpus(
+    directory: str, n_docs: int, words_per_doc: int, seed: int
+) -> List[str]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n_docs):
+        path = os.path.join(directory, f"doc_{i:05d}.txt")
+        sentences = []
+        for _ in range(max(1, words_per_doc // 12)):
+            sentences.append(" ".join(rng.choices(VOCABULARY, k=12)).capitalize() + ".")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(" ".join(sentences))
+        paths.append(path)
+    return paths
+
+
+def make_questions(n: int, seed: int) -> List[str]:
+    rng = random.Random(seed + 1)
+    return [
+        f"What is known about {' and '.join(rng.sample(VOCABULARY, 2))}?"
+        for _ in range(n)
+    ]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    arr = np.asarray(values) * 1000
+    return {
+        "count": int(arr.size),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+
+def vectorizer_options(args) -> Dict:
+    """
+    `DocumentVectorizer` options shared by the ingestion and query runs.
+    Unless --tiktoken is given, chunks are sized in words rather than
+    tokens, since the tiktoken splitter downloads its BPE files.
+    """
+    options = {
+        "chunk_size": args.chunk_size,
+        "load_workers": args.load_workers,
+        "vector_store": args.vector_store,
+    }
+    if not args.tiktoken:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        options["splitter"] = RecursiveCharacterTextSplitter(
+            chunk_size=args.chunk_size,
+            chunk_overlap=0,
+            length_function=lambda text: len(text.split()),
+        )
+    return options
+
+
+def bench_ingestion(paths: List[str], index_dir: str, stats: CallStats, args) -> Dict:
+    results = {}
+    for phase in ("cold", "warm"):
+        embedding = FakeEmbedding(stats, latency=args.embed_latency)
+        vectorizer = DocumentVectorizer(
+            local_paths=paths,
+            persist_directory=index_dir,
+            embedding=embedding,
+            **vectorizer_options(args),
+        )
+        calls_before = stats.total_calls("embedding.encode")
+        started = time.perf_counter()
+        vectorizer.build()
+        elapsed = time.perf_counter() - started
+        chunks = len(vectorizer.manifest.all_chunk_ids())
+        results[phase] = {
+            "seconds": elapsed,
+            "documents": len(paths),
+            "chunks": chunks,
+            "chunks_per_second": chunks / elapsed if elapsed else None,
+            "embedding_calls": stats.total_calls("embedding.encode") - calls_before,
+        }
+    return results
+
+
+def bench_queries(
+    workflow: RAGWorkflow, questions: List[str], stats: CallStats
+) -> Dict:
+    """
+    Answer the questions one after another through `RAGWorkflow.arun`, so
+    each runs with the workflow's request budget and trace. Runs that fail
+    or return a best-effort answer after exhausting the budget are counted
+    in the latency percentiles like any other, and reported next to them.
+    """
+    node_latencies: Dict[str, List[float]] = defaultdict(list)
+    end_to_end: List[float] = []
+    llm_calls: List[int] = []
+    degraded: Counter = Counter()
+    failures = 0
+
+    async def run_all():
+        nonlocal failures
+        for question in questions:
+            calls_before = stats.total_calls("llm.")
+            started = time.perf_counter()
+            try:
+                result = await workflow.arun(question)
+            except Exception:
+                failures += 1
+                result = {}
+            end_to_end.append(time.perf_counter() - started)
+            llm_calls.append(stats.total_calls("llm.") - calls_before)
+            for node in result.get("nodes", []):
+                node_latencies[node["node"]].append(node["seconds"])
+            if result.get("degraded"):
+                degraded[result["degraded"]] += 1
+
+    asyncio.run(run_all())
+    return {
+        "end_to_end": percentiles(end_to_end),
+        "nodes": {
+            node: percentiles(values) for node, values in sorted(node_latencies.items())
+        },
+        "llm_calls_per_question": float(np.mean(llm_calls)) if llm_calls else None,
+        "failures": failures,
+        "degraded": dict(degraded),
+    }
+
+
+def bench_quantization(index_dir: str, args) -> Dict:
+    """
+    Flat store over clustered synthetic vectors, unquantized vs int8 vs PQ.
+    Recall@k is measured against exact search on the same vectors.
+    """
+    from langchain_core.documents import Document
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((64, args.quant_dim))
+    n = args.quant_vectors
+
+    def sample(count):
+        noise = 0.5 * rng.standard_normal((count, args.quant_dim))
+        return (centers[rng.integers(0, len(centers), count)] + noise).astype(
+            np.float32
+        )
+
+    vectors, queries = sample(n), sample(args.queries)
+    ids = [f"v{i}" for i in range(n)]
+    docs = [Document(page_content="") for _ in range(n)]
+    results = {}
+    for mode in (None, "int8", "pq"):
+        store = FlatVectorStore(
+            os.path.join(index_dir, f"quant-{mode}"),
+            quantization=mode,
+            rescore_factor=args.rescore_factor,
+        )
+        store.upsert(ids, docs, vectors)
+        started = time.perf_counter()
+        store.commit()
+        build_seconds = time.perf_counter() - started
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            store.search_vectors(query, k=args.top_k)
+            latencies.append(time.perf_counter() - started)
+        results[mode or "float32"] = {
+            "build_seconds": build_seconds,
+            "vector_bytes": store.nbytes,
+            "code_bytes": store.code_nbytes,
+            "recall_at_k": store.recall_at_k(queries, k=args.top_k),
+            "search": percentiles(latencies),
+        }
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=100, help="synthetic corpus size")
+    parser.add_argument("--doc-words", type=int, default=400, help="words per document")
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.05, help="seconds per LLM call"
+    )
+    parser.add_argument(
+        "--embed-latency", type=float, default=0.02, help="seconds per embedding call"
+    )
+    parser.add_argument(
+        "--search-latency", type=float, default=0.3, help="seconds per web search"
+    )
+    parser.add_argument(
+        "--relevance", type=float, default=0.5, help="share of docs graded relevant"
+    )
+    parser.add_argument(
+        "--web-ratio",
+        type=float,
+        default=0.2,
+        help="share of questions routed to web search",
+    )
+    parser.add_argument(
+        "--grading-mode",
+        default="sequential",
+        choices=["sequential", "concurrent", "batch"],
+    )
+    parser.add_argument("--grading-concurrency", type=int, default=4)
+    parser.add_argument("--load-workers", type=int, default=8)
+    parser.add_argument(
+        "--vector-store",
+        default="flat",
+        choices=["flat", "chroma"],
+        help="chroma needs chromadb installed",
+    )
+    parser.add_argument(
+        "--tiktoken",
+        action="store_true",
+        help="split by tokens like a real index (downloads the BPE files)",
+    )
+    parser.add_argument(
+        "--max-rewrites", type=int, default=2, help="query rewrites per request"
+    )
+    parser.add_argument(
+        "--max-regenerations", type=int, default=2, help="regenerations per request"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--top-k", type=int, default=4, help="k for recall@k of quantized search"
+    )
+    parser.add_argument(
+        "--quant-vectors",
+        type=int,
+        default=20000,
+        help="vectors in the quantization benchmark",
+    )
+    parser.add_argument("--quant-dim", type=int, default=384)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument(
+        "--output", default="bench_output.json", help="where to write the JSON results"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stats = CallStats()
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory(prefix="ibd-bench-") as workdir:
+        corpus_dir = os.path.join(workdir, "corpus")
+        os.makedirs(corpus_dir)
+        paths = write_corpus(corpus_dir, args.docs, args.doc_words, args.seed)
+        index_dir = os.path.join(workdir, "index")
+
+        ingestion = bench_ingestion(paths, index_dir, stats, args)
+
+        llm = FakeChatModel(
+            latency=args.llm_latency,
+            relevance=args.relevance,
+            web_ratio=args.web_ratio,
+            stats=stats,
+        )
+        workflow = RAGWorkflow(
+            local_paths=paths,
+            persist_directory=index_dir,
+            grading_mode=args.grading_mode,
+            grading_max_concurrency=args.grading_concurrency,
+            llm=llm,
+            embedding=FakeEmbedding(stats, latency=args.embed_latency),
+            web_search_tool=FakeWebSearch(stats, latency=args.search_latency),
+            vectorizer_kwargs=vectorizer_options(args),
+            budget=RequestBudget(
+                max_rewrites=args.max_rewrites,
+                max_regenerations=args.max_regenerations,
+            ),
+        )
+        queries = bench_queries(
+            workflow, make_questions(args.queries, args.seed), stats
+        )
+        quantization = bench_quantization(os.path.join(workdir, "quant"), args)
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss = maxrss if sys.platform == "darwin" else maxrss * 1024
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "ingestion": ingestion,
+        "queries": queries,
+        "quantization": quantization,
+        "components": {
+            name: percentiles(values)
+            for name, values in sorted(stats.latencies.items())
+        },
+        "memory": {"peak_traced_bytes": peak_traced, "peak_rss_bytes": peak_rss},
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    e2e = queries["end_to_end"]
+    print(
+        f"ingestion cold: {ingestion['cold']['chunks_per_second']:.1f} chunks/s, "
+        f"warm: {ingestion['warm']['seconds']:.2f}s"
+    )
+    if e2e:
+        print(
+            f"end-to-end p50 {e2e['p50_ms']:.0f}ms p95 {e2e['p95_ms']:.0f}ms "
+            f"p99 {e2e['p99_ms']:.0f}ms over {e2e['count']} questions "
+            f"({queries['failures']} failed, "
+            f"{sum(queries['degraded'].values())} out of budget)"
+        )
+    for mode, res in quantization.items():
+        print(
+            f"{mode}: {res['code_bytes'] or res['vector_bytes']} bytes searched, "
+            f"recall@{args.top_k} {res['recall_at_k']['quantized']:.3f} -> "
+            f"{res['recall_at_k']['rescored']:.3f} rescored"
+        )
+    print(f"results written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import argparse
 import logging
+import os
+
 import uvicorn
+from dotenv import load_dotenv
 
 # Configure logging
 logging.basicConfig(
@@ -9,12 +13,92 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-if __name__ == "__main__":
-    logger.info("Starting IBD KB API server")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="IBD KB API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="build the index once, then serve it from several worker "
+        "processes attached read-only, without auto-reload",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker processes in production mode (default: one per core)",
+    )
+    parser.add_argument(
+        "--skip-build",
+        action="store_true",
+        help="production mode: serve the index already in $VECTOR_INDEX_DIR as is",
+    )
+    parser.add_argument(
+        "--build-only",
+        action="store_true",
+        help="build or refresh the index in $VECTOR_INDEX_DIR and exit",
+    )
+    return parser.parse_args(argv)
+
+
+def build_index():
+    """
+    Ingest the configured sources into the persisted index, once, before any
+    worker starts.
+    """
+    from app.config import RAG_LOCAL_PATHS, RAG_URLS
+    from app.workflow import DocumentVectorizer
+
+    DocumentVectorizer(urls=RAG_URLS, local_paths=RAG_LOCAL_PATHS).build()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    load_dotenv()
+    if args.build_only or args.production:
+        if not os.getenv("VECTOR_INDEX_DIR"):
+            raise SystemExit("VECTOR_INDEX_DIR must be set to share a prebuilt index")
+        # Workers share the memory-mapped flat index through the page cache;
+        # with Chroma every worker would load its own copy of the HNSW index
+        os.environ.setdefault("VECTOR_STORE", "flat")
+        if os.environ["VECTOR_STORE"] != "flat":
+            raise SystemExit(
+                "Production mode serves the flat vector store, "
+                f"unset VECTOR_STORE (now {os.environ['VECTOR_STORE']!r}) or set it to flat"
+            )
+        if not args.skip_build:
+            logger.info("Building the index")
+            build_index()
+        if args.build_only:
+            return
+
+    if not args.production:
+        logger.info("Starting IBD KB API server")
+        uvicorn.run(
+            "app.api.app:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info",
+        )
+        return
+
+    workers = args.workers or os.cpu_count() or 1
+    # Read by app.config in every worker process
+    os.environ["RAG_ATTACH_INDEX"] = "true"
+    os.environ["RAG_WARMUP"] = "true"
+    logger.info(f"Starting IBD KB API server with {workers} workers")
     uvicorn.run(
         "app.api.app:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        reload=False,
         log_level="info",
-    )
\ No newline at end of file
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from tests.fakes import AsyncFakeChatModel, FakeEmbedding, FakeWebSearch
+
+
+@pytest.fixture
+def offline_splitter(monkeypatch):
+    # from_tiktoken_encoder downloads the BPE files on first use
+    monkeypatch.setattr(
+        RecursiveCharacterTextSplitter,
+        "from_tiktoken_encoder",
+        classmethod(lambda cls, **kwargs: cls(**kwargs)),
+    )
+
+
+@pytest.fixture
+def make_workflow(tmp_path, offline_splitter):
+    """
+    Builds a `RAGWorkflow` over a small local corpus with fake models, the
+    flat store and no embedding router; keyword arguments override.
+    """
+    from app.workflow import RAGWorkflow
+
+    source = tmp_path / "kb.txt"
+    source.write_text("\n\n".join(f"paragraph {i} about crohn" for i in range(20)))
+
+    def make(**kwargs):
+        return RAGWorkflow(
+            local_paths=[str(source)],
+            persist_directory=str(tmp_path / "index"),
+            llm=AsyncFakeChatModel(),
+            embedding=FakeEmbedding(),
+            web_search_tool=FakeWebSearch(),
+            vectorizer_kwargs={"vector_store": "flat", "chunk_size": 40},
+            **{"router": False, **kwargs},
+        )
+
+    return make
@@ -0,0 +1,132 @@
+"""
+Stand-ins for the chat model, embedding backend and web search shared by
+the tests.
+"""
+
+import asyncio
+import contextlib
+import threading
+import time
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import PrivateAttr
+
+LATENCY = 0.05
+
+
+class FakeEmbedding:
+    """Text-seeded random vectors, the same for documents and queries."""
+
+    def __init__(self, dim: int = 16):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        rng = np.random.default_rng(sum(map(ord, text)))
+        return rng.standard_normal(self.dim).astype(np.float32)
+
+    def encode(self, texts):
+        return np.stack([self._vector(t) for t in texts]), len(texts)
+
+    def encode_queries(self, text):
+        return self._vector(text), 1
+
+
+class RecordingEmbedding(FakeEmbedding):
+    """`FakeEmbedding` logging each call as ("encode", texts) or ("query", text)."""
+
+    model_name = "fake-v1"
+
+    def __init__(self, dim: int = 16):
+        super().__init__(dim)
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(("encode", list(texts)))
+        return super().encode(texts)
+
+    def encode_queries(self, text):
+        self.calls.append(("query", text))
+        return super().encode_queries(text)
+
+
+class AsyncFakeChatModel(BaseChatModel):
+    """Answers after `LATENCY` seconds; async calls sleep on the event loop."""
+
+    relevant: bool = True
+    grounded: bool = True
+    graded: int = 0
+    # Calls made, calls awaiting their answer right now and the most at once
+    calls: int = 0
+    in_flight: int = 0
+    peak: int = 0
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-async"
+
+    @contextlib.contextmanager
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _sleep(self):
+        with self._call():
+            time.sleep(LATENCY)
+
+    async def _asleep(self):
+        with self._call():
+            await asyncio.sleep(LATENCY)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._sleep()
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content="answer"))]
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await self._asleep()
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content="answer"))]
+        )
+
+    def _result(self, schema):
+        if schema.__name__ == "RouteQuery":
+            return schema(datasource="vectorstore")
+        if schema.__name__ == "GradeDocuments":
+            self.graded += 1
+            return schema(binary_score="yes" if self.relevant else "no")
+        if schema.__name__ == "GradeHallucinations":
+            return schema(binary_score="yes" if self.grounded else "no")
+        if schema.__name__ == "GradeGeneration":
+            return schema(
+                grounded="yes" if self.grounded else "no", answers_question="yes"
+            )
+        return schema(binary_score="yes")
+
+    def with_structured_output(self, schema, **kwargs):
+        def respond(prompt_value):
+            self._sleep()
+            return self._result(schema)
+
+        async def arespond(prompt_value):
+            await self._asleep()
+            return self._result(schema)
+
+        return RunnableLambda(respond, afunc=arespond)
+
+
+class FakeWebSearch:
+    def invoke(self, payload):
+        return [{"content": "web result"}]
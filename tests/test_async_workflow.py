@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from app.budget import BudgetTracker, RequestBudget
+from app.workflow import GradeAnswer, GradeHallucinations
+
+
+def test_arun_answers_through_async_nodes(make_workflow):
+    workflow = make_workflow()
+    result = asyncio.run(workflow.arun("what about crohn?"))
+
+    assert result["generation"] == "answer"
+    nodes = [n["node"] for n in result["nodes"]]
+    assert nodes[:4] == ["route_question", "retrieve", "grade_documents", "generate"]
+    assert result["chains"]["retrieval_grader"]["calls"] == 4
+
+
+def test_concurrent_questions_share_one_event_loop(make_workflow):
+    workflow = make_workflow()
+
+    async def ask_all():
+        return await asyncio.gather(
+            *(workflow.arun(f"question {i}") for i in range(20))
+        )
+
+    results = asyncio.run(ask_all())
+
+    assert all(r["generation"] == "answer" for r in results)
+    # The questions' LLM calls overlap instead of running one at a time
+    assert workflow.llm.peak >= 4
+
+
+@pytest.mark.parametrize("mode", ["sequential", "concurrent", "batch"])
+def test_async_grading_modes_stop_early(make_workflow, mode):
+    workflow = make_workflow(
+        grading_mode=mode, grading_max_concurrency=2, grading_stop_after=1
+    )
+    state = {"question": "crohn", "documents": workflow.retriever.invoke("crohn")}
+    graded = asyncio.run(workflow._agrade_documents(state))
+
+    assert len(graded["documents"]) == 1
+    assert graded["documents"][0] == state["documents"][0]
+    assert workflow.llm.graded <= 2
+
+
+def overlap_graders(workflow, grounded=True, wait=1.0):
+    """
+    Replaces the generation graders: the hallucination grade waits up to
+    `wait` seconds for the answer grade to start, and only passes (when
+    `grounded`) if it did, i.e. if both run at once.
+    """
+    started = threading.Event()
+    answers = []
+
+    def answer(payload):
+        answers.append(payload)
+        started.set()
+        return GradeAnswer(binary_score="yes")
+
+    async def aanswer(payload):
+        return answer(payload)
+
+    def hallucination(payload):
+        overlapped = started.wait(wait)
+        return GradeHallucinations(
+            binary_score="yes" if grounded and overlapped else "no"
+        )
+
+    async def ahallucination(payload):
+        deadline = time.monotonic() + wait
+        while not started.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+        overlapped = started.is_set()
+        return GradeHallucinations(
+            binary_score="yes" if grounded and overlapped else "no"
+        )
+
+    workflow.answer_grader = RunnableLambda(answer, afunc=aanswer)
+    workflow.hallucination_grader = RunnableLambda(hallucination, afunc=ahallucination)
+    return started, answers
+
+
+@pytest.mark.parametrize(
+    "mode, calls", [("sequential", 2), ("speculative", 2), ("merged", 1)]
+)
+def test_generation_grading_modes(make_workflow, mode, calls):
+    workflow = make_workflow(generation_grading=mode)
+    llm = workflow.llm
+    state = {"question": "crohn", "documents": [], "generation": "answer"}
+
+    assert workflow._grade_generation(state) == "useful"
+    assert llm.calls == calls
+    assert asyncio.run(workflow._agrade_generation(state)) == "useful"
+    assert llm.calls == 2 * calls
+
+    llm.grounded = False
+    assert workflow._grade_generation(state) == "not supported"
+    assert asyncio.run(workflow._agrade_generation(state)) == "not supported"
+
+
+def test_speculative_grading_overlaps_the_graders(make_workflow):
+    workflow = make_workflow(generation_grading="speculative")
+    state = {"question": "crohn", "documents": [], "generation": "answer"}
+
+    started, _ = overlap_graders(workflow)
+    assert workflow._grade_generation(state) == "useful"
+    started.clear()
+    assert asyncio.run(workflow._agrade_generation(state)) == "useful"
+
+
+def test_speculation_is_skipped_when_the_budget_is_nearly_spent(make_workflow):
+    workflow = make_workflow(generation_grading="speculative")
+    tracker = BudgetTracker(RequestBudget(max_llm_calls=5))
+    state = {
+        "question": "crohn",
+        "documents": [],
+        "generation": "answer",
+        "budget": tracker,
+    }
+
+    tracker.llm_calls = 4
+    _, answers = overlap_graders(workflow, grounded=False, wait=0.01)
+    assert workflow._grade_generation(state) == "not supported"
+    assert asyncio.run(workflow._agrade_generation(state)) == "not supported"
+    # Sequential grading never asks for the answer grade of an ungrounded answer
+    assert answers == []
+
+    tracker.llm_calls = 3
+    _, answers = overlap_graders(workflow, grounded=False)
+    assert workflow._grade_generation(state) == "not supported"
+    assert len(answers) == 1
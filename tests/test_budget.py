@@ -0,0 +1,101 @@
+import asyncio
+
+from app.budget import RequestBudget
+from app.semantic_cache import SemanticCache
+from app.workflow import NO_ANSWER
+from tests.fakes import AsyncFakeChatModel, FakeEmbedding
+
+
+class UngroundedChatModel(AsyncFakeChatModel):
+    """Every answer is graded as not supported by its documents."""
+
+    def _result(self, schema):
+        if schema.__name__ == "GradeHallucinations":
+            return schema(binary_score="no")
+        return super()._result(schema)
+
+
+def nodes(result):
+    return [n["node"] for n in result["nodes"]]
+
+
+def test_rewrite_loop_stops_with_a_flagged_answer(make_workflow):
+    workflow = make_workflow(budget=RequestBudget(max_rewrites=2))
+    workflow.llm.relevant = False
+
+    result = asyncio.run(workflow.arun("what about crohn?"))
+    assert result["generation"] == NO_ANSWER
+    assert result["degraded"] == "rewrites"
+    assert nodes(result).count("transform_query") == 2
+    assert result["budget"]["rewrites"] == 2
+
+
+def ungrounded(workflow):
+    workflow.llm = UngroundedChatModel()
+    workflow.hallucination_grader = workflow._init_hallucination_grader()
+    workflow.rag_chain = workflow._init_rag_chain()
+    workflow.app = workflow._build_workflow()
+    return workflow
+
+
+def collect(events):
+    async def run():
+        return [item async for item in events]
+
+    return asyncio.run(run())
+
+
+def test_regeneration_loop_keeps_the_last_answer(make_workflow):
+    workflow = ungrounded(make_workflow(budget=RequestBudget(max_regenerations=1)))
+
+    event, end = collect(workflow.astream("what about crohn?"))[-1]
+    assert event == "end"
+    assert end["generation"] == "answer"
+    assert end["degraded"] == "regenerations"
+    assert end["budget"]["generations"] == 2
+
+
+def test_llm_call_limit_returns_the_ungraded_answer(make_workflow):
+    workflow = ungrounded(
+        make_workflow(budget=RequestBudget(max_regenerations=None, max_llm_calls=2))
+    )
+
+    result = asyncio.run(workflow.arun("what about crohn?"))
+    assert result["generation"] == "answer"
+    assert result["degraded"] == "llm_calls"
+    assert result["budget"]["llm_calls"] == 2
+
+
+def test_deadline_stops_the_rewrite_loop(make_workflow):
+    workflow = make_workflow(budget=RequestBudget(max_rewrites=None, deadline=0.0))
+    workflow.llm.relevant = False
+
+    result = workflow.run("what about crohn?")
+    assert result["degraded"] == "deadline"
+    assert "transform_query" not in nodes(result)
+
+
+def test_degraded_answers_are_not_cached(make_workflow):
+    workflow = make_workflow(
+        budget=RequestBudget(max_rewrites=0),
+        semantic_cache=SemanticCache(FakeEmbedding()),
+    )
+    workflow.llm.relevant = False
+
+    result = asyncio.run(workflow.arun("what about crohn?"))
+    assert result["degraded"] == "rewrites"
+    assert len(workflow.semantic_cache) == 0
+
+    workflow.llm.relevant = True
+    result = asyncio.run(workflow.arun("what about crohn?"))
+    assert "degraded" not in result
+    assert len(workflow.semantic_cache) == 1
+
+
+def test_budget_from_env(monkeypatch):
+    monkeypatch.setenv("RAG_MAX_REWRITES", "-1")
+    monkeypatch.setenv("RAG_DEADLINE_SECONDS", "2.5")
+    budget = RequestBudget.from_env()
+    assert budget.max_rewrites is None
+    assert budget.max_regenerations == 2
+    assert budget.deadline == 2.5
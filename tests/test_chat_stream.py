@@ -0,0 +1,44 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import app.api.app as api
+
+
+def parse_events(body):
+    events = []
+    for block in body.replace("\r\n", "\n").strip().split("\n\n"):
+        fields = dict(
+            line.split(": ", 1) for line in block.splitlines() if ": " in line
+        )
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_reports_route_nodes_tokens_then_end(make_workflow, monkeypatch):
+    monkeypatch.setattr(api, "_workflow", make_workflow())
+    client = TestClient(api.app)
+
+    response = client.post(
+        "/api/chat/stream",
+        json={"messages": [{"role": "user", "content": "what about crohn?"}]},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_events(response.text)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "route" and events[0][1] == {"datasource": "vectorstore"}
+    assert kinds[-1] == "end" and events[-1][1]["generation"] == "answer"
+    nodes = [data["node"] for kind, data in events if kind == "node"]
+    assert nodes == ["retrieve", "grade_documents", "generate"]
+    # Tokens stream while "generate" runs, before its node event
+    generate = events.index(("node", {"node": "generate"}))
+    assert generate - 1 == max(i for i, kind in enumerate(kinds) if kind == "token")
+    assert "".join(d["content"] for k, d in events if k == "token") == "answer"
+
+
+def test_stream_needs_a_user_question(make_workflow, monkeypatch):
+    monkeypatch.setattr(api, "_workflow", make_workflow())
+    response = TestClient(api.app).post("/api/chat/stream", json={"messages": []})
+    assert response.status_code == 400
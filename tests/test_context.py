@@ -0,0 +1,49 @@
+from langchain_core.documents import Document
+
+from app.context import ContextAssembler
+from app.modals.embedding_model import num_tokens
+from app.workflow import web_documents
+
+
+def docs(*texts):
+    return [Document(page_content=t, metadata={"n": i}) for i, t in enumerate(texts)]
+
+
+def test_near_duplicates_are_dropped():
+    base = "crohn disease is a chronic inflammatory bowel disease of the gut"
+    picked = ContextAssembler().select(
+        docs(base, base + ".", "ulcerative colitis affects the colon")
+    )
+    assert [d.metadata["n"] for d in picked] == [0, 2]
+
+
+def test_budget_prefers_diverse_documents_and_keeps_order():
+    a = "remission maintenance with azathioprine for crohn patients " * 3
+    a_variant = a + "and methotrexate"
+    b = "diet advice for ibd flares: low residue, hydration and small meals"
+    budget = num_tokens(a) + num_tokens(b) + 5
+    assembler = ContextAssembler(max_tokens=budget, dedup_threshold=0.99, diversity=0.5)
+
+    picked = assembler.select(docs(a, a_variant, b))
+    assert [d.metadata["n"] for d in picked] == [0, 2]
+    assert num_tokens(assembler.format(picked)) <= budget
+
+
+def test_oversized_first_document_is_truncated():
+    long_text = "word " * 500
+    picked = ContextAssembler(max_tokens=50).select(docs(long_text, "short note"))
+    assert len(picked) == 1
+    assert picked[0].metadata["truncated"]
+    assert num_tokens(picked[0].page_content) <= 50
+
+
+def test_web_results_become_separate_documents():
+    results = [
+        {"url": "https://a.example", "content": "first"},
+        {"url": "https://b.example", "content": ""},
+        {"content": "second"},
+    ]
+    found = web_documents(results)
+    assert [d.page_content for d in found] == ["first", "second"]
+    assert found[0].metadata["source"] == "https://a.example"
+    assert web_documents("HTTPError('429 Too Many Requests')") == []
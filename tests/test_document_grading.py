@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from app.workflow import GradeDocuments
+
+RELEVANT = {1, 3, 4}
+MODES = ["sequential", "concurrent", "batch"]
+
+
+def make_grader(calls):
+    lock = threading.Lock()
+
+    def grade(payload):
+        i = int(payload["document"].split()[-1])
+        with lock:
+            calls.append(i)
+        # Later documents finish first, so completion order is reversed
+        time.sleep(0.005 * (10 - i))
+        return GradeDocuments(binary_score="yes" if i in RELEVANT else "no")
+
+    return RunnableLambda(grade)
+
+
+def grade(workflow, calls, count=10):
+    workflow.retrieval_grader = make_grader(calls)
+    docs = [Document(page_content=f"doc {i}") for i in range(count)]
+    graded = workflow._grade_documents({"question": "crohn", "documents": docs})
+    return [int(d.page_content.split()[-1]) for d in graded["documents"]]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_grading_keeps_retrieval_order(make_workflow, mode):
+    calls = []
+    workflow = make_workflow(grading_mode=mode, grading_max_concurrency=4)
+    assert grade(workflow, calls) == [1, 3, 4]
+    assert sorted(calls) == list(range(10))
+
+
+@pytest.mark.parametrize(
+    "mode, max_calls", [("sequential", 4), ("concurrent", 6), ("batch", 4)]
+)
+def test_grading_stops_after_enough_relevant(make_workflow, mode, max_calls):
+    calls = []
+    workflow = make_workflow(
+        grading_mode=mode, grading_max_concurrency=2, grading_stop_after=2
+    )
+    # Documents 0-3 decide the outcome; later ones may only be in flight
+    assert grade(workflow, calls) == [1, 3]
+    assert set(range(4)) <= set(calls) and len(calls) <= max_calls
+
+
+def test_grading_stop_after_must_be_positive(make_workflow):
+    with pytest.raises(ValueError, match="grading_stop_after"):
+        make_workflow(grading_stop_after=0)
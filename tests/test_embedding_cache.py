@@ -0,0 +1,88 @@
+import asyncio
+import itertools
+
+import numpy as np
+import pytest
+
+from app.modals import embedding_cache
+from app.modals.embedding_cache import CachedEmbed, DiskVectorCache
+from tests.fakes import FakeEmbedding, RecordingEmbedding
+
+
+class AsyncRecordingEmbedding(RecordingEmbedding):
+    async def aencode(self, texts, concurrency=4):
+        self.calls.append(("aencode", list(texts)))
+        return FakeEmbedding.encode(self, texts)
+
+
+def test_only_misses_reach_the_backend(tmp_path):
+    backend = RecordingEmbedding()
+    cached = CachedEmbed(backend, "Fake", str(tmp_path))
+
+    first, tokens = cached.encode(["a", "b"])
+    assert tokens == 2
+    vectors, tokens = cached.encode(["a", "b", "c", "a"])
+    assert backend.calls == [("encode", ["a", "b"]), ("encode", ["c"])]
+    assert tokens == 1 and (cached.hits, cached.misses) == (3, 3)
+    np.testing.assert_array_equal(vectors[[0, 1]], first)
+    np.testing.assert_array_equal(vectors[3], vectors[0])
+    np.testing.assert_array_equal(vectors[2], backend.encode(["c"])[0][0])
+
+
+def test_keys_separate_factories_and_models(tmp_path):
+    CachedEmbed(RecordingEmbedding(), "Fake", str(tmp_path)).encode(["a"])
+
+    reopened = RecordingEmbedding()
+    CachedEmbed(reopened, "Fake", str(tmp_path)).encode(["a"])
+    assert reopened.calls == []
+
+    other_factory = RecordingEmbedding()
+    CachedEmbed(other_factory, "Other", str(tmp_path)).encode(["a"])
+    other_model = RecordingEmbedding()
+    other_model.model_name = "fake-v2"
+    CachedEmbed(other_model, "Fake", str(tmp_path)).encode(["a"])
+    assert other_factory.calls == other_model.calls == [("encode", ["a"])]
+
+
+def test_disk_tier_evicts_least_recently_read(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: next(clock))
+    vector = np.ones(16, dtype=np.float32)
+    cache = DiskVectorCache(str(tmp_path), max_bytes=3 * vector.nbytes)
+    for key in "abc":
+        cache.put_many({key: vector})
+    assert set(cache.get_many(["a"])) == {"a"}
+
+    cache.put_many({"d": vector})
+    assert set(cache.get_many(list("abcd"))) == {"a", "c", "d"}
+    assert cache.size_bytes == 3 * vector.nbytes and len(cache) == 3
+
+
+def test_queries_are_served_from_the_hot_tier(tmp_path, monkeypatch):
+    backend = RecordingEmbedding()
+    cached = CachedEmbed(backend, "Fake", str(tmp_path))
+    vector, tokens = cached.encode_queries("crohn")
+    assert tokens == 1
+
+    monkeypatch.setattr(
+        cached.disk,
+        "get_many",
+        lambda keys: pytest.fail("hot queries must not hit disk"),
+    )
+    again, tokens = cached.encode_queries("crohn")
+    assert tokens == 0 and backend.calls == [("query", "crohn")]
+    np.testing.assert_array_equal(again, vector)
+
+
+def test_aencode_forwards_misses_to_the_async_backend(tmp_path):
+    backend = AsyncRecordingEmbedding()
+    cached = CachedEmbed(backend, "Fake", str(tmp_path))
+    cached.encode(["a"])
+
+    vectors, tokens = asyncio.run(cached.aencode(["a", "b"]))
+    assert backend.calls == [("encode", ["a"]), ("aencode", ["b"])]
+    assert vectors.shape == (2, 16) and tokens == 1
+
+    plain = RecordingEmbedding()
+    vectors, _ = asyncio.run(CachedEmbed(plain, "Fake", str(tmp_path)).aencode(["c"]))
+    assert plain.calls == [("encode", ["c"])] and vectors.shape == (1, 16)
@@ -0,0 +1,96 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.evaluator import Retrieval_Precision, Retrieval_Recall, Retrieval_TopK
+from app.evaluator.utils import MultiPatternMatcher, normalize_answer
+
+
+def reference_hits(doc_list, golden_answers, topk):
+    hits = []
+    for doc in doc_list[:topk]:
+        hits.append(
+            any(
+                normalize_answer(a) in normalize_answer(doc["contents"])
+                for a in golden_answers
+            )
+        )
+    return hits
+
+
+def make_data(n_queries=50, n_docs=12, seed=0):
+    rng = random.Random(seed)
+    words = [
+        "crohn",
+        "colitis",
+        "the",
+        "IL-23",
+        "TNF",
+        "anti",
+        "ustekinumab",
+        "biopsy",
+        "an",
+        "gene",
+        "NOD2",
+        "fistula",
+    ]
+    retrieval_result = [
+        [{"contents": " ".join(rng.choices(words, k=8))} for _ in range(n_docs)]
+        for _ in range(n_queries)
+    ]
+    golden = [
+        [
+            " ".join(rng.choices(words, k=rng.randint(1, 2)))
+            for _ in range(rng.randint(1, 3))
+        ]
+        for _ in range(n_queries)
+    ]
+    return SimpleNamespace(
+        retrieval_result=retrieval_result,
+        golden_answers=golden,
+        choices=[[] for _ in range(n_queries)],
+    )
+
+
+def config(**settings):
+    return {"dataset_name": "test", "metric_setting": settings}
+
+
+def test_matcher_matches_substring_semantics():
+    matcher = MultiPatternMatcher(["il 23", "tnf"])
+    assert matcher.search("anti tnf therapy")
+    assert matcher.search("il 23 inhibitor")
+    assert not matcher.search("il 2 inhibitor")
+    assert MultiPatternMatcher(["", "x"]).search("anything")
+    assert not MultiPatternMatcher([]).search("anything")
+
+
+@pytest.mark.parametrize("topk", [1, 5, 10])
+def test_recall_and_precision_match_reference(topk):
+    data = make_data()
+    _, recall = Retrieval_Recall(config(retrieval_recall_topk=topk)).calculate_metric(
+        data
+    )
+    _, precision = Retrieval_Precision(
+        config(retrieval_recall_topk=topk)
+    ).calculate_metric(data)
+    for i, (docs, answers) in enumerate(
+        zip(data.retrieval_result, data.golden_answers)
+    ):
+        hits = reference_hits(docs, answers, topk)
+        assert recall[i] == int(any(hits))
+        assert precision[i] == pytest.approx(sum(hits) / len(hits))
+
+
+def test_topk_metric_reports_every_cutoff():
+    data = make_data()
+    scores, _ = Retrieval_TopK(config(retrieval_topk_list=[1, 5, 20])).calculate_metric(
+        data
+    )
+    single, _ = Retrieval_Recall(config(retrieval_recall_topk=5)).calculate_metric(data)
+    assert scores["retrieval_recall_top5"] == pytest.approx(
+        single["retrieval_recall_top5"]
+    )
+    assert scores["retrieval_recall_top1"] <= scores["retrieval_recall_top5"]
+    assert "retrieval_precision_top20" in scores
@@ -0,0 +1,197 @@
+import gc
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from app.index import flat_store
+from app.index.flat_store import FlatRetriever, FlatVectorStore
+from app.workflow import DocumentVectorizer
+from tests.fakes import FakeEmbedding
+
+
+def fill(store, embedding, texts):
+    ids = [f"c{i}" for i in range(len(texts))]
+    docs = [Document(page_content=t, metadata={"n": i}) for i, t in enumerate(texts)]
+    store.upsert(ids, docs, embedding.encode(texts)[0])
+    store.commit()
+    return ids
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_search_matches_brute_force(tmp_path, monkeypatch, dtype):
+    monkeypatch.setattr(flat_store, "SEARCH_BLOCK_ROWS", 7)
+    monkeypatch.setattr(flat_store, "CONVERT_TILE_ROWS", 3)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 8)).astype(np.float32)
+    store = FlatVectorStore(str(tmp_path), dtype=dtype)
+    store.upsert(
+        [f"c{i}" for i in range(50)],
+        [Document(page_content=str(i)) for i in range(50)],
+        vectors,
+    )
+    store.commit()
+
+    queries = rng.standard_normal((3, 8)).astype(np.float32)
+    rows, scores = store.search_vectors(queries, k=5)
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(queries @ unit.T), axis=1)[:, :5]
+    assert rows.tolist() == expected.tolist()
+    assert np.all(np.diff(scores, axis=1) <= 0)
+
+
+def test_persists_and_reopens_read_only(tmp_path):
+    embedding = FakeEmbedding()
+    store = FlatVectorStore(str(tmp_path), dtype="float16")
+    fill(store, embedding, ["alpha", "beta", "gamma"])
+
+    reader = FlatVectorStore(str(tmp_path), readonly=True)
+    assert len(reader) == 3
+    assert isinstance(reader.vectors(), np.memmap)
+    assert reader.vectors().dtype == np.float16
+    doc, score = reader.search(embedding.encode_queries("beta")[0], k=1)[0]
+    assert (doc.id, doc.page_content, doc.metadata) == ("c1", "beta", {"n": 1})
+    assert score == pytest.approx(1.0, abs=1e-2)
+    with pytest.raises(RuntimeError):
+        reader.delete(["c0"])
+
+
+def test_upsert_and_delete_write_a_new_generation(tmp_path):
+    embedding = FakeEmbedding()
+    store = FlatVectorStore(str(tmp_path))
+    fill(store, embedding, ["alpha", "beta", "gamma"])
+    first = store.generation
+
+    store.delete(["c0"])
+    store.upsert(
+        ["c1", "c3"],
+        [Document(page_content="beta v2"), Document(page_content="delta")],
+        embedding.encode(["beta v2", "delta"])[0],
+    )
+    assert len(store) == 3  # staged changes are not visible yet
+    store.commit()
+
+    assert store.generation != first
+    ids, docs = store.documents()
+    assert sorted(ids) == ["c1", "c2", "c3"]
+    assert {d.id: d.page_content for d in docs}["c1"] == "beta v2"
+    assert FlatVectorStore(str(tmp_path)).ids == store.ids
+
+
+def test_retriever(tmp_path):
+    embedding = FakeEmbedding()
+    store = FlatVectorStore(str(tmp_path))
+    fill(store, embedding, ["alpha", "beta", "gamma", "delta"])
+    retriever = FlatRetriever(store=store, embedding=embedding, k=2)
+
+    docs = retriever.invoke("gamma")
+    assert len(docs) == 2 and docs[0].page_content == "gamma"
+    batched = retriever.search_many(["alpha", "delta"])
+    assert [docs[0].page_content for docs in batched] == ["alpha", "delta"]
+
+
+def test_search_many_embeds_queries_in_query_mode(tmp_path):
+    class QueryModeEmbedding(FakeEmbedding):
+        # Queries are embedded as "query: <text>" like e.g. QWen's query mode
+        def encode_queries(self, text):
+            return self._vector(f"query: {text}"), 1
+
+        def encode_queries_batch(self, texts):
+            return np.stack([self.encode_queries(t)[0] for t in texts]), len(texts)
+
+    embedding = QueryModeEmbedding()
+    store = FlatVectorStore(str(tmp_path))
+    fill(store, embedding, ["alpha", "beta", "gamma", "delta"])
+    retriever = FlatRetriever(store=store, embedding=embedding, k=2)
+
+    batched = retriever.search_many(["alpha", "delta"])
+    assert [[d.id for d in docs] for docs in batched] == [
+        [d.id for d in retriever.invoke(q)] for q in ["alpha", "delta"]
+    ]
+
+
+def clustered_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((16, dim))
+    return (
+        centers[rng.integers(0, 16, n)] + 0.3 * rng.standard_normal((n, dim))
+    ).astype(np.float32)
+
+
+@pytest.mark.parametrize("quantization", ["int8", "pq"])
+def test_quantized_search_rescoring_recovers_recall(tmp_path, quantization):
+    vectors = clustered_vectors(600, 32)
+    store = FlatVectorStore(
+        str(tmp_path), quantization=quantization, pq_subspaces=8, rescore_factor=8
+    )
+    store.upsert(
+        [f"c{i}" for i in range(600)],
+        [Document(page_content=str(i)) for i in range(600)],
+        vectors,
+    )
+    store.commit()
+
+    assert store.code_nbytes * (4 if quantization == "int8" else 16) == store.nbytes
+    reader = FlatVectorStore(str(tmp_path), readonly=True)
+    assert reader.quantizer is not None
+
+    queries = clustered_vectors(40, 32, seed=1)
+    recall = reader.recall_at_k(queries, k=10)
+    assert recall["rescored"] >= recall["quantized"]
+    assert recall["rescored"] >= 0.9
+    _, scores = reader.search_vectors(queries, k=10)
+    _, exact = reader.search_vectors_exact(queries, k=10)
+    assert np.all(scores <= exact[:, :1] + 1e-5)
+
+
+@pytest.mark.parametrize("quantization", ["int8", "pq"])
+def test_quantized_scores_match_decoded_vectors(tmp_path, monkeypatch, quantization):
+    monkeypatch.setattr(flat_store, "SEARCH_BLOCK_ROWS", 7)
+    monkeypatch.setattr(flat_store, "CONVERT_TILE_ROWS", 3)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 8)).astype(np.float32)
+    store = FlatVectorStore(str(tmp_path), quantization=quantization, pq_subspaces=4)
+    store.upsert(
+        [f"c{i}" for i in range(50)],
+        [Document(page_content=str(i)) for i in range(50)],
+        vectors,
+    )
+    store.commit()
+
+    queries = rng.standard_normal((3, 8)).astype(np.float32)
+    rows, scores = store.search_vectors(queries, k=5, rescore=False)
+    unit = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    decoded = unit @ store.quantizer.decode(np.asarray(store._codes)).T
+    expected = np.take_along_axis(decoded, rows, axis=1)
+    assert scores == pytest.approx(expected, abs=1e-4)
+    assert np.sort(decoded, axis=1)[:, ::-1][:, :5] == pytest.approx(scores, abs=1e-4)
+
+
+def test_enabling_quantization_reencodes_existing_index(tmp_path):
+    embedding = FakeEmbedding()
+    fill(FlatVectorStore(str(tmp_path)), embedding, ["alpha", "beta", "gamma"])
+
+    store = FlatVectorStore(str(tmp_path), quantization="int8")
+    assert store.quantizer is None
+    store.commit()
+    assert store.quantizer is not None and len(store) == 3
+    assert store.search(embedding.encode_queries("beta")[0], k=1)[0][0].id == "c1"
+
+
+def test_flat_store_without_directory_cleans_up(
+    tmp_path, offline_splitter, monkeypatch
+):
+    monkeypatch.delenv("VECTOR_INDEX_DIR", raising=False)
+    source = tmp_path / "kb.txt"
+    source.write_text("some text")
+    vectorizer = DocumentVectorizer(
+        local_paths=[str(source)], embedding=FakeEmbedding(), vector_store="flat"
+    )
+    vectorizer.build()
+    directory = vectorizer.persist_directory
+    assert os.path.isdir(directory)
+
+    del vectorizer
+    gc.collect()
+    assert not os.path.exists(directory)
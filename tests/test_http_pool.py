@@ -0,0 +1,109 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.modals import http_pool
+from app.modals.embedding_model import LocalAIEmbed, OllamaEmbed, OpenAIEmbed
+from app.telemetry import registry
+
+
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    """OpenAI-style /v1/embeddings endpoint over keep-alive HTTP/1.1."""
+
+    protocol_version = "HTTP/1.1"
+    peers = set()
+
+    def do_POST(self):
+        self.peers.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"]
+        payload = json.dumps(
+            {
+                "object": "list",
+                "model": body["model"],
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": [1.0, 0.0]}
+                    for i in range(len(texts))
+                ],
+                "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)},
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    EmbeddingHandler.peers = set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), EmbeddingHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_backends_share_one_pool():
+    openai = OpenAIEmbed("sk-test", base_url="http://localhost:1/v1")
+    local = LocalAIEmbed("", "local", "http://localhost:2")
+    ollama = OllamaEmbed("", "nomic-embed-text", base_url="http://localhost:3")
+
+    assert openai.client._client is local.client._client is http_pool.sync_client()
+    assert openai.async_client._client is http_pool.async_client()
+    assert ollama.client._client._transport is http_pool.shared_transport()
+
+
+def test_connections_are_kept_alive(server):
+    model = OpenAIEmbed("sk-test", model_name="test", base_url=f"{server}/v1")
+    for i in range(5):
+        vectors, tokens = model.encode([f"text {i}", "other"])
+        assert vectors.shape == (2, 2) and tokens == 2
+
+    async def encode_async():
+        return await model.aencode(["a", "b", "c"])
+
+    for _ in range(2):  # a fresh event loop gets its own async pool
+        assert asyncio.run(encode_async())[0].shape == (3, 2)
+
+    # One connection for the sync calls, one per event loop
+    assert len(EmbeddingHandler.peers) == 3
+    stats = http_pool.pool_stats()
+    assert stats["sync"]["idle"] >= 1 and stats["sync"]["queued"] == 0
+    assert 'rag_http_pool_connections{client="sync",state="idle"}' in registry.render()
+
+
+def test_environment_proxies_apply_to_the_shared_clients(monkeypatch):
+    import httpcore
+    import httpx
+
+    for name in ("HTTP_POOL_PROXY", "HTTP_PROXY", "ALL_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.lower(), raising=False)
+    monkeypatch.setenv("HTTPS_PROXY", "http://proxy.internal:3128")
+    monkeypatch.setenv("NO_PROXY", "localhost")
+    pool = http_pool._Pool()
+    monkeypatch.setattr(http_pool, "_pool", pool)
+
+    client = http_pool.sync_client()
+    proxied = client._transport_for_url(httpx.URL("https://api.openai.com/v1"))
+    assert isinstance(proxied._pool, httpcore.HTTPProxy)
+    local = client._transport_for_url(httpx.URL("https://localhost:11434"))
+    assert local is http_pool.shared_transport()
+    assert (
+        http_pool.async_client()._transport_for_url(
+            httpx.URL("https://api.openai.com/v1")
+        )
+        in http_pool._pool.async_mounts().values()
+    )
+
+    monkeypatch.setenv("HTTP_POOL_PROXY", "http://pool.internal:3128")
+    pool.reset()
+    assert http_pool.shared_mounts() == {}
@@ -0,0 +1,75 @@
+from typing import List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.index.bm25 import BM25Index, tokenize
+from app.index.hybrid import HybridRetriever, reciprocal_rank_fusion
+
+CHUNKS = {
+    "c1": "Ustekinumab targets IL-23 and IL-12 in Crohn's disease.",
+    "c2": "Diet and the gut microbiome influence inflammation.",
+    "c3": "NOD2 variants raise the risk of ileal Crohn's disease.",
+    "c4": "Surgery is considered when strictures do not respond to therapy.",
+}
+
+
+def make_index():
+    ids = list(CHUNKS)
+    return BM25Index.from_documents(
+        ids, [Document(page_content=CHUNKS[i]) for i in ids]
+    )
+
+
+class StaticRetriever(BaseRetriever):
+    docs: List[Document]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.docs
+
+
+def test_tokenize_keeps_identifiers():
+    tokens = tokenize("IL-23 and NOD2")
+    assert "il-23" in tokens and "il" in tokens and "23" in tokens
+    assert "nod2" in tokens
+
+
+def test_bm25_finds_exact_terms():
+    index = make_index()
+    hits = index.search("NOD2 variants", k=2)
+    assert hits[0][0] == "c3"
+    assert index.search("il-23", k=1)[0][0] == "c1"
+    assert index.search("unrelated words", k=3) == []
+    assert len(index.search("crohn disease", k=10)) == 2
+
+
+def test_rrf_prefers_documents_ranked_by_both():
+    a, b, c = (Document(id=i, page_content=i) for i in "abc")
+    fused = reciprocal_rank_fusion([[a, b, c], [b, c]])
+    assert [d.id for d in fused] == ["b", "c", "a"]
+
+
+def test_hybrid_retriever_surfaces_sparse_matches():
+    dense = StaticRetriever(
+        docs=[
+            Document(id="c2", page_content=CHUNKS["c2"]),
+            Document(id="c4", page_content=CHUNKS["c4"]),
+        ]
+    )
+    retriever = HybridRetriever(dense=dense, sparse=make_index(), k=2, fetch_k=2)
+    # c3 is missed by the dense ranking but ties its top hit through BM25
+    assert [d.id for d in retriever.invoke("NOD2")] == ["c2", "c3"]
+
+
+def test_hybrid_retriever_fuses_dense_results_without_ids():
+    # The Chroma wrapper returns dense documents without their chunk id
+    dense = StaticRetriever(
+        docs=[Document(page_content=CHUNKS["c3"]), Document(page_content=CHUNKS["c2"])]
+    )
+    retriever = HybridRetriever(dense=dense, sparse=make_index(), k=3, fetch_k=3)
+    docs = retriever.invoke("NOD2 variants")
+    assert [d.page_content for d in docs].count(CHUNKS["c3"]) == 1
+    assert docs[0].id == "c3"
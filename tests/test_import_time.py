@@ -0,0 +1,76 @@
+import inspect
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Wall-clock budget for importing the API app in a fresh interpreter
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "5"))
+
+HEAVY_MODULES = [
+    "chromadb",
+    "dashscope",
+    "ollama",
+    "openai",
+    "langchain_community",
+    "langchain_openai",
+    "langchain_deepseek",
+]
+
+
+def run_python(code):
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def loaded_heavy_modules(statement):
+    return run_python(
+        f"import json, sys\n{statement}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "from app.modals import EmbeddingModel; list(EmbeddingModel)",
+        "import app.workflow",
+        "import app.api.app",
+    ],
+)
+def test_import_does_not_load_provider_sdks(statement):
+    assert loaded_heavy_modules(statement) == []
+
+
+def test_api_import_within_budget():
+    elapsed = run_python(
+        "import json, time\nstarted = time.perf_counter()\nimport app.api.app\n"
+        "print(json.dumps(time.perf_counter() - started))"
+    )
+    assert elapsed < IMPORT_BUDGET_SECONDS
+
+
+def test_lazy_registry_matches_backend_factory_names():
+    from app.modals import EmbeddingModel, embedding_model
+
+    declared = {}
+    for _, obj in inspect.getmembers(embedding_model, inspect.isclass):
+        if issubclass(obj, embedding_model.Base) and hasattr(obj, "_FACTORY_NAME"):
+            names = obj._FACTORY_NAME
+            for name in names if isinstance(names, list) else [names]:
+                declared[name] = obj
+    assert set(EmbeddingModel) == set(declared)
+    for name, cls in declared.items():
+        assert EmbeddingModel.get(name) is cls
+    assert EmbeddingModel.get("openai") is declared["OpenAI"]
+    assert EmbeddingModel.get("missing") is None
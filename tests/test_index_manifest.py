@@ -0,0 +1,41 @@
+from app.index import IndexManifest, chunk_ids
+
+
+def test_chunk_ids_are_content_addressed():
+    first = chunk_ids("a.md", ["intro", "body", "body"])
+    assert len(set(first)) == 3
+    # editing one chunk leaves the ids of the others untouched
+    second = chunk_ids("a.md", ["intro", "changed", "body"])
+    assert second[0] == first[0]
+    assert first[1] in second
+    assert chunk_ids("b.md", ["intro"])[0] != first[0]
+
+
+def test_diff_source_reports_added_and_removed():
+    manifest = IndexManifest()
+    manifest.set_source("a.md", "h1", ["x", "y"])
+    added, removed = manifest.diff_source("a.md", ["y", "z"])
+    assert added == ["z"]
+    assert removed == ["x"]
+    added, removed = manifest.diff_source("new.md", ["q"])
+    assert added == ["q"] and removed == []
+
+
+def test_save_and_load_round_trip(tmp_path):
+    manifest = IndexManifest(str(tmp_path), settings={"chunk_size": 500})
+    manifest.set_source("a.md", "h1", ["x", "y"])
+    manifest.save()
+
+    loaded = IndexManifest.load(str(tmp_path))
+    assert loaded.settings == {"chunk_size": 500}
+    assert loaded.source_hash("a.md") == "h1"
+    assert loaded.chunk_ids("a.md") == ["x", "y"]
+    assert loaded.fingerprint == manifest.fingerprint
+    assert loaded.remove_source("a.md") == ["x", "y"]
+    assert loaded.fingerprint != manifest.fingerprint
+
+
+def test_load_missing_directory_is_empty(tmp_path):
+    manifest = IndexManifest.load(str(tmp_path / "missing"))
+    assert manifest.sources == {}
+    assert IndexManifest.load(None).path is None
@@ -0,0 +1,226 @@
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from app.index import IndexManifest
+from app.index.pipeline import IngestionPipeline
+from app.workflow import DocumentVectorizer
+from tests.fakes import FakeEmbedding, RecordingEmbedding
+
+
+class LineSplitter:
+    def split_documents(self, docs):
+        return [
+            Document(page_content=line, metadata=doc.metadata)
+            for doc in docs
+            for line in doc.page_content.splitlines()
+        ]
+
+
+class MemorySink:
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, ids, documents, vectors):
+        for cid, vec in zip(ids, vectors):
+            self.vectors[cid] = vec
+
+    def delete(self, ids):
+        for cid in ids:
+            self.vectors.pop(cid, None)
+
+
+class AsyncEmbedding(RecordingEmbedding):
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self.peak = 0
+
+    def encode(self, texts):
+        pytest.fail("ingestion must use aencode")
+
+    async def aencode(self, texts):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return RecordingEmbedding.encode(self, texts)
+
+
+def loader(text, delay=0.0):
+    def load():
+        time.sleep(delay)
+        return [Document(page_content=text)]
+
+    return load
+
+
+def test_pipeline_embeds_only_changed_chunks():
+    manifest = IndexManifest()
+    sink = MemorySink()
+    embedding = RecordingEmbedding()
+    pipeline = IngestionPipeline(
+        LineSplitter(),
+        embedding,
+        sink,
+        manifest,
+        load_workers=3,
+        embed_batch_size=2,
+        queue_size=1,
+    )
+    stats = pipeline.run([("a", loader("a1\na2")), ("b", loader("b1\nb2\nb3"))])
+    assert stats.embedded == 5
+    assert len(sink.vectors) == 5
+    assert sorted(manifest.sources) == ["a", "b"]
+
+    embedding.calls.clear()
+    stats = pipeline.run([("a", loader("a1\na2")), ("b", loader("b1\nchanged\nb3"))])
+    assert stats.skipped == 1
+    assert stats.embedded == 1 and stats.removed == 1
+    assert embedding.calls == [("encode", ["changed"])]
+    assert len(sink.vectors) == 5
+
+
+def test_pipeline_loads_sources_concurrently():
+    # Every loader waits for the others, so loading one at a time breaks
+    # the barrier and fails the sources
+    barrier = threading.Barrier(4, timeout=5)
+
+    def waiting_loader(text):
+        def load():
+            barrier.wait()
+            return [Document(page_content=text)]
+
+        return load
+
+    manifest = IndexManifest()
+    pipeline = IngestionPipeline(
+        LineSplitter(), FakeEmbedding(), MemorySink(), manifest, load_workers=4
+    )
+    stats = pipeline.run([(str(i), waiting_loader(f"doc {i}")) for i in range(4)])
+    assert stats.failed == 0 and stats.embedded == 4
+
+
+def test_failed_source_keeps_previous_chunks():
+    manifest = IndexManifest()
+    sink = MemorySink()
+    pipeline = IngestionPipeline(LineSplitter(), FakeEmbedding(), sink, manifest)
+    pipeline.run([("a", loader("a1"))])
+
+    def broken():
+        raise IOError("offline")
+
+    stats = pipeline.run([("a", broken)])
+    assert stats.failed == 1
+    assert manifest.chunk_ids("a") and len(sink.vectors) == 1
+
+
+def test_stage_error_leaves_manifest_untouched():
+    class BrokenEmbedding:
+        def encode(self, texts):
+            raise RuntimeError("quota exceeded")
+
+    manifest = IndexManifest()
+    pipeline = IngestionPipeline(
+        LineSplitter(), BrokenEmbedding(), MemorySink(), manifest, queue_size=1
+    )
+    with pytest.raises(RuntimeError, match="quota"):
+        pipeline.run([(str(i), loader(f"x{i}\ny{i}")) for i in range(20)])
+    assert manifest.sources == {}
+    assert not [t for t in threading.enumerate() if t.name.startswith("ingest-")]
+
+
+def test_failed_embedding_keeps_stale_chunks():
+    class FailingOnChange(FakeEmbedding):
+        def encode(self, texts):
+            if "changed" in texts:
+                raise RuntimeError("quota exceeded")
+            return super().encode(texts)
+
+    manifest = IndexManifest()
+    sink = MemorySink()
+    pipeline = IngestionPipeline(LineSplitter(), FailingOnChange(), sink, manifest)
+    pipeline.run([("a", loader("a1\na2"))])
+    indexed = dict(sink.vectors)
+
+    with pytest.raises(RuntimeError, match="quota"):
+        pipeline.run([("a", loader("a1\nchanged"))])
+    assert sink.vectors.keys() == indexed.keys()
+    assert sorted(manifest.chunk_ids("a")) == sorted(indexed)
+
+
+def test_async_backend_embeds_batches_concurrently():
+    manifest = IndexManifest()
+    sink = MemorySink()
+    embedding = AsyncEmbedding()
+    pipeline = IngestionPipeline(
+        LineSplitter(),
+        embedding,
+        sink,
+        manifest,
+        embed_batch_size=2,
+        embed_concurrency=3,
+    )
+    text = "\n".join(f"line {i}" for i in range(20))
+    stats = pipeline.run([("a", loader(text))])
+    assert stats.embedded == 20 and len(sink.vectors) == 20
+    assert len(embedding.calls) == 10 and embedding.peak > 1
+    first = manifest.chunk_ids("a")[0]
+    np.testing.assert_array_equal(sink.vectors[first], embedding._vector("line 0"))
+
+
+def test_async_embed_error_stops_the_pipeline():
+    class BrokenAsyncEmbedding:
+        async def aencode(self, texts):
+            raise RuntimeError("quota exceeded")
+
+    manifest = IndexManifest()
+    pipeline = IngestionPipeline(
+        LineSplitter(),
+        BrokenAsyncEmbedding(),
+        MemorySink(),
+        manifest,
+        queue_size=1,
+        embed_batch_size=1,
+    )
+    with pytest.raises(RuntimeError, match="quota"):
+        pipeline.run([(str(i), loader(f"x{i}\ny{i}")) for i in range(20)])
+    assert manifest.sources == {}
+
+
+def test_deleted_source_loses_its_chunks():
+    manifest = IndexManifest()
+    sink = MemorySink()
+    pipeline = IngestionPipeline(LineSplitter(), FakeEmbedding(), sink, manifest)
+    pipeline.run([("a", loader("a1\na2")), ("b", loader("b1"))])
+
+    def deleted():
+        raise FileNotFoundError("a")
+
+    stats = pipeline.run([("a", deleted), ("b", loader("b1"))])
+    assert stats.removed == 2 and stats.failed == 0
+    assert list(manifest.sources) == ["b"] and len(sink.vectors) == 1
+
+
+def test_vectorizer_drops_deleted_local_files(tmp_path, offline_splitter):
+    kept, deleted = tmp_path / "kept.txt", tmp_path / "deleted.txt"
+    kept.write_text("kept text")
+    deleted.write_text("deleted text")
+    options = dict(
+        local_paths=[str(kept), str(deleted)],
+        persist_directory=str(tmp_path / "index"),
+        embedding=FakeEmbedding(),
+        vector_store="flat",
+    )
+    DocumentVectorizer(**options).build()
+
+    deleted.unlink()
+    vectorizer = DocumentVectorizer(**options)
+    retriever = vectorizer.build()
+    assert list(vectorizer.manifest.sources) == [os.path.normpath(kept)]
+    assert [d.page_content for d in retriever.invoke("text")] == ["kept text"]
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from ollama import EmbedResponse, ResponseError
+
+from app.modals.embedding_model import (
+    LocalAIEmbed,
+    OllamaEmbed,
+    num_tokens,
+    pack_batches,
+)
+
+
+class FakeOllamaClient:
+    """Batched /api/embed server counting three tokens per text."""
+
+    def __init__(self, legacy=False):
+        self.legacy = legacy
+        self.batches = []
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def embed(self, model, input, **kwargs):
+        if self.legacy:
+            raise ResponseError("404 page not found", status_code=404)
+        with self._lock:
+            self.batches.append(list(input))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self._lock:
+            self.active -= 1
+        return EmbedResponse(
+            embeddings=[[float(len(t)), 1.0] for t in input],
+            prompt_eval_count=3 * len(input),
+        )
+
+    def embeddings(self, model, prompt, **kwargs):
+        return {"embedding": [float(len(prompt)), 1.0]}
+
+
+def test_ollama_encodes_in_concurrent_batches():
+    model = OllamaEmbed("", "nomic-embed-text", batch_size=4, concurrency=3)
+    model.client = FakeOllamaClient()
+    texts = [f"text {'x' * i}<|endoftext|>" for i in range(10)]
+
+    vectors, tokens = model.encode(texts)
+    assert [len(b) for b in model.client.batches] == [4, 4, 2]
+    assert model.client.peak > 1
+    assert vectors[:, 0].tolist() == [len(f"text {'x' * i}") for i in range(10)]
+    assert tokens == 30
+    assert model.encode_queries("abc")[1] == 3
+
+
+def test_ollama_falls_back_to_legacy_endpoint():
+    model = OllamaEmbed("", "nomic-embed-text", batch_size=2, concurrency=1)
+    model.client = FakeOllamaClient(legacy=True)
+
+    vectors, tokens = model.encode(["ab", "abcd", "abc"])
+    assert vectors[:, 0].tolist() == [2, 4, 3]
+    assert tokens == sum(num_tokens(t) for t in ["ab", "abcd", "abc"])
+    assert model._legacy
+
+
+@pytest.mark.parametrize("usage, expected", [(42, 42), (0, None)])
+def test_localai_reports_server_or_local_token_counts(usage, expected):
+    texts = ["first text", "second, longer text"]
+
+    def create(input, model):
+        return SimpleNamespace(
+            data=[
+                SimpleNamespace(embedding=[1.0, 0.0], index=i)
+                for i in range(len(input))
+            ],
+            usage=SimpleNamespace(total_tokens=usage),
+        )
+
+    model = LocalAIEmbed("", "local-model", "http://localhost:8080")
+    model.client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+
+    _, tokens = model.encode(texts)
+    assert tokens == (expected or sum(num_tokens(t) for t in texts))
+
+
+def test_pack_batches_splits_at_token_budget_and_size():
+    texts = ["a" * n for n in (3, 4, 2, 1, 1, 1, 9, 2)]
+    batches = pack_batches(texts, max_tokens=8, max_items=3, count_tokens=len)
+    # 3+4 fits, +2 would not; 2+1+1 hits max_items; 9 is alone over budget
+    assert batches == [[0, 1], [2, 3, 4], [5], [6], [7]]
+
+
+def test_pack_batches_keeps_an_oversized_text_alone():
+    batches = pack_batches(["a" * 20, "b"], max_tokens=8, max_items=4, count_tokens=len)
+    assert batches == [[0], [1]]
+    assert pack_batches([], max_tokens=8, max_items=4) == []
+
+
+class FakeAsyncEmbeddings:
+    """
+    Async OpenAI-style embeddings endpoint: later batches finish first and
+    each response lists its vectors in reverse, with their `index`.
+    """
+
+    def __init__(self, drop=0):
+        self.drop = drop
+        self.batches = []
+
+    async def create(self, input, model):
+        self.batches.append(list(input))
+        await asyncio.sleep(0.05 / len(self.batches))
+        data = [
+            SimpleNamespace(embedding=[float(len(t)), 0.0], index=i)
+            for i, t in enumerate(input)
+        ][self.drop :]
+        return SimpleNamespace(
+            data=data[::-1], usage=SimpleNamespace(total_tokens=len(input))
+        )
+
+
+def local_model(embeddings):
+    model = LocalAIEmbed("", "local-model", "http://localhost:8080")
+    model.async_client = SimpleNamespace(embeddings=embeddings)
+    model.batch_token_budget = 8
+    model.max_batch_size = 3
+    return model
+
+
+def test_aencode_returns_vectors_in_input_order():
+    embeddings = FakeAsyncEmbeddings()
+    texts = ["x" * n for n in range(1, 12)]
+
+    vectors, tokens = asyncio.run(local_model(embeddings).aencode(texts))
+    assert len(embeddings.batches) > 1
+    assert vectors[:, 0].tolist() == [len(t) for t in texts]
+    assert tokens == len(texts)
+
+
+def test_aencode_rejects_a_short_batch():
+    with pytest.raises(RuntimeError, match="returned 2 vectors for 3 texts"):
+        asyncio.run(local_model(FakeAsyncEmbeddings(drop=1)).aencode(["a", "b", "c"]))
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.modals.query_batcher import BatchingEmbed
+
+
+class RecordingEmbedding:
+    """Query backend recording each batched call."""
+
+    model_name = "recording"
+
+    def __init__(self, latency: float = 0.02, fail: bool = False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def encode_queries_batch(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("backend down")
+        return np.array([[len(t), 1.0] for t in texts]), 10 * len(texts)
+
+    def encode_queries(self, text):
+        vectors, tokens = self.encode_queries_batch([text])
+        return vectors[0], tokens
+
+
+def test_concurrent_queries_are_coalesced():
+    backend = RecordingEmbedding()
+    batcher = BatchingEmbed(backend, max_wait_ms=20, max_batch_size=64, max_in_flight=1)
+    texts = [f"question {'x' * i}" for i in range(40)]
+    with ThreadPoolExecutor(40) as pool:
+        results = list(pool.map(batcher.encode_queries, texts))
+
+    for text, (vector, tokens) in zip(texts, results):
+        assert vector.tolist() == [len(text), 1.0]
+        assert tokens == 10
+    assert sum(len(call) for call in backend.calls) == 40
+    assert len(backend.calls) <= 4
+    assert batcher.batches == len(backend.calls)
+
+
+def test_batch_size_limit_and_duplicates():
+    backend = RecordingEmbedding(latency=0.05)
+    batcher = BatchingEmbed(backend, max_wait_ms=50, max_batch_size=3, max_in_flight=4)
+    futures = [batcher.submit(t) for t in ["a", "a", "b", "c", "d"]]
+    results = [f.result(timeout=5) for f in futures]
+
+    assert results[0][0].tolist() == results[1][0].tolist()
+    assert all(len(call) <= 3 for call in backend.calls)
+    assert ["a", "b"] in backend.calls  # the two "a" were embedded once
+
+
+def test_failure_reaches_every_waiting_caller():
+    batcher = BatchingEmbed(RecordingEmbedding(fail=True), max_wait_ms=20)
+    futures = [batcher.submit(t) for t in ["a", "b"]]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="backend down"):
+            future.result(timeout=5)
+
+
+def test_async_callers_and_document_passthrough():
+    class Backend(RecordingEmbedding):
+        def encode(self, texts):
+            return np.zeros((len(texts), 2)), 7
+
+    backend = Backend()
+    batcher = BatchingEmbed(backend, max_wait_ms=20)
+
+    async def ask():
+        return await asyncio.gather(*(batcher.aencode_queries(t) for t in "abcd"))
+
+    results = asyncio.run(ask())
+    assert [r[1] for r in results] == [10] * 4
+    assert len(backend.calls) == 1
+    assert batcher.encode(["doc"])[1] == 7
+    assert batcher.model_name == "recording"
+
+
+def test_close_answers_queued_questions_and_stops_the_threads():
+    backend = RecordingEmbedding(latency=0.05)
+    batcher = BatchingEmbed(backend, max_wait_ms=1, max_batch_size=2, max_in_flight=1)
+    futures = [batcher.submit(t) for t in ["a", "b", "c", "d", "e"]]
+    batcher.close()
+
+    assert [f.result(timeout=0)[0][0] for f in futures] == [1] * 5
+    assert not batcher._dispatcher.is_alive()
+    assert not any(t.is_alive() for t in batcher._executor._threads)
+    with pytest.raises(RuntimeError, match="closed"):
+        batcher.encode_queries("f")
@@ -0,0 +1,170 @@
+import asyncio
+
+import numpy as np
+
+from app.router import EmbeddingRouter
+
+TOPICS = ["crohn", "colitis", "weather", "football"]
+
+
+class TopicEmbedding:
+    """One axis per topic word, plus a little text-seeded noise."""
+
+    def _vector(self, text):
+        rng = np.random.default_rng(sum(map(ord, text)))
+        vector = 0.1 * rng.standard_normal(len(TOPICS) + 4)
+        for i, topic in enumerate(TOPICS):
+            if topic in text:
+                vector[i] += 1.0
+        return vector.astype(np.float32)
+
+    def encode(self, texts):
+        return np.stack([self._vector(t) for t in texts]), len(texts)
+
+    def encode_queries(self, text):
+        return self._vector(text), 1
+
+
+def corpus():
+    texts = [f"{topic} note {i}" for topic in ("crohn", "colitis") for i in range(40)]
+    return TopicEmbedding().encode(texts)[0]
+
+
+def test_centroids_route_clear_cases_and_defer_the_rest():
+    router = EmbeddingRouter(
+        TopicEmbedding(),
+        corpus_vectors=corpus,
+        clusters=4,
+        in_domain=0.8,
+        out_of_domain=0.3,
+    )
+    assert router.route("what helps crohn flares?")[0] == "vectorstore"
+    assert router.route("football results today")[0] == "web_search"
+    datasource, features = router.route("crohn and the weather")
+    assert datasource is None and len(features) == 4
+
+
+def test_default_router_defers_to_the_llm_until_trained():
+    router = EmbeddingRouter(
+        TopicEmbedding(), corpus_vectors=corpus, clusters=4, min_samples=20
+    )
+    # Even questions close to the corpus are left to the LLM at first
+    assert router.route("what helps crohn flares?")[0] is None
+    assert router.route("football results today")[0] is None
+
+    for i in range(10):
+        for text, datasource in (
+            (f"colitis question {i}", "vectorstore"),
+            (f"weather question {i}", "web_search"),
+        ):
+            router.record(router.route(text)[1], datasource)
+    assert router.model is not None
+    assert router.route("colitis again")[0] == "vectorstore"
+    assert router.route("weather again")[0] == "web_search"
+
+
+def test_one_sided_decisions_fit_a_centroid_threshold():
+    router = EmbeddingRouter(
+        TopicEmbedding(), corpus_vectors=corpus, clusters=4, min_samples=20
+    )
+    for i in range(20):
+        text = f"{'crohn' if i % 2 else 'colitis'} question {i}"
+        router.record(router.route(text)[1], "vectorstore")
+    assert router.model is None
+    # The median logged similarity routes the closer half locally
+    assert router.route("colitis question 10")[0] == "vectorstore"
+    assert router.route("football again")[0] is None
+
+
+def test_decision_log_is_bounded(tmp_path):
+    log_path = tmp_path / "decisions.jsonl"
+    options = dict(
+        corpus_vectors=corpus,
+        clusters=4,
+        min_samples=5,
+        max_decisions=10,
+        log_path=str(log_path),
+    )
+    router = EmbeddingRouter(TopicEmbedding(), **options)
+    for i in range(45):
+        router.record(router.route(f"crohn question {i}")[1], "vectorstore")
+    assert len(router._decisions) == 10
+    assert len(log_path.read_text().splitlines()) <= 20
+
+    reloaded = EmbeddingRouter(TopicEmbedding(), **options)
+    reloaded.fit()
+    assert len(reloaded._decisions) == 10
+
+
+def test_workflow_has_no_router_by_default(make_workflow):
+    assert make_workflow(router=None).router is None
+
+
+def test_workflow_default_router_asks_the_llm(make_workflow):
+    workflow = make_workflow(router=True)
+    result = asyncio.run(workflow.arun("what about crohn?"))
+    assert result["chains"]["question_router"]["calls"] == 1
+    assert [d for _, d in workflow.router._decisions] == ["vectorstore"]
+
+
+def test_exemplars_decide_by_margin():
+    router = EmbeddingRouter(
+        TopicEmbedding(),
+        exemplars={
+            "vectorstore": ["crohn diet", "colitis treatment"],
+            "web_search": ["weather tomorrow", "football scores"],
+        },
+    )
+    assert router.route("colitis symptoms")[0] == "vectorstore"
+    assert router.route("will the weather be nice")[0] == "web_search"
+
+
+def test_logistic_model_learns_from_logged_decisions(tmp_path):
+    log_path = str(tmp_path / "decisions.jsonl")
+    router = EmbeddingRouter(
+        TopicEmbedding(),
+        corpus_vectors=corpus,
+        clusters=4,
+        in_domain=2.0,
+        out_of_domain=-2.0,
+        min_samples=20,
+        log_path=log_path,
+    )
+    assert router.route("crohn question")[0] is None
+    for i in range(20):
+        for text, datasource in (
+            (f"crohn question {i}", "vectorstore"),
+            (f"football question {i}", "web_search"),
+        ):
+            router.record(router.route(text)[1], datasource)
+
+    assert router.model is not None
+    assert router.route("crohn again")[0] == "vectorstore"
+    assert router.route("football again")[0] == "web_search"
+
+    reloaded = EmbeddingRouter(
+        TopicEmbedding(),
+        corpus_vectors=corpus,
+        clusters=4,
+        in_domain=2.0,
+        out_of_domain=-2.0,
+        min_samples=20,
+        log_path=log_path,
+    )
+    assert reloaded.route("colitis again")[0] == "vectorstore"
+
+
+def test_workflow_skips_the_llm_router_when_confident(make_workflow):
+    router = EmbeddingRouter(
+        TopicEmbedding(),
+        exemplars={"vectorstore": ["crohn"], "web_search": ["weather"]},
+    )
+    workflow = make_workflow(router=router)
+
+    result = asyncio.run(workflow.arun("what about crohn?"))
+    assert result["generation"] == "answer"
+    assert "question_router" not in result["chains"]
+
+    result = asyncio.run(workflow.arun("anything new?"))
+    assert result["chains"]["question_router"]["calls"] == 1
+    assert len(router._decisions) == 1
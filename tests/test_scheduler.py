@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.modals.scheduler import (
+    ProviderError,
+    ProviderScheduler,
+    TokenBucket,
+    get_scheduler,
+    retry_after,
+)
+
+
+class Flaky:
+    """Fails with `error` on the first `failures` calls."""
+
+    def __init__(self, failures, error):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, value):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return value
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=60, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+
+
+def test_retries_throttled_requests_honouring_retry_after():
+    scheduler = ProviderScheduler("test", max_retries=3)
+    fn = Flaky(2, ProviderError("slow down", status_code=429, retry_after=0.05))
+
+    started = time.perf_counter()
+    assert scheduler.call(fn, "ok") == "ok"
+    assert fn.calls == 3
+    assert time.perf_counter() - started >= 0.1
+
+
+def test_does_not_retry_client_errors_or_beyond_budget():
+    scheduler = ProviderScheduler("test", max_retries=2, base_delay=0.001)
+    bad_request = Flaky(1, ProviderError("bad input", status_code=400))
+    with pytest.raises(ProviderError):
+        scheduler.call(bad_request, "x")
+    assert bad_request.calls == 1
+
+    down = Flaky(10, ProviderError("unavailable", status_code=503))
+    with pytest.raises(ProviderError):
+        scheduler.call(down, "x")
+    assert down.calls == 3
+
+
+def test_retry_after_header():
+    class Response:
+        headers = {"retry-after-ms": "250"}
+
+    error = RuntimeError("throttled")
+    error.response = Response()
+    assert retry_after(error) == pytest.approx(0.25)
+
+
+def test_max_in_flight_is_shared_by_all_callers():
+    scheduler = ProviderScheduler("test", max_in_flight=2)
+    peak, lock = [0], threading.Lock()
+
+    def request():
+        with lock:
+            peak[0] = max(peak[0], scheduler.in_flight)
+        time.sleep(0.02)
+
+    threads = [
+        threading.Thread(target=scheduler.call, args=(request,)) for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+    assert scheduler.in_flight == 0
+
+
+def test_async_calls_retry_and_limit():
+    scheduler = ProviderScheduler("test", max_in_flight=1, base_delay=0.001)
+    fn = Flaky(1, ProviderError("busy", status_code=500))
+
+    async def request(value):
+        return fn(value)
+
+    async def run():
+        return await asyncio.gather(*(scheduler.acall(request, i) for i in range(3)))
+
+    assert sorted(asyncio.run(run())) == [0, 1, 2]
+    assert fn.calls == 4
+
+
+def test_async_waiters_are_woken_in_order_without_polling(monkeypatch):
+    scheduler = ProviderScheduler("test", max_in_flight=1)
+    order = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            await release.wait()
+
+        async def request(i):
+            order.append(i)
+
+        holder = asyncio.ensure_future(scheduler.acall(hold))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(scheduler.acall(request, i)) for i in range(3)]
+        await asyncio.sleep(0)
+        # Waiting for the slot must not spin on the event loop
+        real_sleep = asyncio.sleep
+        monkeypatch.setattr(asyncio, "sleep", lambda *a: pytest.fail("polled"))
+        waiters[1].cancel()
+        release.set()
+        await holder
+        await asyncio.wait(waiters)
+        monkeypatch.setattr(asyncio, "sleep", real_sleep)
+
+    asyncio.run(run())
+    assert order == [0, 2]
+    assert scheduler.in_flight == 0 and not scheduler._waiters
+
+
+def test_slots_freed_by_threads_wake_coroutines():
+    scheduler = ProviderScheduler("test", max_in_flight=1)
+    entered, release = threading.Event(), threading.Event()
+
+    def hold():
+        entered.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=scheduler.call, args=(hold,))
+    thread.start()
+    entered.wait(5)
+
+    async def request():
+        return "done"
+
+    async def run():
+        task = asyncio.ensure_future(scheduler.acall(request))
+        await asyncio.sleep(0.01)
+        assert not task.done()
+        release.set()
+        return await task
+
+    assert asyncio.run(run()) == "done"
+    thread.join()
+    assert scheduler.in_flight == 0
+
+
+def test_limits_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_TONGYI_QIANWEN_RPM", "120")
+    monkeypatch.setenv("RATE_LIMIT_TONGYI_QIANWEN_MAX_RETRIES", "1")
+    scheduler = ProviderScheduler.from_env("Tongyi-Qianwen")
+    assert scheduler.requests is not None and scheduler.tokens is None
+    assert scheduler.max_retries == 1
+    assert get_scheduler("basic") is get_scheduler("BASIC")
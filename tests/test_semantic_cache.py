@@ -0,0 +1,69 @@
+import numpy as np
+
+from app.semantic_cache import SemanticCache
+
+
+class KeywordEmbedding:
+    """Questions sharing keywords get similar vectors."""
+
+    vocabulary = ["crohn", "colitis", "diet", "surgery", "drug"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_queries(self, text):
+        self.calls += 1
+        words = text.lower().replace("?", "").split()
+        return np.array([float(w in words) for w in self.vocabulary]) + 0.01, 1
+
+
+def test_paraphrase_hits_and_unrelated_question_misses():
+    cache = SemanticCache(KeywordEmbedding(), threshold=0.9)
+    entry, vector = cache.lookup("what diet helps crohn")
+    assert entry is None
+    cache.store("what diet helps crohn", "Eat well.", ["doc"], vector)
+
+    entry, _ = cache.lookup("which diet is good for crohn?")
+    assert entry is not None
+    assert entry.generation == "Eat well."
+    assert entry.documents == ["doc"]
+    assert entry.similarity >= 0.9
+    assert cache.lookup("when is surgery needed")[0] is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.semantic_cache.time.time", lambda: now[0])
+    cache = SemanticCache(KeywordEmbedding(), threshold=0.9, ttl=60)
+    cache.store("crohn diet", "answer", [])
+    now[0] += 30
+    assert cache.lookup("crohn diet")[0] is not None
+    now[0] += 31
+    assert cache.lookup("crohn diet")[0] is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("app.semantic_cache.time.time", lambda: now[0])
+    cache = SemanticCache(KeywordEmbedding(), threshold=0.99, max_entries=2)
+    for question in ("crohn", "colitis"):
+        now[0] += 1
+        cache.store(question, question.upper(), [])
+    now[0] += 1
+    assert cache.lookup("crohn")[0].generation == "CROHN"
+    now[0] += 1
+    cache.store("surgery", "SURGERY", [])
+    assert len(cache) == 2
+    assert cache.lookup("colitis")[0] is None
+    assert cache.lookup("crohn")[0] is not None
+
+
+def test_index_change_invalidates_cache():
+    version = ["v1"]
+    cache = SemanticCache(KeywordEmbedding(), index_version=lambda: version[0])
+    cache.store("crohn diet", "answer", [])
+    assert cache.lookup("crohn diet")[0] is not None
+    version[0] = "v2"
+    assert cache.lookup("crohn diet")[0] is None
+    assert len(cache) == 0
@@ -0,0 +1,110 @@
+import os
+import time
+
+import pytest
+from dotenv import dotenv_values
+from fastapi.testclient import TestClient
+
+import app.api.app as api
+from app.index.flat_store import FlatVectorStore
+from app.workflow import DocumentVectorizer
+from tests.fakes import FakeEmbedding
+
+
+def test_attach_opens_prebuilt_flat_index_read_only(tmp_path, offline_splitter):
+    source = tmp_path / "kb.txt"
+    source.write_text("\n\n".join(f"paragraph {i} about crohn" for i in range(20)))
+    index_dir = str(tmp_path / "index")
+    options = dict(
+        local_paths=[str(source)],
+        persist_directory=index_dir,
+        embedding=FakeEmbedding(),
+        vector_store="flat",
+        chunk_size=40,
+    )
+    DocumentVectorizer(**options).build()
+
+    vectorizer = DocumentVectorizer(**options)
+    vectorizer._sources = lambda: pytest.fail("attach must not load sources")
+    retriever = vectorizer.attach()
+    assert len(retriever.invoke("paragraph 3")) == 4
+    assert isinstance(retriever.store, FlatVectorStore) and retriever.store.readonly
+    assert vectorizer.index_version == vectorizer.manifest.fingerprint
+
+
+def test_attach_requires_a_matching_index(tmp_path, offline_splitter):
+    options = dict(
+        persist_directory=str(tmp_path), embedding=FakeEmbedding(), vector_store="flat"
+    )
+    with pytest.raises(RuntimeError, match="build it first"):
+        DocumentVectorizer(**options).attach()
+
+    source = tmp_path / "kb.txt"
+    source.write_text("some text")
+    DocumentVectorizer(local_paths=[str(source)], **options).build()
+    with pytest.raises(RuntimeError, match="other settings"):
+        DocumentVectorizer(chunk_size=100, **options).attach()
+
+
+class FakeWorkflow:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.warmed = False
+
+    def warm_up(self, ping_llm=False):
+        time.sleep(0.05)
+        self.warmed = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_ready_after_warm_up(monkeypatch):
+    monkeypatch.setattr(api, "RAGWorkflow", FakeWorkflow)
+    monkeypatch.setattr(api, "RAG_WARMUP", True)
+    monkeypatch.setattr(api, "RAG_ATTACH_INDEX", True)
+    monkeypatch.setattr(api, "_workflow", None)
+    monkeypatch.setattr(api, "_readiness", {"status": "starting"})
+
+    with TestClient(api.app) as client:
+        assert client.get("/health").json() == {"status": "ok"}
+        for _ in range(100):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            assert response.json()["status"] == "starting"
+            time.sleep(0.01)
+        assert response.status_code == 200
+        assert api._workflow.warmed and api._workflow.kwargs["attach_index"] is True
+
+
+def test_ready_without_warm_up_needs_no_request(monkeypatch):
+    monkeypatch.setattr(api, "RAGWorkflow", FakeWorkflow)
+    monkeypatch.setattr(api, "RAG_WARMUP", False)
+    monkeypatch.setattr(api, "_workflow", None)
+    monkeypatch.setattr(api, "_readiness", {"status": "starting"})
+
+    with TestClient(api.app) as client:
+        for _ in range(100):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.01)
+        assert response.status_code == 200
+        assert api._workflow is not None and not api._workflow.warmed
+
+
+def test_production_mode_requires_the_flat_store(monkeypatch, tmp_path):
+    pytest.importorskip("uvicorn")
+    import server
+
+    monkeypatch.setenv("VECTOR_INDEX_DIR", str(tmp_path))
+    monkeypatch.setenv("VECTOR_STORE", "chroma")
+    monkeypatch.setattr(server, "build_index", lambda: pytest.fail("must not build"))
+    with pytest.raises(SystemExit, match="flat"):
+        server.main(["--production"])
+
+
+def test_example_env_passes_the_production_store_check():
+    example = os.path.join(os.path.dirname(__file__), os.pardir, ".env.example")
+    assert dotenv_values(example).get("VECTOR_STORE", "flat") == "flat"
@@ -0,0 +1,82 @@
+import json
+import logging
+from uuid import uuid4
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from app.telemetry import (
+    MetricsRegistry,
+    NODE_DURATION,
+    current_trace,
+    trace_request,
+    traced_node,
+)
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    calls = registry.counter("demo_calls_total", "Demo calls.")
+    latency = registry.histogram("demo_seconds", "Demo latency.", buckets=(0.1, 1.0))
+    calls.inc(chain='say "hi"')
+    latency.observe(0.5, node="generate")
+
+    text = registry.render()
+    assert "# TYPE demo_calls_total counter" in text
+    assert 'demo_calls_total{chain="say \\"hi\\""} 1.0' in text
+    assert 'demo_seconds_bucket{node="generate",le="0.1"} 0' in text
+    assert 'demo_seconds_bucket{node="generate",le="1.0"} 1' in text
+    assert 'demo_seconds_bucket{node="generate",le="+Inf"} 1' in text
+    assert 'demo_seconds_count{node="generate"} 1' in text
+    assert registry.counter("demo_calls_total", "again") is calls
+
+
+def test_trace_records_nodes_llm_calls_and_loops(caplog):
+    @traced_node("transform_query")
+    def rewrite():
+        return "q2"
+
+    before = NODE_DURATION.count(node="transform_query")
+    with caplog.at_level(logging.INFO, logger="app.telemetry"):
+        with trace_request("q") as trace:
+            assert current_trace() is trace
+            rewrite()
+            rewrite()
+            chain_run, llm_run = uuid4(), uuid4()
+            trace.callback.on_chain_start(
+                {}, {}, run_id=chain_run, name="answer_grader"
+            )
+            trace.callback.on_chat_model_start(
+                {}, [], run_id=llm_run, parent_run_id=chain_run
+            )
+            message = AIMessage(
+                content="yes",
+                usage_metadata={
+                    "input_tokens": 12,
+                    "output_tokens": 3,
+                    "total_tokens": 15,
+                },
+            )
+            trace.callback.on_llm_end(
+                LLMResult(generations=[[ChatGeneration(message=message)]]),
+                run_id=llm_run,
+            )
+            trace.callback.on_chain_end({}, run_id=chain_run)
+    assert current_trace() is None
+
+    summary = trace.as_dict()
+    assert NODE_DURATION.count(node="transform_query") == before + 2
+    assert summary["loop_iterations"] == {"rewrite": 2, "regenerate": 0}
+    assert summary["llm_calls"] == 1
+    assert summary["chains"]["answer_grader"]["tokens"] == 15
+    logged = [json.loads(r.getMessage()) for r in caplog.records]
+    assert logged[-1]["event"] == "rag_request"
+    assert logged[-1]["status"] == "ok"
+
+
+def test_trace_marks_errors():
+    with pytest.raises(RuntimeError):
+        with trace_request("q") as trace:
+            raise RuntimeError("boom")
+    assert trace.duration is not None
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.tools import tool
+
+from app.tools.web_search import (
+    CachedSearch,
+    SearchResultCache,
+    StubSearch,
+    asearch_many,
+    merge_results,
+    normalize_query,
+    search_many,
+)
+
+DOCUMENTS = {
+    "https://ibd.example/crohn": "crohn disease diet and treatment",
+    "https://ibd.example/colitis": "ulcerative colitis treatment options",
+    "https://news.example/weather": "weather forecast for tomorrow",
+}
+
+
+def test_normalized_queries_share_an_entry():
+    stub = StubSearch(DOCUMENTS)
+    search = CachedSearch(stub, cache=SearchResultCache())
+
+    first = search.invoke({"query": "Crohn treatment?"})
+    again = search.invoke({"query": "  crohn   TREATMENT "})
+    assert first == again and first[0]["url"] == "https://ibd.example/crohn"
+    assert stub.calls == ["Crohn treatment?"]
+    assert asyncio.run(search.ainvoke({"query": "crohn treatment"})) == first
+    assert len(stub.calls) == 1
+
+
+def test_entries_expire_and_the_memory_tier_is_bounded(monkeypatch):
+    cache = SearchResultCache(ttl=10, max_entries=2)
+    for i in range(3):
+        cache.put(str(i), [{"content": str(i)}])
+    assert cache.get("0") is None and len(cache) == 2
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("2") is None
+
+
+def test_disk_tier_survives_restarts_but_not_errors(tmp_path):
+    cache = SearchResultCache(directory=str(tmp_path))
+    cache.put("ok", [{"url": "u", "content": "c"}])
+    cache.put("failed", "HTTPError('429 Too Many Requests')")
+
+    reopened = SearchResultCache(directory=str(tmp_path))
+    assert reopened.get("ok") == [{"url": "u", "content": "c"}]
+    assert reopened.get("failed") is None
+
+
+def test_query_variants_run_concurrently_and_merge():
+    # Both distinct variants must be searching at once to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    class WaitingSearch(StubSearch):
+        def invoke(self, payload, *args, **kwargs):
+            barrier.wait()
+            return super().invoke(payload)
+
+    stub = WaitingSearch(DOCUMENTS)
+    variants = ["crohn diet", "colitis treatment", "Crohn diet?"]
+
+    merged = search_many(stub, variants)
+    assert sorted(stub.calls) == ["colitis treatment", "crohn diet"]
+    urls = [r["url"] for r in merged]
+    assert urls[:2] == ["https://ibd.example/crohn", "https://ibd.example/colitis"]
+    assert len(urls) == len(set(urls))
+
+    merged = asyncio.run(asearch_many(stub, variants, max_results=1))
+    assert [r["url"] for r in merged] == ["https://ibd.example/crohn"]
+
+
+def test_failed_variants_are_skipped():
+    class Flaky(StubSearch):
+        def invoke(self, payload, *args, **kwargs):
+            if "weather" in payload["query"]:
+                raise RuntimeError("timeout")
+            return super().invoke(payload)
+
+    assert search_many(Flaky(DOCUMENTS), ["weather", "crohn"])[0]["url"].endswith(
+        "crohn"
+    )
+    with pytest.raises(RuntimeError, match="timeout"):
+        search_many(Flaky(DOCUMENTS), ["weather"])
+
+
+def test_merge_dedupes_by_url_then_content():
+    a = [{"url": "https://x/", "content": "one"}, {"content": "Same text."}]
+    b = [{"url": "https://X", "content": "other"}, {"content": "same text"}]
+    assert merge_results([a, b]) == [a[0], a[1]]
+    assert normalize_query("  Hello\tWorld?! ") == "hello world"
+
+
+def test_cached_search_wraps_langchain_tools_and_skips_errors():
+    outcomes = [
+        "HTTPError('429 Too Many Requests')",
+        [{"url": "https://ibd.example/crohn", "content": "crohn"}],
+    ]
+
+    @tool
+    def flaky_search(query: str):
+        """Search the web."""
+        return outcomes.pop(0)
+
+    search = CachedSearch(flaky_search, cache=SearchResultCache())
+    assert search.invoke({"query": "crohn"}).startswith("HTTPError")
+    results = search.invoke({"query": "crohn"})
+    assert results[0]["content"] == "crohn"
+    assert asyncio.run(search.ainvoke({"query": "Crohn?"})) == results
+    assert outcomes == []